@@ -0,0 +1,123 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Optional
+
+from cachetools import TLRUCache
+
+from api.common import CacheStats
+from api.metrics import CACHE_REQUESTS
+
+logger = logging.getLogger(__name__)
+
+
+class _CountingCache(TLRUCache):
+
+    def __init__(self, maxsize: int):
+        # entries are (value, expires_at) tuples, so entries loaded from disk keep their original expiry
+        super().__init__(maxsize=maxsize, ttu=lambda _, entry, now: entry[1], timer=time.time)
+        self.evictions = 0
+
+    def popitem(self):
+        item = super().popitem()
+        self.evictions += 1
+        return item
+
+
+# sqlite file shared by all workers on a host, survives restarts
+class SqliteCacheStore:
+
+    def __init__(self, path: str):
+        os.makedirs(Path(path).parent.absolute(), exist_ok=True)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=5, check_same_thread=False, isolation_level=None)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)')
+        self.conn.execute('DELETE FROM cache WHERE expires_at <= ?', (time.time(),))
+
+    def get(self, key: str) -> Optional[tuple[Any, float]]:
+        with self.lock:
+            row = self.conn.execute(
+                'SELECT value, expires_at FROM cache WHERE key = ? AND expires_at > ?', (key, time.time())
+            ).fetchone()
+        return (json.loads(row[0]), row[1]) if row else None
+
+    def set(self, key: str, value: Any, expires_at: float):
+        with self.lock:
+            self.conn.execute(
+                'INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)',
+                (key, json.dumps(value, ensure_ascii=False), expires_at)
+            )
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+class TmdbCache:
+
+    def __init__(self, namespace: str, maxsize: int, ttl: int, disk: Optional[SqliteCacheStore] = None):
+        self.namespace = namespace
+        self.ttl = ttl
+        self.memory = _CountingCache(maxsize)
+        self.disk = disk
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    # memory only and not counted as a request, for callers that just want to skip work
+    def __contains__(self, key) -> bool:
+        return key in self.memory
+
+    async def get(self, key) -> Optional[Any]:
+        entry = self.memory.get(key)
+        if entry is not None:
+            self.hits += 1
+            CACHE_REQUESTS.labels(self.namespace, 'hit').inc()
+            return entry[0]
+
+        if self.disk:
+            try:
+                entry = await asyncio.to_thread(self.disk.get, f'{self.namespace}:{key}')
+            except sqlite3.Error as e:
+                logger.warning('could not read %s cache entry %s from disk: %s', self.namespace, key, e)
+            if entry is not None:
+                self.hits += 1
+                self.disk_hits += 1
+                CACHE_REQUESTS.labels(self.namespace, 'disk_hit').inc()
+                self.memory[key] = entry
+                return entry[0]
+
+        self.misses += 1
+        CACHE_REQUESTS.labels(self.namespace, 'miss').inc()
+        return None
+
+    async def set(self, key, value: Any):
+        expires_at = time.time() + self.ttl
+        self.memory[key] = (value, expires_at)
+
+        if self.disk:
+            try:
+                await asyncio.to_thread(self.disk.set, f'{self.namespace}:{key}', value, expires_at)
+            except sqlite3.Error as e:
+                logger.warning('could not write %s cache entry %s to disk: %s', self.namespace, key, e)
+
+    def stats(self) -> CacheStats:
+        requests = self.hits + self.misses
+        self.memory.expire()
+        return CacheStats(
+            size=len(self.memory),
+            maxsize=self.memory.maxsize,
+            ttl=self.ttl,
+            persistent=self.disk is not None,
+            hits=self.hits,
+            disk_hits=self.disk_hits,
+            misses=self.misses,
+            evictions=self.memory.evictions,
+            hit_rate=self.hits / requests if requests else 0.0
+        )
@@ -0,0 +1,99 @@
+import asyncio
+import logging
+import random
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+
+from api.tmdb import TmdbClient
+
+logger = logging.getLogger(__name__)
+
+
+# in-memory copy of the discover pages used for quiz movie selection, crawled with the
+# catalog's minimum vote filters and refreshed in the background. stricter quiz filters
+# are applied locally, so picking a movie needs no TMDB round trip.
+class MovieCatalog:
+
+    def __init__(
+        self,
+        tmdb_client: TmdbClient,
+        page_ranges: Dict[int, Tuple[int, int]],
+        vote_avg_min: float,
+        vote_count_min: float,
+        refresh_interval: float,
+        concurrency: int
+    ):
+        self.tmdb_client = tmdb_client
+        self.page_ranges = page_ranges
+        self.vote_avg_min = vote_avg_min
+        self.vote_count_min = vote_count_min
+        self.refresh_interval = refresh_interval
+        self.concurrency = concurrency
+        self.pages: Dict[int, List[dict]] = {}
+        self.movies: Dict[int, List[dict]] = {}
+        self.refreshed_at: Optional[datetime] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            # noinspection PyBroadException
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.warning('error while refreshing movie catalog: %s', e)
+            await asyncio.sleep(self.refresh_interval)
+
+    async def refresh(self):
+        semaphore = asyncio.Semaphore(self.concurrency)
+        pages = sorted({page for page_min, page_max in self.page_ranges.values() for page in range(page_min, page_max + 1)})
+
+        async def fetch(page: int) -> Tuple[int, Optional[List[dict]]]:
+            async with semaphore:
+                try:
+                    return page, await self.tmdb_client.get_movies(page, self.vote_avg_min, self.vote_count_min)
+                except httpx.HTTPError as e:
+                    logger.warning('could not fetch discover page %s for movie catalog: %s', page, e)
+                    return page, None
+
+        # pages that failed keep their previous content until the next refresh
+        for page, movies in await asyncio.gather(*(fetch(page) for page in pages)):
+            if movies is not None:
+                self.pages[page] = movies
+
+        self.movies = {
+            popularity: [movie for page in range(page_min, page_max + 1) for movie in self.pages.get(page, [])]
+            for popularity, (page_min, page_max) in self.page_ranges.items()
+        }
+        self.refreshed_at = datetime.now()
+        logger.info('movie catalog refreshed: %s', {popularity: len(movies) for popularity, movies in self.movies.items()})
+
+    def covers(self, vote_avg_min: float, vote_count_min: float) -> bool:
+        return vote_avg_min >= self.vote_avg_min and vote_count_min >= self.vote_count_min
+
+    # None if the catalog cannot answer: not loaded yet, filters looser than the crawl or no match
+    def sample(self, popularity: int, vote_avg_min: float, vote_count_min: float) -> Optional[dict]:
+        if not self.covers(vote_avg_min, vote_count_min):
+            return None
+
+        candidates = [
+            movie for movie in self.movies.get(popularity, [])
+            if movie['vote_average'] >= vote_avg_min and movie['vote_count'] >= vote_count_min
+        ]
+        if not candidates:
+            return None
+
+        return random.choice(candidates)
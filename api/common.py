@@ -1,5 +1,9 @@
-from pydantic import BaseModel, ConfigDict
+from dataclasses import dataclass
+from pydantic import BaseModel, Field
 from datetime import datetime
+from typing import List, Optional
+
+from api.config import QuizConfig
 
 class BaseQuestion(BaseModel):
     question: str
@@ -12,17 +16,25 @@ class BaseAnswer(BaseModel):
     answer: str
     
     
-class SessionData(BaseModel):
-    model_config = ConfigDict(arbitrary_types_allowed=True)
+# kept small on purpose: the movie is resolved from the tmdb details cache when needed
+@dataclass(slots=True)
+class SessionData:
     quiz_id: str
-    # chat: ChatSession
+    movie_id: int
     question: BaseQuestion
-    movie: dict
     started_at: datetime
+    # quiz config, so answers can be attributed in the stats
+    popularity: int = 1
+    personality: str = 'DEFAULT'
+    language: str = 'DEFAULT'
+
+
+# movie titles are short, longer answers only cost grading time and prompt tokens
+MAX_ANSWER_LENGTH = 200
 
 
 class UserAnswer(BaseModel):
-    answer: str
+    answer: str = Field(max_length=MAX_ANSWER_LENGTH)
 
 
 class StartQuizResponse(BaseModel):
@@ -42,7 +54,7 @@ class FinishQuizResponse(BaseModel):
 class SessionResponse(BaseModel):
     quiz_id: str
     question: BaseQuestion
-    movie: dict
+    movie_id: int
     started_at: datetime
 
 
@@ -52,11 +64,131 @@ class LimitResponse(BaseModel):
     last_reset_time: datetime
     last_reset_date: datetime
     current_date: datetime
+    burst: int
+    per_minute: float
+
+
+class Distribution(BaseModel):
+    count: int = 0
+    total: float = 0.0
+    # upper bound -> number of observations in that bucket, not cumulative
+    buckets: dict[str, int] = {}
+
+
+class StatsGroup(BaseModel):
+    quiz_count: int = 0
+    answer_count: int = 0
+    points_total: int = 0
+    points: dict[str, int] = {}
+    quiz_latency: Distribution = Distribution()
+    answer_latency: Distribution = Distribution()
 
 
 class Stats(BaseModel):
     quiz_count_total: int = 0
     points_total: int = 0
+    by_personality: dict[str, StatsGroup] = {}
+    by_language: dict[str, StatsGroup] = {}
+    by_popularity: dict[str, StatsGroup] = {}
+    # counts and latencies of the llm calls served by each provider
+    by_provider: dict[str, StatsGroup] = {}
+
+
+class CatalogResponse(BaseModel):
+    enabled: bool
+    movie_count: dict[int, int]
+    refreshed_at: datetime | None
+
+
+class StoreResponse(BaseModel):
+    enabled: bool
+    offline: bool
+    movie_count: int
+    loaded_at: datetime | None
+    updated_at: datetime | None
+    updated: int
+
+
+class QuestionPoolResponse(BaseModel):
+    enabled: bool
+    depth: dict[str, int]
+    hits: int
+    misses: int
+    hit_rate: float
+    generated: int
+    expired: int
+    failures: int
+
+
+class ProviderStats(BaseModel):
+    name: str
+    max_concurrency: int
+    in_flight: int
+    waiting: int
+    requests: int
+    queue_wait_avg: float
+    queue_wait_max: float
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    parse_successes: int = 0
+    parse_failures: int = 0
+    parse_success_rate: float = 1.0
+    early_stops: int = 0
+    state: str = 'closed'
+    latency_ewma: float = 0.0
+    error_rate: float = 0.0
+    successes: int = 0
+    failures: int = 0
+
+
+class RetryStats(BaseModel):
+    # keyed by '<stage>:<cause>', e.g. 'llm_question:ValueError' or 'tmdb:http_429'
+    retries: dict[str, int]
+    exhausted: int
+
+
+class CacheStats(BaseModel):
+    size: int
+    maxsize: int
+    ttl: int
+    persistent: bool
+    hits: int
+    disk_hits: int
+    misses: int
+    evictions: int
+    hit_rate: float
+    # cache misses that joined an identical request in flight
+    coalesced: int = 0
+
+
+class CacheResponse(BaseModel):
+    details: CacheStats
+    discover: CacheStats
+    # details fetched in the background for other movies of a discover page
+    prefetched: int = 0
+
+
+class RoomScore(BaseModel):
+    player: str
+    points: int
+
+
+class RoomResult(BaseModel):
+    player: str
+    answer: str
+    result: BaseAnswer
+
+
+class RoomResponse(BaseModel):
+    room_id: str
+    config: QuizConfig
+    round_seconds: float
+    round: int
+    players: List[str]
+    # only set while the round accepts answers
+    question: Optional[BaseQuestion] = None
+    deadline: Optional[datetime] = None
+    scoreboard: List[RoomScore]
 
 
 class StatsResponse(BaseModel):
@@ -1,9 +1,17 @@
-import httpx
+import logging
+import os
+import time
+from pathlib import Path
+
 from pydantic import BaseModel, Field
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 from api.prompt import Personality, Language
 
+logger = logging.getLogger(__name__)
+
+TMDB_BASE_URL = 'https://api.themoviedb.org/3'
+
 GENERATION_CONFIG = {
     'temperature': 0.5
 }
@@ -17,6 +25,16 @@ class QuizConfig(BaseModel):
     language: str = Language.DEFAULT.name
 
 
+class BatchQuizRequest(BaseModel):
+    config: QuizConfig = QuizConfig()
+    count: int = Field(5, ge=1, le=10)
+
+
+class RoomRequest(BaseModel):
+    config: QuizConfig = QuizConfig()
+    round_seconds: float = Field(30.0, ge=5.0, le=300.0)
+
+
 class TmdbImagesConfig(BaseModel):
     base_url: str
     secure_base_url: str
@@ -27,26 +45,136 @@ class TmdbImagesConfig(BaseModel):
     still_sizes: list[str]
 
 
+# values of the live /configuration endpoint, used until the first refresh succeeds
+DEFAULT_TMDB_IMAGES_CONFIG = TmdbImagesConfig(
+    base_url='http://image.tmdb.org/t/p/',
+    secure_base_url='https://image.tmdb.org/t/p/',
+    backdrop_sizes=['w300', 'w780', 'w1280', 'original'],
+    logo_sizes=['w45', 'w92', 'w154', 'w185', 'w300', 'w500', 'original'],
+    poster_sizes=['w92', 'w154', 'w185', 'w342', 'w500', 'w780', 'original'],
+    profile_sizes=['w45', 'w185', 'h632', 'original'],
+    still_sizes=['w92', 'w185', 'w300', 'original']
+)
+
+
 class Settings(BaseSettings):
     model_config = SettingsConfigDict(env_file='.env', env_file_encoding='utf-8')
     tmdb_api_key: str
+    # only changed to point the app at a local stand-in, e.g. for benchmarks
+    tmdb_base_url: str = TMDB_BASE_URL
+    tmdb_images_config_path: str = '/tmp/movie-detectives/tmdb-images-config.json'
+    tmdb_images_config_refresh_interval: float = 24 * 60 * 60
     groq_api_key: str
+    stats_dir: str = '/tmp/movie-detectives/stats'
+    # stats file of older versions, imported into stats_dir once on startup
     stats_path: str = '/tmp/movie-detectives/stats.pkl'
+    stats_snapshot_interval: float = 30.0
+    # must be well above the snapshot interval, shards older than this belong to stopped workers
+    stats_stale_after: float = 600.0
     gcp_gemini_model: str = 'gemini-1.0-pro'
     groq_model_name: str = 'llama3-70b-8192'
     gcp_project_id: str
     gcp_location: str
     gcp_service_account_file: str
     quiz_rate_limit: int = 5000
+    rate_limit_backend: str = 'memory'
+    rate_limit_burst: int = 10
+    rate_limit_per_minute: float = 6.0
+    rate_limit_maxsize: int = 10000
+    rate_limit_trust_forwarded: bool = False
+    api_keys: list[str] = []
     quiz_max_retries: int = 10
+    retry_max_attempts: int = 3
+    retry_base_delay: float = 0.2
+    retry_max_delay: float = 2.0
     ollama_base_url: str = 'http://localhost:11434'
     qwen_model_name: str = 'qwen-long'
     qwen_api_key: str
+    session_backend: str = 'memory'
+    session_maxsize: int = 10000
+    session_ttl: int = 600
+    redis_url: str = 'redis://localhost:6379/0'
+    # token estimate of one movie's metadata in the question prompt, long overviews are trimmed to fit
+    prompt_metadata_token_budget: int = 300
+    answer_local_grading: bool = True
+    answer_hit_threshold: float = 0.85
+    answer_miss_threshold: float = 0.25
+    answer_llm_feedback: bool = False
+    llm_providers: list[str] = ['qwen']
+    llm_failure_threshold: int = 3
+    llm_circuit_open_seconds: float = 30.0
+    llm_ewma_alpha: float = 0.3
+    # providers asked for json output on non-streaming calls, the others reply with the line template
+    llm_structured_output: list[str] = ['groq', 'ollama', 'azure']
+    qwen_max_concurrency: int = 8
+    groq_max_concurrency: int = 8
+    ollama_max_concurrency: int = 2
+    azure_max_concurrency: int = 8
+    gemini_max_concurrency: int = 8
+    tmdb_http2: bool = True
+    tmdb_timeout: float = 10.0
+    tmdb_connect_timeout: float = 5.0
+    tmdb_max_connections: int = 100
+    tmdb_max_keepalive_connections: int = 20
+    tmdb_keepalive_expiry: float = 30.0
+    tmdb_details_cache_maxsize: int = 4096
+    tmdb_details_cache_ttl: int = 24 * 60 * 60
+    tmdb_discover_cache_maxsize: int = 1024
+    tmdb_discover_cache_ttl: int = 60 * 60
+    tmdb_cache_path: str | None = None
+    # fetch details of the other movies on a discover page in the background
+    tmdb_prefetch_details: bool = False
+    tmdb_prefetch_concurrency: int = 4
+    # json / jsonl files shaped like movie.json or discover pages, a file or a directory of them.
+    # discover queries are answered from it, replacing the catalog crawl
+    tmdb_snapshot_path: str | None = None
+    # serve everything from the snapshot, TMDB is never called
+    tmdb_offline: bool = False
+    tmdb_snapshot_update_interval: int = 24 * 60 * 60
+    tmdb_snapshot_update_concurrency: int = 4
+    catalog_enabled: bool = True
+    catalog_refresh_interval: int = 6 * 60 * 60
+    catalog_concurrency: int = 4
+    catalog_vote_avg_min: float = 5.0
+    catalog_vote_count_min: float = 1000.0
+    question_pool_enabled: bool = True
+    question_pool_target_depth: int = 3
+    question_pool_concurrency: int = 2
+    question_pool_max_age: int = 30 * 60
+    question_pool_bucket_idle: int = 60 * 60
+    question_pool_refill_interval: float = 5.0
+    # questions generated per llm call when refilling the pool, 1 disables batching
+    question_pool_batch_size: int = 5
+    room_maxsize: int = 1000
+    room_ttl: int = 2 * 60 * 60
+    room_max_players: int = 500
+    room_send_timeout: float = 5.0
 
 
+# no network access at startup: the config cached on disk, or the built-in default.
+# TmdbClient.refresh_images_config keeps the cache up to date in the background
 def load_tmdb_images_config(settings: Settings) -> TmdbImagesConfig:
-    response = httpx.get('https://api.themoviedb.org/3/configuration', headers={
-        'Authorization': f'Bearer {settings.tmdb_api_key}'
-    })
+    path = Path(settings.tmdb_images_config_path)
+    try:
+        return TmdbImagesConfig.model_validate_json(path.read_text(encoding='utf-8'))
+    except FileNotFoundError:
+        return DEFAULT_TMDB_IMAGES_CONFIG
+    except (OSError, ValueError) as e:
+        logger.warning('could not read cached tmdb images config %s: %s', path, e)
+        return DEFAULT_TMDB_IMAGES_CONFIG
+
+
+def save_tmdb_images_config(settings: Settings, images_config: TmdbImagesConfig):
+    path = Path(settings.tmdb_images_config_path)
+    os.makedirs(path.parent.absolute(), exist_ok=True)
+
+    tmp_path = path.with_name(f'.{path.name}.tmp')
+    tmp_path.write_text(images_config.model_dump_json(), encoding='utf-8')
+    os.replace(tmp_path, path)
+
 
-    return TmdbImagesConfig(**response.json()['images'])
+def tmdb_images_config_age(settings: Settings) -> float:
+    try:
+        return time.time() - os.path.getmtime(settings.tmdb_images_config_path)
+    except OSError:
+        return float('inf')
@@ -1,26 +1,39 @@
+import asyncio
 import logging
-import os
-import pickle
+import math
+import re
+import time
 import uuid
-from contextlib import asynccontextmanager
+from contextlib import aclosing, asynccontextmanager
 from datetime import datetime
 from functools import lru_cache
 from functools import wraps
-from pathlib import Path
-from time import sleep
 
-from cachetools import TTLCache
-from fastapi import FastAPI
+import httpx
+from anyio import to_thread
+from fastapi import Depends, FastAPI, Query, Request, WebSocket, WebSocketDisconnect
 from fastapi import HTTPException, status
 from fastapi.middleware.cors import CORSMiddleware
-from google.api_core.exceptions import GoogleAPIError
-
-
-from .config import Settings, TmdbImagesConfig, load_tmdb_images_config, QuizConfig
-from .models.qwen import qwenClient
+from fastapi.responses import Response, StreamingResponse
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+
+
+from .catalog import MovieCatalog
+from .config import Settings, TmdbImagesConfig, load_tmdb_images_config, save_tmdb_images_config, tmdb_images_config_age, BatchQuizRequest, QuizConfig, RoomRequest
+from . import metrics
+from .matcher import MatchResult, TitleMatcher, candidate_titles, normalize_title
+from .models.router import ProviderRouter, create_router, served_by
+from .pool import QuestionPool
+from .ratelimit import RateLimiter, create_rate_limiter
+from .rooms import RoomError, RoomManager
+from .retry import Retrier, RetryBudget, is_parse_error, retry_budget
+from .sessions import SessionStore, create_session_store
+from .stats import StatsStore
+from .store import MovieStore, MovieStoreUpdater
 from .prompt import PromptGenerator, get_personality_by_name, get_language_by_name
-from .tmdb import TmdbClient
-from .common import FinishQuizResponse, LimitResponse, SessionData, SessionResponse, StartQuizResponse, Stats, StatsResponse, UserAnswer
+from .streaming import ANSWER_FIELDS, QUESTION_FIELDS, StreamingFieldParser, sse_event
+from .tmdb import TmdbClient, create_caches, create_http_client, genre_names
+from .common import MAX_ANSWER_LENGTH, BaseAnswer, BaseQuestion, CacheResponse, CatalogResponse, StoreResponse, FinishQuizResponse, LimitResponse, SessionData, SessionResponse, ProviderStats, QuestionPoolResponse, RetryStats, RoomResponse, StartQuizResponse, StatsResponse, UserAnswer
 
 logger: logging.Logger = logging.getLogger(__name__)
 
@@ -37,45 +50,100 @@ def _get_tmdb_images_config() -> TmdbImagesConfig:
 
 settings: Settings = _get_settings()
 
-tmdb_client: TmdbClient = TmdbClient(settings.tmdb_api_key, _get_tmdb_images_config())
+retrier: Retrier = Retrier(settings.retry_max_attempts, settings.retry_base_delay, settings.retry_max_delay)
+
+# filled from TMDB_SNAPSHOT_PATH on startup
+movie_store: MovieStore = MovieStore()
+
+tmdb_client: TmdbClient = TmdbClient(
+    settings.tmdb_api_key,
+    _get_tmdb_images_config(),
+    create_http_client(settings),
+    *create_caches(settings),
+    retrier=retrier,
+    prefetch_details=settings.tmdb_prefetch_details,
+    prefetch_concurrency=settings.tmdb_prefetch_concurrency,
+    store=movie_store,
+    offline=settings.tmdb_offline
+)
 
-chat_client:qwenClient = qwenClient(
-    settings.qwen_model_name,
-    settings.qwen_api_key
+movie_store_updater: MovieStoreUpdater = MovieStoreUpdater(
+    movie_store,
+    tmdb_client,
+    interval=settings.tmdb_snapshot_update_interval,
+    concurrency=settings.tmdb_snapshot_update_concurrency,
+    path=settings.tmdb_snapshot_path
 )
-# chat_client: Llama3Client = Llama3Client(
-#     settings.ollama_base_url
-# )
 
-# chat_client: QroqClient = QroqClient(
-#     settings.groq_model_name,
-#     settings.groq_api_key,
-# )
+# providers are configured via LLM_PROVIDERS, e.g. '["qwen", "groq", "ollama"]'
+chat_client: ProviderRouter = create_router(settings)
 
-# chat_client: AzureClient = AzureClient()
 
+prompt_generator: PromptGenerator = PromptGenerator(settings.prompt_metadata_token_budget)
 
-prompt_generator: PromptGenerator = PromptGenerator()
+title_matcher: TitleMatcher = TitleMatcher(settings.answer_hit_threshold, settings.answer_miss_threshold)
 
 
-stats = Stats()
+# per-worker shards, snapshotted periodically and merged on read
+stats_store: StatsStore = StatsStore(
+    settings.stats_dir, settings.stats_snapshot_interval, settings.stats_stale_after, settings.stats_path
+)
+
+
+async def _refresh_tmdb_images_config():
+    # a fresh cache from a previous run is used as is until it is due
+    await asyncio.sleep(max(0.0, settings.tmdb_images_config_refresh_interval - tmdb_images_config_age(settings)))
+    while True:
+        try:
+            images_config = await tmdb_client.refresh_images_config()
+            await asyncio.to_thread(save_tmdb_images_config, settings, images_config)
+        except (httpx.HTTPError, KeyError, ValueError, OSError) as e:
+            logger.warning('could not refresh tmdb images config: %s', e)
+        await asyncio.sleep(settings.tmdb_images_config_refresh_interval)
 
 
 @asynccontextmanager
 async def lifespan(_: FastAPI):
-    global stats
-    path = Path(settings.stats_path)
-
-    # load stats on startup
-    if path.exists():
-        with open(settings.stats_path, 'rb') as f:
-            stats = pickle.load(f)
+    stats_store.start()
+    if settings.tmdb_snapshot_path:
+        try:
+            await asyncio.to_thread(movie_store.load, settings.tmdb_snapshot_path)
+        except (OSError, ValueError, KeyError) as e:
+            # offline there is nothing to serve without the snapshot
+            if settings.tmdb_offline:
+                raise
+            logger.warning('could not load tmdb snapshot %s: %s', settings.tmdb_snapshot_path, e)
+
+    # both run in the background, the app serves requests right away
+    background_tasks = [asyncio.create_task(chat_client.preload())]
+    if not settings.tmdb_offline:
+        background_tasks.append(asyncio.create_task(_refresh_tmdb_images_config()))
+        if len(movie_store):
+            movie_store_updater.start()
+        # the snapshot answers discover queries, there is nothing to crawl
+        elif settings.catalog_enabled:
+            movie_catalog.start()
+    if settings.question_pool_enabled:
+        question_pool.warm(QuizConfig())
+        question_pool.start()
     yield
 
-    # persist stats on shutdown
-    os.makedirs(path.parent.absolute(), exist_ok=True)
-    with path.open('wb') as f:
-        pickle.dump(stats, f)
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+
+    await room_manager.close()
+    await question_pool.stop()
+    await movie_catalog.stop()
+    await movie_store_updater.stop()
+
+    await session_store.close()
+    await rate_limiter.close()
+
+    # close pooled tmdb connections
+    await tmdb_client.aclose()
+
+    await stats_store.stop()
 
 
 app: FastAPI = FastAPI(lifespan=lifespan)
@@ -97,8 +165,8 @@ app.add_middleware(
     allow_headers=['*'],
 )
 
-# cache for quiz session, ttl = max session duration in seconds
-session_cache: TTLCache = TTLCache(maxsize=100, ttl=600)
+# store for quiz sessions, ttl = max session duration in seconds
+session_store: SessionStore = create_session_store(settings)
 
 
 def _get_page_min(popularity: int) -> int:
@@ -117,231 +185,744 @@ def _get_page_max(popularity: int) -> int:
     }.get(popularity, 3)
 
 
-call_count: int = 0
-last_reset_time: datetime = datetime.now()
+movie_catalog: MovieCatalog = MovieCatalog(
+    tmdb_client,
+    page_ranges={popularity: (_get_page_min(popularity), _get_page_max(popularity)) for popularity in (1, 2, 3)},
+    vote_avg_min=settings.catalog_vote_avg_min,
+    vote_count_min=settings.catalog_vote_count_min,
+    refresh_interval=settings.catalog_refresh_interval,
+    concurrency=settings.catalog_concurrency
+)
 
 
-def rate_limit(func: callable) -> callable:
-    @wraps(func)
-    def wrapper(*args, **kwargs) -> callable:
-        global call_count
-        global last_reset_time
+async def _pick_movie(quiz_config: QuizConfig):
+    # prefer the local catalog, fall back to a live discover request
+    catalog_movie = movie_catalog.sample(quiz_config.popularity, quiz_config.vote_avg_min, quiz_config.vote_count_min)
+    if catalog_movie:
+        return await tmdb_client.get_movie_details(catalog_movie['id'])
 
-        # reset call count if the day has changed
-        if datetime.now().date() > last_reset_time.date():
-            call_count = 0
-            last_reset_time = datetime.now()
+    return await tmdb_client.get_random_movie(
+        page_min=_get_page_min(quiz_config.popularity),
+        page_max=_get_page_max(quiz_config.popularity),
+        vote_avg_min=quiz_config.vote_avg_min,
+        vote_count_min=quiz_config.vote_count_min
+    )
 
-        if call_count >= settings.quiz_rate_limit:
-            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='Daily limit reached')
 
-        call_count += 1
-        return func(*args, **kwargs)
+# per-client token buckets plus the global daily cap, shared across workers with the redis backend
+rate_limiter: RateLimiter = create_rate_limiter(settings)
 
-    return wrapper
 
+def _client_key(request: Request) -> str:
+    # only known api keys get their own bucket, otherwise rotating keys would bypass the limit
+    api_key = request.headers.get('X-API-Key')
+    if api_key and api_key in settings.api_keys:
+        return f'key:{api_key}'
+
+    if settings.rate_limit_trust_forwarded and request.headers.get('X-Forwarded-For'):
+        return f'ip:{request.headers["X-Forwarded-For"].split(",")[0].strip()}'
+
+    return f'ip:{request.client.host if request.client else "unknown"}'
 
-def retry(max_retries: int) -> callable:
-    def decorator(func) -> callable:
-        @wraps(func)
-        def wrapper(*args, **kwargs):
-            for _ in range(max_retries):
-                try:
-                    return func(*args, **kwargs)
-                except ValueError as e:
-                    logger.error(f'Error in {func.__name__}: {e}')
-                    if _ < max_retries - 1:
-                        logger.warning(f'Retrying {func.__name__}...')
-                        sleep(1)
-                    else:
-                        raise e
 
-        return wrapper
+async def _check_rate_limit(request: Request, quizzes: int):
+    # one token per request, but every quiz of a batch counts against the daily cap
+    result = await rate_limiter.acquire(_client_key(request))
+    if not result.allowed:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail='Too many requests',
+            headers={'Retry-After': str(math.ceil(result.retry_after))}
+        )
+
+    if not await rate_limiter.acquire_daily(quizzes):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='Daily limit reached')
 
-    return decorator
+
+async def rate_limit(request: Request):
+    await _check_rate_limit(request, 1)
+
+
+def retry_budgeted(func: callable) -> callable:
+    # all retries of one request, across tmdb and llm stages, share a single budget
+    @wraps(func)
+    async def wrapper(*args, **kwargs):
+        retry_budget.set(RetryBudget(settings.quiz_max_retries))
+        return await func(*args, **kwargs)
+
+    return wrapper
 
 @app.get("/api")
 def read_root():
     return {"Hello": "World"}
 
 @app.get('/api/movies')
-def get_movies(page: int = 1, vote_avg_min: float = 5.0, vote_count_min: float = 1000.0):
-    return tmdb_client.get_movies(page, vote_avg_min, vote_count_min)
+async def get_movies(page: int = 1, vote_avg_min: float = 5.0, vote_count_min: float = 1000.0):
+    return await tmdb_client.get_movies(page, vote_avg_min, vote_count_min)
 
 
 @app.get('/api/movies/random')
-def get_random_movie(page_min: int = 1, page_max: int = 3, vote_avg_min: float = 5.0, vote_count_min: float = 1000.0):
-    return tmdb_client.get_random_movie(page_min, page_max, vote_avg_min, vote_count_min)
+async def get_random_movie(page_min: int = 1, page_max: int = 3, vote_avg_min: float = 5.0, vote_count_min: float = 1000.0):
+    return await tmdb_client.get_random_movie(page_min, page_max, vote_avg_min, vote_count_min)
 
 
 @app.get('/api/sessions')
-def get_sessions():
+async def get_sessions():
     return [SessionResponse(
         quiz_id=session.quiz_id,
         question=session.question,
-        movie=session.movie,
+        movie_id=session.movie_id,
         started_at=session.started_at
-    ) for session in session_cache.values()]
+    ) for session in await session_store.values()]
 
 
 @app.get('/api/limit')
-def get_limit():
+async def get_limit():
+    # the daily count resets at midnight
+    last_reset_time = datetime.combine(datetime.now().date(), datetime.min.time())
     return LimitResponse(
         daily_limit=settings.quiz_rate_limit,
-        quiz_count=call_count,
+        quiz_count=await rate_limiter.daily_count(),
         last_reset_time=last_reset_time,
         last_reset_date=last_reset_time.date(),
-        current_date=datetime.now().date()
+        current_date=datetime.now().date(),
+        burst=settings.rate_limit_burst,
+        per_minute=settings.rate_limit_per_minute
+    )
+
+
+@app.get('/api/catalog')
+def get_catalog():
+    return CatalogResponse(
+        enabled=settings.catalog_enabled,
+        movie_count={popularity: len(movies) for popularity, movies in movie_catalog.movies.items()},
+        refreshed_at=movie_catalog.refreshed_at
+    )
+
+
+@app.get('/api/store')
+def get_store():
+    return StoreResponse(
+        enabled=bool(settings.tmdb_snapshot_path),
+        offline=settings.tmdb_offline,
+        movie_count=len(movie_store),
+        loaded_at=movie_store.loaded_at,
+        updated_at=movie_store.updated_at,
+        updated=movie_store_updater.updated
     )
 
 
+@app.get('/api/cache')
+def get_cache():
+    return CacheResponse(
+        details=tmdb_client.details_cache.stats().model_copy(update={'coalesced': tmdb_client.details_flight.coalesced}),
+        discover=tmdb_client.discover_cache.stats().model_copy(update={'coalesced': tmdb_client.discover_flight.coalesced}),
+        prefetched=tmdb_client.prefetched
+    )
+
+
+@app.get('/api/pool')
+def get_pool():
+    return QuestionPoolResponse(
+        enabled=settings.question_pool_enabled,
+        depth={'/'.join(map(str, key)): depth for key, depth in question_pool.depth().items()},
+        hits=question_pool.hits,
+        misses=question_pool.misses,
+        hit_rate=question_pool.hit_rate(),
+        generated=question_pool.generated,
+        expired=question_pool.expired,
+        failures=question_pool.failures
+    )
+
+
+@app.get('/api/providers')
+def get_providers() -> list[ProviderStats]:
+    return chat_client.stats()
+
+
+@app.get('/api/retries')
+def get_retries() -> RetryStats:
+    return retrier.stats()
+
+
+@app.get('/api/metrics')
+async def get_metrics():
+    # gauges are sampled at scrape time
+    metrics.ACTIVE_SESSIONS.set(await session_store.size())
+
+    limiter = to_thread.current_default_thread_limiter()
+    metrics.THREADPOOL_IN_USE.set(limiter.borrowed_tokens)
+    metrics.THREADPOOL_SIZE.set(limiter.total_tokens)
+
+    for provider in chat_client.stats():
+        metrics.PROVIDER_IN_FLIGHT.labels(provider.name).set(provider.in_flight)
+        metrics.PROVIDER_WAITING.labels(provider.name).set(provider.waiting)
+    metrics.POOL_DEPTH.set(sum(question_pool.depth().values()))
+
+    return Response(generate_latest(metrics.REGISTRY), media_type=CONTENT_TYPE_LATEST)
+
+
 @app.get('/api/stats')
-def get_stats():
+async def get_stats():
     return StatsResponse(
-        stats=stats,
-        limit=get_limit()
+        stats=await asyncio.to_thread(stats_store.load),
+        limit=await get_limit()
     )
 
 
-@app.post('/api/quiz')
-@rate_limit
-@retry(max_retries=settings.quiz_max_retries)
-def start_quiz(quiz_config: QuizConfig = QuizConfig()):
-    movie = tmdb_client.get_random_movie(
-        page_min=_get_page_min(quiz_config.popularity),
-        page_max=_get_page_max(quiz_config.popularity),
-        vote_avg_min=quiz_config.vote_avg_min,
-        vote_count_min=quiz_config.vote_count_min
-    )
+QUESTION_INSTRUCTION = """
+    您的回复只能包含三行!您只能严格使用以下三行模板进行回复:
+    问题: <您的问题>
+    提示1: <对参与者有帮助的第一个提示>
+    提示2: <更轻松获得称号的第二个提示>
+"""
+# one numbered block per movie, in the order of the prompt
+QUESTION_BATCH_INSTRUCTION = """
+    您需要为 {count} 部电影分别出题! 每部电影的回复以 "### <编号>" 开头, 编号与电影的编号一致。
+    每个编号下只能包含三行, 严格使用以下模板:
+    ### <编号>
+    问题: <您的问题>
+    提示1: <对参与者有帮助的第一个提示>
+    提示2: <更轻松获得称号的第二个提示>
+"""
+# QUESTION_INSTRUCTION = """
+#     Your reply must only consist of three lines! You must only reply strictly using the following template for the three lines:
+#     Question: <Your question>
+#     Hint 1: <The first hint to help the participants>
+#     Hint 2: <The second hint to get the title more easily>
+# """
+
+ANSWER_INSTRUCTION = """
+    参与者获得多少积分由您决定。根据这个定义，他们得到 0、1、2 或 3 分:
+
+    0: 无分，与原标题相差甚远
+    1-2: 足够接近，取决于你的决定
+    3: 最好的结果，标题准确，小拼写错误没关系
+
+    友善点，如果靠近的话就好了。以有趣且友善的方式回答。
+
+    您的回复只能包含两行！您只能严格使用以下两行模板进行回复:
+    分数: <0-3>
+    答案: <您对参与者的回答>
+"""
+# rooms grade all answers of a round in one call, one numbered block per answer
+ANSWER_BATCH_INSTRUCTION = """
+    每位参与者获得多少积分由您决定。根据这个定义，他们得到 0、1、2 或 3 分:
+
+    0: 无分，与原标题相差甚远
+    1-2: 足够接近，取决于你的决定
+    3: 最好的结果，标题准确，小拼写错误没关系
+
+    友善点，如果靠近的话就好了。以有趣且友善的方式回答。
+
+    请按编号分别评判每个回答! 每个回答的回复以 "### <编号>" 开头, 编号与回答的编号一致。
+    每个编号下只能包含两行, 严格使用以下模板:
+    ### <编号>
+    分数: <0-3>
+    答案: <您对参与者的回答>
+"""
+# ANSWER_INSTRUCTION = """
+#     It is your decision how many points the participants get. They get 0, 1, 2 or 3 points based on this definition:
+#
+#     0: no points, to far away from original title
+#     1-2: close enough, depends on your decision
+#     3: best result, got exact title, small spelling mistakes are ok
+#
+#     Be nice, if it is close, it is fine. Answer in a funny and nice way.
+#
+#     Your reply must only consist of two lines! You must only reply strictly using the following template for the two lines:
+#     Points: <0-3>
+#     Answer: <your answer to the participants>
+# """
+
+
+async def _pick_quiz_movie(quiz_config: QuizConfig) -> dict:
+    movie = await _pick_movie(quiz_config)
 
     if not movie:
         logger.info('could not find movie with quiz config: %s', quiz_config.dict())
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='No movie found with given criteria')
 
-    try:
-        genres = [genre['name'] for genre in movie['genres']]
+    return movie
+
+
+async def _pick_quiz_movies(quiz_config: QuizConfig, count: int) -> list[dict]:
+    movies = {}
+    # random picks can collide, a few extra rounds fill the gaps
+    for _ in range(3):
+        picked = await asyncio.gather(*(_pick_quiz_movie(quiz_config) for _ in range(count - len(movies))))
+        movies.update((movie['id'], movie) for movie in picked)
+        if len(movies) == count:
+            break
+    return list(movies.values())
+
+
+# snapshot records may be discover results without the details fields, they get TMDB's own blanks
+def _question_metadata(movie: dict) -> dict:
+    return dict(
+        tagline=movie.get('tagline') or '',
+        overview=movie.get('overview') or '',
+        genres=', '.join(genre_names(movie)),
+        budget=movie.get('budget') or 0,
+        revenue=movie.get('revenue') or 0,
+        average_rating=movie.get('vote_average') or 0.0,
+        rating_count=movie.get('vote_count') or 0,
+        release_date=movie.get('release_date') or '',
+        runtime=movie.get('runtime') or 0
+    )
+
 
+def _generate_question_prompt(quiz_config: QuizConfig, movie: dict) -> str:
+    with metrics.observe('prompt_render'):
         prompt = prompt_generator.generate_question_prompt(
             movie_title=movie['title'],
             language=get_language_by_name(quiz_config.language),
             personality=get_personality_by_name(quiz_config.personality),
-            tagline=movie['tagline'],
-            overview=movie['overview'],
-            genres=', '.join(genres),
-            budget=movie['budget'],
-            revenue=movie['revenue'],
-            average_rating=movie['vote_average'],
-            rating_count=movie['vote_count'],
-            release_date=movie['release_date'],
-            runtime=movie['runtime']
+            **_question_metadata(movie)
         )
-        
-        logger.warning('generated prompt: %s', prompt)
-        
-        question = """
-            您的回复只能包含三行!您只能严格使用以下三行模板进行回复:
-            问题: <您的问题>
-            提示1: <对参与者有帮助的第一个提示>
-            提示2: <更轻松获得称号的第二个提示>
-        """
-        # question = """
-        #     Your reply must only consist of three lines! You must only reply strictly using the following template for the three lines:
-        #     Question: <Your question>
-        #     Hint 1: <The first hint to help the participants>
-        #     Hint 2: <The second hint to get the title more easily>
-            
-        # """
-        
-        chat = chat_client.start_chat()
-        
-        
-        chat_reply = chat_client.get_chat_response(chat,prompt,question)
-        
-        logger.warning('chat_reply: %s', chat_reply)
-        
-
-        logger.debug('starting quiz with generated prompt: %s', prompt)
-        llama3_question = chat_client.parse_chat_question(chat_reply)
-
-        quiz_id = str(uuid.uuid4())
-        session_cache[quiz_id] = SessionData(
-            quiz_id=quiz_id,
-            question=llama3_question,
-            movie=movie,
-            started_at=datetime.now()
+
+    logger.debug('starting quiz with generated prompt: %s', prompt)
+    return prompt
+
+
+def _generate_question_batch_prompt(quiz_config: QuizConfig, movies: list[dict]) -> str:
+    with metrics.observe('prompt_render'):
+        prompt = prompt_generator.generate_question_batch_prompt(
+            [dict(title=movie['title'], **_question_metadata(movie)) for movie in movies],
+            language=get_language_by_name(quiz_config.language),
+            personality=get_personality_by_name(quiz_config.personality)
         )
 
-        stats.quiz_count_total += 1
-        return StartQuizResponse(quiz_id=quiz_id, question=llama3_question, movie=movie)
-    except GoogleAPIError as e:
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f'Google API error: {e}')
-    except BaseException as e:
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f'Internal server error: {e}')
+    logger.debug('starting %d quizzes with generated prompt: %s', len(movies), prompt)
+    return prompt
 
 
-@app.post('/api/quiz/{quiz_id}/answer')
-@retry(max_retries=settings.quiz_max_retries)
-def finish_quiz(quiz_id: str, user_answer: UserAnswer):
-    session_data = session_cache.get(quiz_id)
-    
+def _leaks_title(question: BaseQuestion, movie: dict) -> bool:
+    # the second hint may show part of the title, the full title gives the answer away
+    title = normalize_title(movie['title'])
+    text = normalize_title(question.question + question.hint1 + question.hint2)
+    return len(title) > 1 and title in text
+
+
+def _record_llm_call(kind: str, started: float):
+    stats_store.record_provider(served_by.get(), kind, time.perf_counter() - started)
+
+
+async def _generate_question(quiz_config: QuizConfig) -> tuple[BaseQuestion, dict]:
+    movie = await _pick_quiz_movie(quiz_config)
+    prompt = _generate_question_prompt(quiz_config, movie)
+
+    # a reply in the wrong format is asked again for the same movie
+    async def ask() -> BaseQuestion:
+        started = time.perf_counter()
+        chat_reply = await chat_client.ainvoke(prompt, QUESTION_INSTRUCTION, BaseQuestion)
+        _record_llm_call('question', started)
+        logger.debug('chat_reply: %s', chat_reply)
+        question = chat_client.parse_reply(chat_reply, BaseQuestion)
+        if _leaks_title(question, movie):
+            metrics.PARSE_FAILURES.labels('question').inc()
+            raise ValueError('question gives the title away')
+        return question
+
+    return await retrier.run('llm_question', ask, is_parse_error), movie
+
+
+async def _generate_questions(quiz_config: QuizConfig, count: int) -> list[tuple[BaseQuestion, dict]]:
+    movies = await _pick_quiz_movies(quiz_config, count)
+    questions: dict[int, BaseQuestion] = {}
+
+    # one call for all movies, a retry only asks again for the ones without a valid question
+    async def ask():
+        pending = [i for i in range(len(movies)) if i not in questions]
+        prompt = _generate_question_batch_prompt(quiz_config, [movies[i] for i in pending])
+
+        started = time.perf_counter()
+        chat_reply = await chat_client.ainvoke(prompt, QUESTION_BATCH_INSTRUCTION.format(count=len(pending)))
+        _record_llm_call('question', started)
+        logger.debug('chat_reply: %s', chat_reply)
+
+        for i, question in zip(pending, chat_client.parse_chat_questions(chat_reply, len(pending))):
+            chat_client.record_parse(question is not None)
+            if question is None or _leaks_title(question, movies[i]):
+                metrics.PARSE_FAILURES.labels('question').inc()
+            else:
+                questions[i] = question
+
+        if len(questions) < len(movies):
+            raise ValueError(f'{len(movies) - len(questions)} of {len(pending)} questions are invalid')
+
+    try:
+        await retrier.run('llm_question', ask, is_parse_error)
+    except ValueError as e:
+        # the valid part of the batch is still served
+        if not questions:
+            raise
+        logger.warning('batch generation returned %d of %d questions: %s', len(questions), count, e)
+
+    return [(questions[i], movies[i]) for i in sorted(questions)]
+
+
+async def _start_session(question: BaseQuestion, movie: dict, quiz_config: QuizConfig, started: float) -> StartQuizResponse:
+    quiz_id = str(uuid.uuid4())
+    await session_store.set(SessionData(
+        quiz_id=quiz_id,
+        movie_id=movie['id'],
+        question=question,
+        started_at=datetime.now(),
+        popularity=quiz_config.popularity,
+        personality=quiz_config.personality,
+        language=quiz_config.language
+    ))
+
+    stats_store.record_quiz(quiz_config, time.perf_counter() - started)
+    return StartQuizResponse(quiz_id=quiz_id, question=question, movie=movie)
+
+
+async def _pop_session(quiz_id: str) -> SessionData:
+    session_data = await session_store.pop(quiz_id)
+
     if not session_data:
         logger.info('session not found: %s', quiz_id)
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='Session not found')
 
+    return session_data
+
+
+question_pool: QuestionPool = QuestionPool(
+    _generate_question,
+    generate_batch=_generate_questions if settings.question_pool_batch_size > 1 else None,
+    batch_size=settings.question_pool_batch_size,
+    target_depth=settings.question_pool_target_depth,
+    concurrency=settings.question_pool_concurrency,
+    max_age=settings.question_pool_max_age,
+    bucket_idle=settings.question_pool_bucket_idle,
+    refill_interval=settings.question_pool_refill_interval
+)
+
+
+@app.post('/api/quiz', dependencies=[Depends(rate_limit)])
+@retry_budgeted
+async def start_quiz(quiz_config: QuizConfig = QuizConfig()):
+    started = time.perf_counter()
+    # serve a pre-generated question if possible, generate inline otherwise
+    pooled = question_pool.pop(quiz_config) if settings.question_pool_enabled else None
+
     try:
-        prompt = prompt_generator.generate_answer_prompt(answer=user_answer.answer)
-
-        # chat = session_data.chat
-        del session_cache[quiz_id]
-        
-        
-        question = """
-            参与者获得多少积分由您决定。根据这个定义，他们得到 0、1、2 或 3 分:
-
-            0: 无分，与原标题相差甚远
-            1-2: 足够接近，取决于你的决定
-            3: 最好的结果，标题准确，小拼写错误没关系
-
-            友善点，如果靠近的话就好了。以有趣且友善的方式回答。
-
-            您的回复只能包含两行！您只能严格使用以下两行模板进行回复:
-            分数: <0-3>
-            答案: <您对参与者的回答>
-        """
-        
-        # question = """
-        #     It is your decision how many points the participants get. They get 0, 1, 2 or 3 points based on this definition:
-
-        #     0: no points, to far away from original title
-        #     1-2: close enough, depends on your decision
-        #     3: best result, got exact title, small spelling mistakes are ok
-
-        #     Be nice, if it is close, it is fine. Answer in a funny and nice way.
-
-        #     Your reply must only consist of two lines! You must only reply strictly using the following template for the two lines:
-        #     Points: <0-3>
-        #     Answer: <your answer to the participants>
-            
-        # """
-
-        logger.debug('evaluating quiz answer with generated prompt: %s', prompt)
-        
-        chat = chat_client.start_chat()
-        
-        chat_reply = chat_client.get_chat_response(chat,prompt,question)
-        
-        llama3_answer = chat_client.parse_chat_answer(chat_reply)
-
-        stats.points_total += llama3_answer.points
-        
+        llama3_question, movie = pooled or await _generate_question(quiz_config)
+        return await _start_session(llama3_question, movie, quiz_config, started)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f'Internal server error: {e}')
+
+
+# several rounds of a game in one llm call, each quiz gets its own session
+@app.post('/api/quiz/batch')
+@retry_budgeted
+async def start_quiz_batch(request: Request, batch: BatchQuizRequest) -> list[StartQuizResponse]:
+    await _check_rate_limit(request, batch.count)
+    started = time.perf_counter()
+
+    try:
+        generated = await _generate_questions(batch.config, batch.count)
+        return [await _start_session(question, movie, batch.config, started) for question, movie in generated]
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f'Internal server error: {e}')
+
+
+@app.post('/api/quiz/stream', dependencies=[Depends(rate_limit)])
+@retry_budgeted
+async def start_quiz_stream(quiz_config: QuizConfig = QuizConfig()):
+    started = time.perf_counter()
+    pooled = question_pool.pop(quiz_config) if settings.question_pool_enabled else None
+    movie = pooled[1] if pooled else await _pick_quiz_movie(quiz_config)
+
+    async def events():
+        if pooled:
+            for field, value in pooled[0].model_dump().items():
+                yield sse_event(field, value)
+            response = await _start_session(pooled[0], movie, quiz_config, started)
+            yield sse_event('done', response.model_dump(mode='json'))
+            return
+
+        parser = StreamingFieldParser(QUESTION_FIELDS)
+        try:
+            prompt = _generate_question_prompt(quiz_config, movie)
+            llm_started = time.perf_counter()
+            async with aclosing(chat_client.astream(prompt, QUESTION_INSTRUCTION, fields=QUESTION_FIELDS)) as stream:
+                async for chunk in stream:
+                    yield sse_event('token', chunk)
+                    for field, value in parser.feed(chunk):
+                        yield sse_event(field, value)
+            _record_llm_call('question', llm_started)
+            for field, value in parser.close():
+                yield sse_event(field, value)
+        except Exception as e:
+            logger.warning('error while streaming question: %s', e)
+            yield sse_event('error', f'Internal server error: {e}')
+            return
+
+        chat_client.record_parse(parser.complete)
+        if not parser.complete:
+            metrics.PARSE_FAILURES.labels('question').inc()
+            yield sse_event('error', 'Chat replied with an unexpected format')
+            return
+
+        llama3_question = BaseQuestion(**parser.values)
+        # the fields are already sent, a question that gives the title away gets no session
+        if _leaks_title(llama3_question, movie):
+            metrics.PARSE_FAILURES.labels('question').inc()
+            yield sse_event('error', 'Chat reply gives the title away')
+            return
+
+        response = await _start_session(llama3_question, movie, quiz_config, started)
+        yield sse_event('done', response.model_dump(mode='json'))
+
+    return StreamingResponse(events(), media_type='text/event-stream')
+
+
+def _grade_locally(answer: str, movie: dict) -> MatchResult | None:
+    if not settings.answer_local_grading:
+        return None
+
+    match = title_matcher.grade(answer, movie)
+    logger.debug('local grading of %s: %s', answer, match)
+    return match
+
+
+def _generate_answer_prompt(answer: str, movie: dict) -> str:
+    with metrics.observe('prompt_render'):
+        prompt = prompt_generator.generate_answer_prompt(answer=answer, title=' / '.join(candidate_titles(movie)))
+    logger.debug('evaluating quiz answer with generated prompt: %s', prompt)
+    return prompt
+
+
+@app.post('/api/quiz/{quiz_id}/answer')
+@retry_budgeted
+async def finish_quiz(quiz_id: str, user_answer: UserAnswer):
+    started = time.perf_counter()
+    session_data = await _pop_session(quiz_id)
+
+    try:
+        movie = await tmdb_client.get_movie_details(session_data.movie_id)
+        match = _grade_locally(user_answer.answer, movie)
+
+        if match and match.points is not None and not settings.answer_llm_feedback:
+            llama3_answer = title_matcher.feedback(match, movie)
+        else:
+            prompt = _generate_answer_prompt(user_answer.answer, movie)
+
+            async def ask() -> BaseAnswer:
+                llm_started = time.perf_counter()
+                chat_reply = await chat_client.ainvoke(prompt, ANSWER_INSTRUCTION, BaseAnswer)
+                _record_llm_call('answer', llm_started)
+                return chat_client.parse_reply(chat_reply, BaseAnswer)
+
+            llama3_answer = await retrier.run('llm_answer', ask, is_parse_error)
+
+            # a clear local decision wins, the model only phrases the feedback
+            if match and match.points is not None:
+                llama3_answer.points = match.points
+
+        stats_store.record_answer(session_data, llama3_answer.points, time.perf_counter() - started)
+
         return FinishQuizResponse(
             quiz_id=quiz_id,
             question=session_data.question,
-            movie=session_data.movie,
+            movie=movie,
             user_answer=user_answer.answer,
             result=llama3_answer
         )
-    except GoogleAPIError as e:
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f'Google API error: {e}')
-    except BaseException as e:
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f'Internal server error: {e}')
+
+
+@app.post('/api/quiz/{quiz_id}/answer/stream')
+@retry_budgeted
+async def finish_quiz_stream(quiz_id: str, user_answer: UserAnswer):
+    started = time.perf_counter()
+    session_data = await _pop_session(quiz_id)
+
+    async def events():
+        parser = StreamingFieldParser(ANSWER_FIELDS)
+        llm_graded = False
+        try:
+            movie = await tmdb_client.get_movie_details(session_data.movie_id)
+            match = _grade_locally(user_answer.answer, movie)
+
+            if match and match.points is not None and not settings.answer_llm_feedback:
+                local_answer = title_matcher.feedback(match, movie)
+                parser.values.update(points=str(local_answer.points), answer=local_answer.answer)
+                for field, value in parser.values.items():
+                    yield sse_event(field, value)
+            else:
+                prompt = _generate_answer_prompt(user_answer.answer, movie)
+                llm_started = time.perf_counter()
+                async with aclosing(chat_client.astream(prompt, ANSWER_INSTRUCTION, fields=ANSWER_FIELDS)) as stream:
+                    async for chunk in stream:
+                        yield sse_event('token', chunk)
+                        for field, value in parser.feed(chunk):
+                            yield sse_event(field, value)
+                _record_llm_call('answer', llm_started)
+                for field, value in parser.close():
+                    yield sse_event(field, value)
+                llm_graded = True
+        except Exception as e:
+            logger.warning('error while streaming answer: %s', e)
+            yield sse_event('error', f'Internal server error: {e}')
+            return
+
+        # same rules as parse_chat_answer: '2分' or '2/3' give 2 points
+        points = re.search(r'\d+', parser.values.get('points', ''))
+        if llm_graded:
+            chat_client.record_parse(parser.complete and points is not None)
+        if not parser.complete or not points:
+            metrics.PARSE_FAILURES.labels('answer').inc()
+            yield sse_event('error', 'Chat replied with an unexpected format')
+            return
+
+        llama3_answer = BaseAnswer(points=min(int(points.group(0)), 3), answer=parser.values['answer'])
+        if match and match.points is not None:
+            llama3_answer.points = match.points
+        stats_store.record_answer(session_data, llama3_answer.points, time.perf_counter() - started)
+
+        yield sse_event('done', FinishQuizResponse(
+            quiz_id=quiz_id,
+            question=session_data.question,
+            movie=movie,
+            user_answer=user_answer.answer,
+            result=llama3_answer
+        ).model_dump(mode='json'))
+
+    return StreamingResponse(events(), media_type='text/event-stream')
+
+
+async def _generate_room_question(quiz_config: QuizConfig) -> tuple[BaseQuestion, dict]:
+    pooled = question_pool.pop(quiz_config) if settings.question_pool_enabled else None
+    return pooled or await _generate_question(quiz_config)
+
+
+async def _grade_answers(movie: dict, answers: list[str]) -> list[BaseAnswer]:
+    matches = [_grade_locally(answer, movie) for answer in answers]
+    results: dict[int, BaseAnswer] = {
+        i: title_matcher.feedback(match, movie) for i, match in enumerate(matches) if match and match.points is not None
+    }
+
+    # the answers the matcher cannot decide on share one llm call, a retry only asks again for invalid ones
+    async def ask():
+        pending = [i for i in range(len(answers)) if i not in results]
+        with metrics.observe('prompt_render'):
+            prompt = prompt_generator.generate_answer_batch_prompt(
+                [answers[i] for i in pending], title=' / '.join(candidate_titles(movie))
+            )
+
+        started = time.perf_counter()
+        chat_reply = await chat_client.ainvoke(prompt, ANSWER_BATCH_INSTRUCTION)
+        _record_llm_call('answer', started)
+
+        for i, answer in zip(pending, chat_client.parse_chat_answers(chat_reply, len(pending))):
+            chat_client.record_parse(answer is not None)
+            if answer is not None:
+                results[i] = answer
+        if len(results) < len(answers):
+            raise ValueError(f'{len(answers) - len(results)} of {len(pending)} answers were not graded')
+
+    if len(results) < len(answers):
+        try:
+            await retrier.run('llm_answer', ask, is_parse_error)
+        except Exception as e:
+            # a round must end for everyone, answers without a grade get no points
+            logger.warning('could not grade %d answers: %s', len(answers) - len(results), e)
+
+    return [
+        results.get(i) or title_matcher.feedback(MatchResult(points=0, similarity=0.0, matched_title=None), movie)
+        for i in range(len(answers))
+    ]
+
+
+room_manager: RoomManager = RoomManager(
+    _generate_room_question,
+    _grade_answers,
+    maxsize=settings.room_maxsize,
+    ttl=settings.room_ttl,
+    max_players=settings.room_max_players,
+    send_timeout=settings.room_send_timeout
+)
+
+
+def _get_room(room_id: str):
+    room = room_manager.get(room_id)
+    if not room:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='Room not found')
+    return room
+
+
+@app.post('/api/rooms', dependencies=[Depends(rate_limit)])
+def create_room(room_request: RoomRequest = RoomRequest()) -> RoomResponse:
+    return room_manager.create(room_request.config, room_request.round_seconds).response()
+
+
+@app.get('/api/rooms/{room_id}')
+def get_room(room_id: str) -> RoomResponse:
+    return _get_room(room_id).response()
+
+
+# one question for the whole room, broadcast to every member
+@app.post('/api/rooms/{room_id}/rounds', dependencies=[Depends(rate_limit)])
+@retry_budgeted
+async def start_room_round(room_id: str) -> RoomResponse:
+    room = _get_room(room_id)
+    started = time.perf_counter()
+
+    try:
+        await room_manager.start_round(room)
+    except RoomError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+    except HTTPException:
+        raise
+    except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f'Internal server error: {e}')
+
+    stats_store.record_quiz(room.quiz_config, time.perf_counter() - started)
+    return room.response()
+
+
+# players receive question, results and error events, and send {"type": "answer", "answer": "..."}
+@app.websocket('/api/rooms/{room_id}/ws')
+async def room_socket(websocket: WebSocket, room_id: str, player: str = Query(min_length=1, max_length=32)):
+    room = room_manager.get(room_id)
+    await websocket.accept()
+    if not room:
+        await websocket.send_json({'type': 'error', 'detail': 'Room not found'})
+        await websocket.close()
+        return
+
+    try:
+        room_manager.join(room, player, websocket.send_json)
+    except RoomError as e:
+        await websocket.send_json({'type': 'error', 'detail': str(e)})
+        await websocket.close()
+        return
+
+    try:
+        await websocket.send_json({'type': 'joined', 'room': room.response().model_dump(mode='json')})
+        while True:
+            message = await websocket.receive_json()
+            # any json is accepted by receive_json, only objects are messages
+            if not isinstance(message, dict) or message.get('type') != 'answer':
+                await websocket.send_json({'type': 'error', 'detail': 'Unknown message type'})
+                continue
+
+            answer = str(message.get('answer', ''))
+            if len(answer) > MAX_ANSWER_LENGTH:
+                await websocket.send_json({'type': 'error', 'detail': f'Answer is longer than {MAX_ANSWER_LENGTH} characters'})
+            elif room_manager.answer(room, player, answer):
+                await websocket.send_json({'type': 'answered', 'round': room.round})
+            else:
+                await websocket.send_json({'type': 'error', 'detail': 'No open round or already answered'})
+    except (WebSocketDisconnect, ValueError):
+        pass
+    finally:
+        room_manager.leave(room, player)
@@ -0,0 +1,91 @@
+import unicodedata
+from dataclasses import dataclass
+from typing import List, Optional
+
+from api.common import BaseAnswer
+
+
+def normalize_title(text: str) -> str:
+    # NFKC folds full-width characters, punctuation, symbols and whitespace are dropped
+    text = unicodedata.normalize('NFKC', text).casefold()
+    return ''.join(ch for ch in text if unicodedata.category(ch)[0] not in 'PSZC')
+
+
+def edit_distance(a: str, b: str) -> int:
+    if len(a) < len(b):
+        a, b = b, a
+
+    previous = list(range(len(b) + 1))
+    for i, ch_a in enumerate(a, 1):
+        current = [i]
+        for j, ch_b in enumerate(b, 1):
+            current.append(min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (ch_a != ch_b)
+            ))
+        previous = current
+    return previous[-1]
+
+
+def similarity(a: str, b: str) -> float:
+    if not a or not b:
+        return 0.0
+    return 1.0 - edit_distance(a, b) / max(len(a), len(b))
+
+
+def candidate_titles(movie: dict) -> List[str]:
+    titles = [movie.get('title'), movie.get('original_title')]
+    titles += [title.get('title') for title in movie.get('alternative_titles', {}).get('titles', [])]
+    return list(dict.fromkeys(title for title in titles if title))
+
+
+@dataclass
+class MatchResult:
+    # None if the answer is neither a clear hit nor a clear miss
+    points: Optional[int]
+    similarity: float
+    matched_title: Optional[str]
+
+
+class TitleMatcher:
+
+    def __init__(self, hit_threshold: float, miss_threshold: float):
+        self.hit_threshold = hit_threshold
+        self.miss_threshold = miss_threshold
+        self.hits = 0
+        self.misses = 0
+        self.ambiguous = 0
+
+    def grade(self, answer: str, movie: dict) -> MatchResult:
+        normalized_answer = normalize_title(answer)
+
+        best_similarity, best_title = 0.0, None
+        for title in candidate_titles(movie):
+            normalized_title = normalize_title(title)
+            # the edit distance is at least the length difference, so the length ratio bounds the
+            # similarity: titles that cannot beat a clear miss or the best match skip the O(n*m) dp
+            lengths = sorted((len(normalized_answer), len(normalized_title)))
+            if not lengths[0] or lengths[0] / lengths[1] <= max(self.miss_threshold, best_similarity):
+                continue
+
+            score = similarity(normalized_answer, normalized_title)
+            if score > best_similarity:
+                best_similarity, best_title = score, title
+
+        if best_similarity >= self.hit_threshold:
+            self.hits += 1
+            return MatchResult(points=3, similarity=best_similarity, matched_title=best_title)
+
+        if best_similarity <= self.miss_threshold:
+            self.misses += 1
+            return MatchResult(points=0, similarity=best_similarity, matched_title=None)
+
+        self.ambiguous += 1
+        return MatchResult(points=None, similarity=best_similarity, matched_title=best_title)
+
+    @staticmethod
+    def feedback(match: MatchResult, movie: dict) -> BaseAnswer:
+        if match.points:
+            return BaseAnswer(points=match.points, answer=f'恭喜你，答对了！正确答案就是《{movie["title"]}》，你真是一位电影侦探！')
+        return BaseAnswer(points=0, answer=f'很遗憾，这次没有猜中。正确答案是《{movie["title"]}》，下次一定行！')
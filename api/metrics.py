@@ -0,0 +1,58 @@
+import time
+from contextlib import contextmanager
+
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram
+
+# own registry, so only the app's metrics are exported and tests can import the module repeatedly
+REGISTRY = CollectorRegistry()
+
+# tmdb_discover, tmdb_details, tmdb_changes, prompt_render, llm_ttft, llm_total, parse
+STAGE_SECONDS = Histogram(
+    'quiz_stage_seconds',
+    'Latency of the quiz pipeline stages',
+    ['stage'],
+    buckets=(.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 20, 30, 60),
+    registry=REGISTRY
+)
+LLM_SECONDS = Histogram(
+    'quiz_llm_seconds',
+    'Time to first token and total time per chat provider',
+    ['provider', 'phase'],
+    buckets=(.1, .25, .5, 1, 2, 3, 5, 7.5, 10, 15, 20, 30, 60),
+    registry=REGISTRY
+)
+# local estimates, see api.tokens
+LLM_TOKENS = Histogram(
+    'quiz_llm_tokens',
+    'Estimated prompt and completion tokens per chat request',
+    ['provider', 'kind'],
+    buckets=(50, 100, 250, 500, 750, 1000, 1500, 2000, 4000, 8000),
+    registry=REGISTRY
+)
+
+RETRIES = Counter('quiz_retries_total', 'Retries by stage and cause', ['stage', 'cause'], registry=REGISTRY)
+LLM_EARLY_STOPS = Counter(
+    'quiz_llm_early_stops_total', 'Chat generations stopped once all expected fields were parsed', ['provider'], registry=REGISTRY
+)
+PARSE_RESULTS = Counter('quiz_parse_results_total', 'Parsed chat replies by serving provider', ['provider', 'result'], registry=REGISTRY)
+PARSE_FAILURES = Counter('quiz_parse_failures_total', 'Chat replies in an unexpected format', ['kind'], registry=REGISTRY)
+CACHE_REQUESTS = Counter('quiz_tmdb_cache_requests_total', 'TMDB cache lookups', ['cache', 'result'], registry=REGISTRY)
+COALESCED = Counter('quiz_tmdb_coalesced_total', 'TMDB calls that joined an identical call in flight', ['call'], registry=REGISTRY)
+SESSION_EVICTIONS = Counter('quiz_session_evictions_total', 'Sessions evicted before they expired', registry=REGISTRY)
+
+# gauges are sampled when /api/metrics is scraped
+ACTIVE_SESSIONS = Gauge('quiz_active_sessions', 'Open quiz sessions', registry=REGISTRY)
+THREADPOOL_IN_USE = Gauge('quiz_threadpool_in_use', 'Busy worker threads of the sync endpoint threadpool', registry=REGISTRY)
+THREADPOOL_SIZE = Gauge('quiz_threadpool_size', 'Size of the sync endpoint threadpool', registry=REGISTRY)
+PROVIDER_IN_FLIGHT = Gauge('quiz_provider_in_flight', 'Chat requests in flight', ['provider'], registry=REGISTRY)
+PROVIDER_WAITING = Gauge('quiz_provider_waiting', 'Chat requests waiting for a provider slot', ['provider'], registry=REGISTRY)
+POOL_DEPTH = Gauge('quiz_question_pool_depth', 'Pre-generated questions ready to serve', registry=REGISTRY)
+
+
+@contextmanager
+def observe(stage: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.labels(stage).observe(time.perf_counter() - started)
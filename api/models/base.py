@@ -0,0 +1,232 @@
+import asyncio
+import logging
+import re
+import time
+from abc import ABC, abstractmethod
+from contextlib import aclosing
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple, Type, TypeVar
+
+from pydantic import BaseModel
+
+from api.common import BaseAnswer, BaseQuestion, ProviderStats
+from api.metrics import LLM_EARLY_STOPS, LLM_SECONDS, LLM_TOKENS, PARSE_FAILURES, PARSE_RESULTS, STAGE_SECONDS, observe
+from api.parsing import json_instruction, parse_fields
+from api.streaming import ANSWER_FIELDS, QUESTION_FIELDS, StreamingFieldParser
+from api.tokens import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+# '### 2' starts the block of the second movie in a batch reply
+BATCH_BLOCK_PATTERN = re.compile(r'^\s*#+\s*(\d+)\s*$', re.MULTILINE)
+
+
+class ChatProvider(ABC):
+
+    name: str = 'provider'
+
+    def __init__(self, max_concurrency: int, structured_output: bool = False):
+        self.max_concurrency = max_concurrency
+        # asks for a json object instead of the line template when the caller passes a schema
+        self.structured_output = structured_output
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.in_flight = 0
+        self.waiting = 0
+        self.requests = 0
+        self.queue_wait_total = 0.0
+        self.queue_wait_max = 0.0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.parse_successes = 0
+        self.parse_failures = 0
+        self.early_stops = 0
+
+    @abstractmethod
+    def _astream(self, prompt: str, question: str) -> AsyncIterator[str]:
+        ...
+
+    # providers with a json mode override this, the others only get the json instruction
+    def _astream_json(self, prompt: str, question: str) -> AsyncIterator[str]:
+        return self._astream(prompt, question)
+
+    # with fields, the generation is stopped once the template lines of all fields are complete,
+    # models tend to add commentary after them
+    async def astream(
+        self,
+        prompt: str,
+        question: str,
+        schema: Optional[Type[BaseModel]] = None,
+        fields: Optional[Tuple[str, ...]] = None
+    ) -> AsyncIterator[str]:
+        structured = schema is not None and self.structured_output
+        if structured:
+            question += json_instruction(schema)
+        # a json object is complete only with its closing brace
+        parser = StreamingFieldParser(fields) if fields and not structured else None
+
+        # wait for a free slot, the time spent here is the provider's queue wait
+        queued_at = time.perf_counter()
+        self.waiting += 1
+        try:
+            await self.semaphore.acquire()
+        finally:
+            self.waiting -= 1
+
+        queue_wait = time.perf_counter() - queued_at
+        self.requests += 1
+        self.queue_wait_total += queue_wait
+        self.queue_wait_max = max(self.queue_wait_max, queue_wait)
+
+        prompt_tokens = estimate_tokens(prompt) + estimate_tokens(question)
+        self.prompt_tokens += prompt_tokens
+        LLM_TOKENS.labels(self.name, 'prompt').observe(prompt_tokens)
+        completion_tokens = 0
+
+        self.in_flight += 1
+        first_token = True
+        try:
+            # closing the stream cancels the generation of the sdk's request
+            async with aclosing((self._astream_json if structured else self._astream)(prompt, question)) as stream:
+                async for chunk in stream:
+                    completion_tokens += estimate_tokens(chunk)
+                    if first_token:
+                        # time to first token includes the queue wait, it is what the player waits for
+                        first_token = False
+                        ttft = time.perf_counter() - queued_at
+                        STAGE_SECONDS.labels('llm_ttft').observe(ttft)
+                        LLM_SECONDS.labels(self.name, 'ttft').observe(ttft)
+                    yield chunk
+
+                    # feed() only assigns known labels, a preamble like '好的, 以下是回复: ...' never completes it
+                    if parser:
+                        parser.feed(chunk)
+                        if parser.complete:
+                            self.early_stops += 1
+                            LLM_EARLY_STOPS.labels(self.name).inc()
+                            break
+
+            total = time.perf_counter() - queued_at
+            STAGE_SECONDS.labels('llm_total').observe(total)
+            LLM_SECONDS.labels(self.name, 'total').observe(total)
+        finally:
+            self.completion_tokens += completion_tokens
+            LLM_TOKENS.labels(self.name, 'completion').observe(completion_tokens)
+            self.in_flight -= 1
+            self.semaphore.release()
+
+    async def ainvoke(self, prompt: str, question: str, schema: Optional[Type[BaseModel]] = None) -> str:
+        fields = tuple(schema.model_fields) if schema else None
+        return ''.join([chunk async for chunk in self.astream(prompt, question, schema, fields)])
+
+    def record_parse(self, success: bool):
+        if success:
+            self.parse_successes += 1
+        else:
+            self.parse_failures += 1
+        PARSE_RESULTS.labels(self.name, 'success' if success else 'failure').inc()
+
+    def stats(self) -> ProviderStats:
+        return ProviderStats(
+            name=self.name,
+            max_concurrency=self.max_concurrency,
+            in_flight=self.in_flight,
+            waiting=self.waiting,
+            requests=self.requests,
+            queue_wait_avg=self.queue_wait_total / self.requests if self.requests else 0.0,
+            queue_wait_max=self.queue_wait_max,
+            prompt_tokens=self.prompt_tokens,
+            completion_tokens=self.completion_tokens,
+            parse_successes=self.parse_successes,
+            parse_failures=self.parse_failures,
+            early_stops=self.early_stops,
+            parse_success_rate=self.parse_successes / parsed if (parsed := self.parse_successes + self.parse_failures) else 1.0
+        )
+
+    @staticmethod
+    def _parse_fields(chat_reply: str, fields: Tuple[str, ...], kind: str) -> Dict[str, str]:
+        with observe('parse'):
+            values = parse_fields(chat_reply, fields)
+        if len(values) != len(fields):
+            PARSE_FAILURES.labels(kind).inc()
+            msg = f'Chat replied with an unexpected format. chat_reply: {chat_reply}'
+            logger.warning(msg)
+            raise ValueError(msg)
+        return values
+
+    # json objects of the structured output mode as well as the plain text template
+    @staticmethod
+    def parse_chat_question(chat_reply: str) -> BaseQuestion:
+        return BaseQuestion(**ChatProvider._parse_fields(chat_reply, QUESTION_FIELDS, 'question'))
+
+    @staticmethod
+    def _parse_blocks(chat_reply: str, count: int, parse: Callable[[str], T]) -> List[Optional[T]]:
+        parts = BATCH_BLOCK_PATTERN.split(chat_reply)
+        blocks = {int(number): block for number, block in zip(parts[1::2], parts[2::2])}
+
+        results = []
+        for number in range(1, count + 1):
+            try:
+                results.append(parse(blocks.get(number, '')))
+            except ValueError:
+                results.append(None)
+        return results
+
+    # one entry per movie, None for blocks that are missing or in the wrong format
+    @staticmethod
+    def parse_chat_questions(chat_reply: str, count: int) -> List[Optional[BaseQuestion]]:
+        return ChatProvider._parse_blocks(chat_reply, count, ChatProvider.parse_chat_question)
+
+    # one entry per graded answer, None for blocks that are missing or in the wrong format
+    @staticmethod
+    def parse_chat_answers(chat_reply: str, count: int) -> List[Optional[BaseAnswer]]:
+        return ChatProvider._parse_blocks(chat_reply, count, ChatProvider.parse_chat_answer)
+
+    @staticmethod
+    def parse_chat_answer(chat_reply: str) -> BaseAnswer:
+        values = ChatProvider._parse_fields(chat_reply, ANSWER_FIELDS, 'answer')
+
+        # '2分', '2/3' or '**2**'
+        points = re.search(r'\d+', values['points'])
+        if not points:
+            PARSE_FAILURES.labels('answer').inc()
+            raise ValueError(f'Chat replied without points. chat_reply: {chat_reply}')
+
+        return BaseAnswer(points=min(int(points.group(0)), 3), answer=values['answer'])
+
+    @staticmethod
+    def parse_reply(chat_reply: str, schema: Type[BaseModel]) -> BaseModel:
+        if schema is BaseQuestion:
+            return ChatProvider.parse_chat_question(chat_reply)
+        if schema is BaseAnswer:
+            return ChatProvider.parse_chat_answer(chat_reply)
+        raise TypeError(f'no parser for {schema.__name__}')
+
+
+class LangChainProvider(ChatProvider):
+
+    # json_model is the model in json mode, e.g. bound to response_format={'type': 'json_object'}
+    def __init__(self, model, max_concurrency: int, json_model=None, structured_output: bool = False):
+        super().__init__(max_concurrency, structured_output)
+        self.model = model
+
+        # langchain is only imported once a langchain based provider is configured
+        from langchain_core.output_parsers import StrOutputParser
+        from langchain_core.prompts import ChatPromptTemplate
+
+        # the system prompt is passed as a variable, so braces in movie metadata are not parsed as placeholders
+        template = ChatPromptTemplate.from_messages([("system", "{system_prompt}"), ("human", "{user_input}")])
+        self.chain = template | self.model | StrOutputParser()
+        self.json_chain = template | json_model | StrOutputParser() if json_model is not None else self.chain
+
+    def _astream(self, prompt: str, question: str) -> AsyncIterator[str]:
+        return self._astream_chain(self.chain, prompt, question)
+
+    def _astream_json(self, prompt: str, question: str) -> AsyncIterator[str]:
+        return self._astream_chain(self.json_chain, prompt, question)
+
+    @staticmethod
+    async def _astream_chain(chain, prompt: str, question: str) -> AsyncIterator[str]:
+        async with aclosing(chain.astream({"system_prompt": prompt, "user_input": question})) as stream:
+            async for chunk in stream:
+                yield chunk
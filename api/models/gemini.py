@@ -1,21 +1,24 @@
 import logging
-import re
+from typing import AsyncIterator
 
 import vertexai
 from google.oauth2.service_account import Credentials
 from vertexai.generative_models import GenerativeModel, ChatSession
 
 from api.config import GENERATION_CONFIG
-from api.common import BaseQuestion, BaseAnswer
+from api.models.base import ChatProvider
 
 logger = logging.getLogger(__name__)
 
 
-class GeminiClient:
+class GeminiClient(ChatProvider):
+
+    name = 'gemini'
 
     FALLBACK_MODEL = 'gemini-1.0-pro'
 
-    def __init__(self, project_id: str, location: str, credentials: Credentials, model: str):
+    def __init__(self, project_id: str, location: str, credentials: Credentials, model: str, max_concurrency: int = 8):
+        super().__init__(max_concurrency)
         vertexai.init(project=project_id, location=location, credentials=credentials)
 
         logger.info('loading model: %s', model)
@@ -36,37 +39,11 @@ class GeminiClient:
             )
             return self.fallback_model.start_chat(response_validation=False)
 
-    @staticmethod
-    def get_chat_response(chat: ChatSession, prompt: str) -> str:
-        text_response = []
-        responses = chat.send_message(prompt, generation_config=GENERATION_CONFIG, stream=True)
-        for chunk in responses:
-            text_response.append(chunk.text)
-        return ''.join(text_response)
-
-    @staticmethod
-    def parse_gemini_question(gemini_reply: str) -> BaseQuestion:
-        result = re.findall(r'[^:]+: ([^\n]+)', gemini_reply, re.MULTILINE)
-        if len(result) != 3:
-            msg = f'Gemini replied with an unexpected format. Gemini reply: {gemini_reply}'
-            logger.warning(msg)
-            raise ValueError(msg)
-
-        question = result[0]
-        hint1 = result[1]
-        hint2 = result[2]
-
-        return BaseQuestion(question=question, hint1=hint1, hint2=hint2)
-
-    @staticmethod
-    def parse_gemini_answer(gemini_reply: str) -> BaseAnswer:
-        result = re.findall(r'[^:]+: ([^\n]+)', gemini_reply, re.MULTILINE)
-        if len(result) != 2:
-            msg = f'Gemini replied with an unexpected format. Gemini reply: {gemini_reply}'
-            logger.warning(msg)
-            raise ValueError(msg)
-
-        points = re.sub('[^0-9]', '', result[0])
-        answer = result[1]
+    async def _astream(self, prompt: str, question: str) -> AsyncIterator[str]:
+        chat = self.start_chat()
+        responses = await chat.send_message_async(f'{prompt}\n\n{question}', generation_config=GENERATION_CONFIG, stream=True)
+        async for chunk in responses:
+            yield chunk.text
 
-        return BaseAnswer(points=int(points), answer=answer)
+    parse_gemini_question = staticmethod(ChatProvider.parse_chat_question)
+    parse_gemini_answer = staticmethod(ChatProvider.parse_chat_answer)
@@ -0,0 +1,269 @@
+import asyncio
+import logging
+import time
+from contextlib import aclosing
+from contextvars import ContextVar
+from functools import partial
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple, Type
+
+from pydantic import BaseModel
+
+from api.config import Settings
+from api.common import ProviderStats
+from api.models.base import ChatProvider
+
+logger = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+# name of the provider that served the last completed call in the current context
+served_by: ContextVar[str] = ContextVar('served_by', default='unknown')
+
+
+PROVIDERS = ('qwen', 'groq', 'ollama', 'azure', 'gemini')
+
+
+# defers the provider sdk import and client setup to the first request or to preload(),
+# so importing the app stays fast and does not need the sdks of unused providers
+class LazyProvider(ChatProvider):
+
+    def __init__(self, name: str, max_concurrency: int, factory: Callable[[], ChatProvider], structured_output: bool = False):
+        super().__init__(max_concurrency, structured_output)
+        self.name = name
+        self.factory = factory
+        self.provider: Optional[ChatProvider] = None
+        self._lock = asyncio.Lock()
+
+    async def load(self) -> ChatProvider:
+        async with self._lock:
+            if self.provider is None:
+                # sdk imports take a while, keep them off the event loop
+                self.provider = await asyncio.to_thread(self.factory)
+        return self.provider
+
+    async def _astream(self, prompt: str, question: str) -> AsyncIterator[str]:
+        provider = await self.load()
+        # concurrency is limited by this wrapper, so the inner provider's own slots are bypassed
+        async with aclosing(provider._astream(prompt, question)) as stream:
+            async for chunk in stream:
+                yield chunk
+
+    async def _astream_json(self, prompt: str, question: str) -> AsyncIterator[str]:
+        provider = await self.load()
+        async with aclosing(provider._astream_json(prompt, question)) as stream:
+            async for chunk in stream:
+                yield chunk
+
+
+class ProviderHealth:
+
+    def __init__(self):
+        self.state = CLOSED
+        self.latency_ewma = 0.0
+        self.error_rate = 0.0
+        self.successes = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+
+
+# picks a provider per request by EWMA latency and error rate, fails over to the next one
+# before the first token and takes providers that keep failing out of rotation for a while
+class ProviderRouter:
+
+    def __init__(
+        self,
+        providers: List[ChatProvider],
+        failure_threshold: int,
+        open_seconds: float,
+        ewma_alpha: float,
+        error_penalty: float = 10.0
+    ):
+        self.providers = providers
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+        self.ewma_alpha = ewma_alpha
+        self.error_penalty = error_penalty
+        self.health: Dict[str, ProviderHealth] = {provider.name: ProviderHealth() for provider in providers}
+
+    parse_chat_question = staticmethod(ChatProvider.parse_chat_question)
+    parse_chat_questions = staticmethod(ChatProvider.parse_chat_questions)
+    parse_chat_answers = staticmethod(ChatProvider.parse_chat_answers)
+    parse_chat_answer = staticmethod(ChatProvider.parse_chat_answer)
+
+    def _score(self, provider: ChatProvider) -> float:
+        health = self.health[provider.name]
+        # providers without samples score 0 and are tried first
+        return health.latency_ewma * (1 + self.error_penalty * health.error_rate)
+
+    def _available(self, provider: ChatProvider) -> bool:
+        health = self.health[provider.name]
+        if health.state == CLOSED:
+            return True
+
+        # after the open period a single request probes the provider
+        if health.state == OPEN and time.monotonic() - health.opened_at >= self.open_seconds:
+            health.state = HALF_OPEN
+            return True
+
+        return False
+
+    def candidates(self) -> List[ChatProvider]:
+        # a half-open provider goes first, otherwise the probe might never run
+        return sorted(
+            (provider for provider in self.providers if self._available(provider)),
+            key=lambda provider: (self.health[provider.name].state != HALF_OPEN, self._score(provider))
+        )
+
+    def _record_success(self, provider: ChatProvider, latency: float):
+        health = self.health[provider.name]
+        health.successes += 1
+        health.consecutive_failures = 0
+        health.state = CLOSED
+        health.error_rate *= 1 - self.ewma_alpha
+        health.latency_ewma = latency if health.successes == 1 else (
+            self.ewma_alpha * latency + (1 - self.ewma_alpha) * health.latency_ewma
+        )
+
+    def _record_failure(self, provider: ChatProvider):
+        health = self.health[provider.name]
+        health.failures += 1
+        health.consecutive_failures += 1
+        health.error_rate = self.ewma_alpha + (1 - self.ewma_alpha) * health.error_rate
+
+        if health.state == HALF_OPEN or health.consecutive_failures >= self.failure_threshold:
+            if health.state != OPEN:
+                logger.warning('opening circuit for chat provider %s', provider.name)
+            health.state = OPEN
+            health.opened_at = time.monotonic()
+
+    async def astream(
+        self,
+        prompt: str,
+        question: str,
+        schema: Optional[Type[BaseModel]] = None,
+        fields: Optional[Tuple[str, ...]] = None
+    ) -> AsyncIterator[str]:
+        candidates = self.candidates()
+        if not candidates:
+            raise RuntimeError('No chat provider available')
+
+        for i, provider in enumerate(candidates):
+            started = time.perf_counter()
+            streamed = False
+            try:
+                async with aclosing(provider.astream(prompt, question, schema, fields)) as stream:
+                    async for chunk in stream:
+                        streamed = True
+                        yield chunk
+            except (GeneratorExit, asyncio.CancelledError):
+                # the caller stopped early, an unfinished probe must not leave the circuit half-open
+                if self.health[provider.name].state == HALF_OPEN:
+                    self.health[provider.name].state = OPEN
+                raise
+            except Exception as e:
+                self._record_failure(provider)
+                # once tokens reached the caller there is no transparent failover
+                if streamed or i == len(candidates) - 1:
+                    raise
+                logger.warning('chat provider %s failed, trying next provider: %s', provider.name, e)
+                continue
+
+            self._record_success(provider, time.perf_counter() - started)
+            served_by.set(provider.name)
+            return
+
+    async def ainvoke(self, prompt: str, question: str, schema: Optional[Type[BaseModel]] = None) -> str:
+        fields = tuple(schema.model_fields) if schema else None
+        return ''.join([chunk async for chunk in self.astream(prompt, question, schema, fields)])
+
+    # json of the structured output mode or the line template, the outcome counts for the serving provider
+    def parse_reply(self, chat_reply: str, schema: Type[BaseModel]) -> BaseModel:
+        try:
+            result = ChatProvider.parse_reply(chat_reply, schema)
+        except ValueError:
+            self.record_parse(False)
+            raise
+        self.record_parse(True)
+        return result
+
+    # attributed to the provider that served the last call in this context
+    def record_parse(self, success: bool):
+        provider = next((provider for provider in self.providers if provider.name == served_by.get()), None)
+        if provider:
+            provider.record_parse(success)
+
+    async def preload(self):
+        for provider in self.providers:
+            if isinstance(provider, LazyProvider):
+                try:
+                    await provider.load()
+                except Exception as e:
+                    logger.warning('could not load chat provider %s: %s', provider.name, e)
+
+    def stats(self) -> List[ProviderStats]:
+        return [
+            provider.stats().model_copy(update={
+                'state': self.health[provider.name].state,
+                'latency_ewma': self.health[provider.name].latency_ewma,
+                'error_rate': self.health[provider.name].error_rate,
+                'successes': self.health[provider.name].successes,
+                'failures': self.health[provider.name].failures
+            })
+            for provider in self.providers
+        ]
+
+
+def create_provider(name: str, settings: Settings) -> ChatProvider:
+    # provider sdks are imported only when configured
+    if name == 'qwen':
+        from api.models.qwen import qwenClient
+        return qwenClient(settings.qwen_model_name, settings.qwen_api_key, settings.qwen_max_concurrency)
+
+    if name == 'groq':
+        from api.models.llama3Groq import QroqClient
+        return QroqClient(settings.groq_model_name, settings.groq_api_key, settings.groq_max_concurrency)
+
+    if name == 'ollama':
+        from api.models.llama3Ollama import Llama3Client
+        return Llama3Client(settings.ollama_base_url, settings.ollama_max_concurrency)
+
+    if name == 'azure':
+        from api.models.azure import AzureClient
+        return AzureClient(settings.azure_max_concurrency)
+
+    if name == 'gemini':
+        from google.oauth2.service_account import Credentials
+        from api.models.gemini import GeminiClient
+        return GeminiClient(
+            settings.gcp_project_id,
+            settings.gcp_location,
+            Credentials.from_service_account_file(settings.gcp_service_account_file),
+            settings.gcp_gemini_model,
+            settings.gemini_max_concurrency
+        )
+
+    raise ValueError(f'Unknown chat provider: {name}')
+
+
+def create_router(settings: Settings) -> ProviderRouter:
+    unknown = set(settings.llm_providers) - set(PROVIDERS)
+    if unknown:
+        raise ValueError(f'Unknown chat provider: {", ".join(sorted(unknown))}')
+
+    return ProviderRouter(
+        [
+            LazyProvider(
+                name,
+                getattr(settings, f'{name}_max_concurrency'),
+                partial(create_provider, name, settings),
+                structured_output=name in settings.llm_structured_output
+            )
+            for name in settings.llm_providers
+        ],
+        failure_threshold=settings.llm_failure_threshold,
+        open_seconds=settings.llm_circuit_open_seconds,
+        ewma_alpha=settings.llm_ewma_alpha
+    )
@@ -0,0 +1,83 @@
+import json
+import re
+from typing import Dict, List, Optional, Tuple, Type
+
+from pydantic import BaseModel
+
+# labels the models use for the template lines, compared after normalize_label
+FIELD_LABELS = {
+    'question': ('问题', 'question'),
+    'hint1': ('提示1', '提示一', '第一个提示', 'hint1', 'firsthint'),
+    'hint2': ('提示2', '提示二', '第二个提示', 'hint2', 'secondhint'),
+    'points': ('分数', '得分', '积分', 'points', 'score'),
+    'answer': ('答案', '回答', '回复', 'answer')
+}
+
+# `<label>: <value>`, the label ends at the first colon
+LINE_PATTERN = re.compile(r'^(?P<label>[^:]{1,30}?)\s*:\s*(?P<value>.+)$')
+# list markers, quotes and headings in front of a line
+LINE_PREFIX_PATTERN = re.compile(r'^[\s>#*\-+]+')
+JSON_PATTERN = re.compile(r'\{.*\}', re.DOTALL)
+
+
+def normalize_label(label: str) -> str:
+    return re.sub(r'[\s*_`]', '', label).casefold()
+
+
+# tolerates full-width colons, markdown emphasis and list markers, None for lines without a label
+def parse_line(line: str) -> Optional[Tuple[str, str]]:
+    line = LINE_PREFIX_PATTERN.sub('', line.replace('：', ':').replace('**', '').replace('`', '')).strip()
+    match = LINE_PATTERN.match(line)
+    if not match or not match.group('value').strip():
+        return None
+    return normalize_label(match.group('label')), match.group('value').strip()
+
+
+def field_for_label(label: str, fields: Tuple[str, ...]) -> Optional[str]:
+    return next((field for field in fields if label in FIELD_LABELS.get(field, ())), None)
+
+
+# unknown labels, e.g. another language, fill the fields without a known label in order, but only
+# when the reply has exactly the template lines: with chatter around them there is no telling which is which
+def fill_positional(values: Dict[str, str], unlabelled: List[str], line_count: int, fields: Tuple[str, ...]) -> Dict[str, str]:
+    if len(values) == len(fields) or line_count != len(fields):
+        return values
+    free = [field for field in fields if field not in values]
+    return {**values, **dict(zip(free, unlabelled))}
+
+
+def _parse_json(text: str, fields: Tuple[str, ...]) -> Dict[str, str]:
+    match = JSON_PATTERN.search(text)
+    if not match:
+        return {}
+    try:
+        data = json.loads(match.group(0))
+    except ValueError:
+        return {}
+    if not isinstance(data, dict):
+        return {}
+    return {field: str(data[field]).strip() for field in fields if data.get(field) not in (None, '')}
+
+
+def parse_fields(text: str, fields: Tuple[str, ...]) -> Dict[str, str]:
+    # structured output first, a json object with the field names as keys
+    values = _parse_json(text, fields)
+    if len(values) == len(fields):
+        return values
+
+    lines = [parsed for parsed in map(parse_line, text.splitlines()) if parsed]
+
+    # known labels, in any order, chatter around them is ignored
+    values, unlabelled = {}, []
+    for label, value in lines:
+        field = field_for_label(label, fields)
+        if field is None:
+            unlabelled.append(value)
+        elif field not in values:
+            values[field] = value
+    return fill_positional(values, unlabelled, len(lines), fields)
+
+
+def json_instruction(schema: Type[BaseModel]) -> str:
+    properties = json.dumps(schema.model_json_schema()['properties'], ensure_ascii=False)
+    return f'\n    请忽略上面的行模板, 只回复一个 JSON 对象, 不要有其他内容。JSON 对象的字段: {properties}\n'
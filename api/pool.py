@@ -0,0 +1,185 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from contextlib import suppress
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Deque, Dict, List, Optional, Set, Tuple
+
+from api.common import BaseQuestion
+from api.config import QuizConfig
+from api.prompt import get_language_by_name, get_personality_by_name
+
+logger = logging.getLogger(__name__)
+
+PoolKey = Tuple[int, str, str]
+
+
+@dataclass
+class PooledQuestion:
+    question: BaseQuestion
+    movie: dict
+    created_at: float
+
+
+# keeps a bounded queue of ready-made questions per (popularity, personality, language) bucket.
+# buckets are refilled in the background while they are requested, idle buckets drain.
+class QuestionPool:
+
+    def __init__(
+        self,
+        generate: Callable[[QuizConfig], Awaitable[Tuple[BaseQuestion, dict]]],
+        target_depth: int,
+        concurrency: int,
+        max_age: float,
+        bucket_idle: float,
+        refill_interval: float,
+        generate_batch: Optional[Callable[[QuizConfig, int], Awaitable[List[Tuple[BaseQuestion, dict]]]]] = None,
+        batch_size: int = 1
+    ):
+        self.generate = generate
+        # with a batch generator, missing questions are generated up to batch_size per llm call
+        self.generate_batch = generate_batch
+        self.batch_size = batch_size
+        self.target_depth = target_depth
+        self.concurrency = concurrency
+        self.max_age = max_age
+        self.bucket_idle = bucket_idle
+        self.refill_interval = refill_interval
+
+        self.buckets: Dict[PoolKey, Deque[PooledQuestion]] = {}
+        self.configs: Dict[PoolKey, QuizConfig] = {}
+        self.last_requested: Dict[PoolKey, float] = {}
+        self.in_flight: Dict[PoolKey, int] = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.generated = 0
+        self.expired = 0
+        self.failures = 0
+
+        self._wakeup = asyncio.Event()
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._task: Optional[asyncio.Task] = None
+        self._refill_tasks: Set[asyncio.Task] = set()
+
+    @staticmethod
+    def key(quiz_config: QuizConfig) -> PoolKey:
+        return (
+            quiz_config.popularity,
+            get_personality_by_name(quiz_config.personality).name,
+            get_language_by_name(quiz_config.language).name
+        )
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        tasks = list(self._refill_tasks)
+        if self._task:
+            tasks.append(self._task)
+            self._task = None
+
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def warm(self, quiz_config: QuizConfig):
+        key = self._register(quiz_config)
+        self.last_requested[key] = time.monotonic()
+        self._wakeup.set()
+
+    def pop(self, quiz_config: QuizConfig) -> Optional[Tuple[BaseQuestion, dict]]:
+        key = self._register(quiz_config)
+        self.last_requested[key] = time.monotonic()
+        self._wakeup.set()
+        self._drop_stale(key)
+
+        bucket = self.buckets[key]
+        for entry in bucket:
+            # buckets are filled with the default vote filters, the request may be stricter
+            if entry.movie['vote_average'] >= quiz_config.vote_avg_min and entry.movie['vote_count'] >= quiz_config.vote_count_min:
+                bucket.remove(entry)
+                self.hits += 1
+                return entry.question, entry.movie
+
+        self.misses += 1
+        return None
+
+    def depth(self) -> Dict[PoolKey, int]:
+        return {key: len(bucket) for key, bucket in self.buckets.items()}
+
+    def hit_rate(self) -> float:
+        requests = self.hits + self.misses
+        return self.hits / requests if requests else 0.0
+
+    def _register(self, quiz_config: QuizConfig) -> PoolKey:
+        key = self.key(quiz_config)
+        if key not in self.configs:
+            popularity, personality, language = key
+            self.configs[key] = QuizConfig(popularity=popularity, personality=personality, language=language)
+            self.buckets[key] = deque()
+            self.in_flight[key] = 0
+        return key
+
+    def _drop_stale(self, key: PoolKey):
+        bucket = self.buckets[key]
+        deadline = time.monotonic() - self.max_age
+        while bucket and bucket[0].created_at < deadline:
+            bucket.popleft()
+            self.expired += 1
+
+    def _is_active(self, key: PoolKey) -> bool:
+        return time.monotonic() - self.last_requested.get(key, 0.0) < self.bucket_idle
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+
+            for key in list(self.configs):
+                self._drop_stale(key)
+                if not self._is_active(key):
+                    continue
+
+                missing = self.target_depth - len(self.buckets[key]) - self.in_flight[key]
+                while missing > 0:
+                    count = min(missing, self.batch_size) if self.generate_batch else 1
+                    missing -= count
+                    self.in_flight[key] += count
+                    task = asyncio.create_task(self._refill_batch(key, count) if count > 1 else self._refill(key))
+                    self._refill_tasks.add(task)
+                    task.add_done_callback(self._refill_tasks.discard)
+
+            with suppress(TimeoutError):
+                async with asyncio.timeout(self.refill_interval):
+                    await self._wakeup.wait()
+
+    async def _refill(self, key: PoolKey):
+        try:
+            async with self._semaphore:
+                question, movie = await self.generate(self.configs[key])
+            self.buckets[key].append(PooledQuestion(question=question, movie=movie, created_at=time.monotonic()))
+            self.generated += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.failures += 1
+            logger.warning('could not pre-generate question for %s: %s', key, e)
+        finally:
+            self.in_flight[key] -= 1
+
+    async def _refill_batch(self, key: PoolKey, count: int):
+        try:
+            async with self._semaphore:
+                generated = await self.generate_batch(self.configs[key], count)
+            now = time.monotonic()
+            self.buckets[key].extend(PooledQuestion(question=question, movie=movie, created_at=now) for question, movie in generated)
+            self.generated += len(generated)
+            self.failures += count - len(generated)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.failures += count
+            logger.warning('could not pre-generate %d questions for %s: %s', count, key, e)
+        finally:
+            self.in_flight[key] -= count
@@ -1,8 +1,10 @@
+import re
 from enum import StrEnum
-from typing import Any
+from typing import Any, List
 
 from jinja2 import Environment, PackageLoader, select_autoescape
-from pydantic.v1 import validate_arguments
+
+from api.tokens import estimate_tokens, trim_to_tokens
 
 PERSONALITY_PATH = 'personality'
 LANGUAGE_PATH = 'language'
@@ -21,6 +23,13 @@ class Language(StrEnum):
     CHINESE = 'en.jinja'
 
 
+# players' answers share one batch prompt: an answer must stay on its own line and must not open a
+# '### <n>' block of its own, or one player could change how the others are graded. the length is
+# capped where answers come in, see MAX_ANSWER_LENGTH
+def inline_answer(answer: str) -> str:
+    return re.sub(r'\s+', ' ', answer).strip().lstrip('#').strip()
+
+
 def get_personality_by_name(name: str) -> Personality:
     try:
         return Personality[name.upper()]
@@ -35,15 +44,34 @@ def get_language_by_name(name: str) -> Language:
         return Language.DEFAULT
 
 
+# static instructions come first and the movie metadata last, so every prompt of a language x personality
+# shares a long identical prefix that providers with prompt caching can reuse
 class PromptGenerator:
 
-    def __init__(self):
+    def __init__(self, metadata_token_budget: int | None = None):
+        # the overview is trimmed so the metadata of one movie stays within the budget, None keeps it as is
+        self.metadata_token_budget = metadata_token_budget
         self.env = Environment(
             loader=PackageLoader('api'),
-            autoescape=select_autoescape()
+            autoescape=select_autoescape(),
+            auto_reload=False
         )
 
-    @validate_arguments
+        # templates are compiled once, the static fragments are rendered once per language x personality
+        self.question_template = self.env.get_template('prompt_question_cn.jinja')
+        self.question_batch_template = self.env.get_template('prompt_question_batch_cn.jinja')
+        self.answer_template = self.env.get_template('prompt_answer_cn.jinja')
+        self.answer_batch_template = self.env.get_template('prompt_answer_batch_cn.jinja')
+        self.metadata_template = self.env.get_template('metadata_cn.jinja')
+        self.fragments = {
+            (language, personality): {
+                'language': self.env.get_template(f'{LANGUAGE_PATH}/{language.value}').render(),
+                'personality': self.env.get_template(f'{PERSONALITY_PATH}/{personality.value}').render()
+            }
+            for language in Language
+            for personality in Personality
+        }
+
     def generate_question_prompt(
         self,
         movie_title: str,
@@ -51,21 +79,28 @@ class PromptGenerator:
         personality: Personality,
         **kwargs: Any
     ) -> str:
-        template = self.env.get_template('prompt_question_cn.jinja')
+        # enum lookups replace the former argument validation, unknown values raise ValueError
+        fragments = self.fragments[(Language(language), Personality(personality))]
 
-        # noinspection PyTypeChecker
-        language = self.env.get_template(f'{LANGUAGE_PATH}/{language.value}').render()
+        return self.question_template.render(
+            **fragments,
+            **self._fit_metadata(dict(kwargs, title=movie_title))
+        )
 
-        # noinspection PyTypeChecker
-        personality = self.env.get_template(f'{PERSONALITY_PATH}/{personality.value}').render()
+    # movies are dicts with the same keys as the kwargs of generate_question_prompt, plus 'title'
+    def generate_question_batch_prompt(self, movies: List[dict], language: Language, personality: Personality) -> str:
+        fragments = self.fragments[(Language(language), Personality(personality))]
+        return self.question_batch_template.render(movies=[self._fit_metadata(movie) for movie in movies], **fragments)
 
-        return template.render(
-            language=language,
-            personality=personality,
-            title=movie_title,
-            **kwargs
-        )
+    def _fit_metadata(self, metadata: dict) -> dict:
+        if self.metadata_token_budget is None or not metadata.get('overview'):
+            return metadata
+
+        fixed = estimate_tokens(self.metadata_template.render(**dict(metadata, overview='')))
+        return dict(metadata, overview=trim_to_tokens(metadata['overview'], self.metadata_token_budget - fixed))
+
+    def generate_answer_prompt(self, answer: str, title: str | None = None) -> str:
+        return self.answer_template.render(answer=answer, title=title)
 
-    def generate_answer_prompt(self, answer: str) -> str:
-        template = self.env.get_template('prompt_answer_cn.jinja')
-        return template.render(answer=answer)
+    def generate_answer_batch_prompt(self, answers: List[str], title: str) -> str:
+        return self.answer_batch_template.render(answers=[inline_answer(answer) for answer in answers], title=title)
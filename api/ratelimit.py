@@ -0,0 +1,177 @@
+import threading
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from datetime import date
+
+from cachetools import TTLCache
+
+from api.config import Settings
+
+
+@dataclass
+class RateLimitResult:
+    allowed: bool
+    remaining: float
+    retry_after: float
+
+
+# token bucket per client: up to `burst` requests at once, refilled at `per_minute` tokens per minute,
+# plus one daily cap shared by all clients that protects the LLM budget
+class RateLimiter(ABC):
+
+    def __init__(self, burst: int, per_minute: float, daily_limit: int):
+        self.burst = burst
+        self.rate = per_minute / 60
+        self.daily_limit = daily_limit
+
+    @abstractmethod
+    async def acquire(self, key: str) -> RateLimitResult:
+        ...
+
+    # counts quizzes against the daily cap, False if they do not fit anymore
+    @abstractmethod
+    async def acquire_daily(self, count: int = 1) -> bool:
+        ...
+
+    @abstractmethod
+    async def daily_count(self) -> int:
+        ...
+
+    async def close(self):
+        pass
+
+    def _refill_seconds(self) -> float:
+        # after this long a bucket is full again and equal to a fresh one, so it can be dropped
+        return self.burst / self.rate if self.rate else 24 * 60 * 60
+
+
+class MemoryRateLimiter(RateLimiter):
+
+    def __init__(self, burst: int, per_minute: float, daily_limit: int, maxsize: int = 10000):
+        super().__init__(burst, per_minute, daily_limit)
+        # the lock keeps updates atomic when called from threadpool threads as well
+        self.lock = threading.Lock()
+        self.buckets: TTLCache = TTLCache(maxsize=maxsize, ttl=self._refill_seconds(), timer=time.monotonic)
+        self.day = date.today()
+        self.count = 0
+
+    async def acquire(self, key: str) -> RateLimitResult:
+        with self.lock:
+            now = time.monotonic()
+            tokens, updated = self.buckets.get(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+
+            if tokens >= 1:
+                self.buckets[key] = (tokens - 1, now)
+                return RateLimitResult(allowed=True, remaining=tokens - 1, retry_after=0.0)
+
+            self.buckets[key] = (tokens, now)
+            return RateLimitResult(allowed=False, remaining=tokens, retry_after=(1 - tokens) / self.rate if self.rate else float('inf'))
+
+    def _reset_if_new_day(self):
+        if date.today() > self.day:
+            self.day = date.today()
+            self.count = 0
+
+    async def acquire_daily(self, count: int = 1) -> bool:
+        with self.lock:
+            self._reset_if_new_day()
+            if self.count + count > self.daily_limit:
+                return False
+            self.count += count
+            return True
+
+    async def daily_count(self) -> int:
+        with self.lock:
+            self._reset_if_new_day()
+            return self.count
+
+
+# refills and takes a token in one step on the redis server, using the server clock so workers on
+# different hosts agree on the time
+TOKEN_BUCKET_SCRIPT = """
+local burst = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local ttl = tonumber(ARGV[3])
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(state[1]) or burst
+local updated = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - updated) * rate)
+
+local allowed = 0
+local retry_after = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+elseif rate > 0 then
+    retry_after = (1 - tokens) / rate
+else
+    retry_after = ttl
+end
+
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+redis.call('EXPIRE', KEYS[1], ttl)
+return {allowed, tostring(tokens), tostring(retry_after)}
+"""
+
+
+class RedisRateLimiter(RateLimiter):
+
+    def __init__(self, client, burst: int, per_minute: float, daily_limit: int, prefix: str = 'movie-detectives:ratelimit:'):
+        super().__init__(burst, per_minute, daily_limit)
+        self.client = client
+        self.prefix = prefix
+        self.script = client.register_script(TOKEN_BUCKET_SCRIPT)
+
+    def _daily_key(self) -> str:
+        return f'{self.prefix}daily:{date.today().isoformat()}'
+
+    async def acquire(self, key: str) -> RateLimitResult:
+        allowed, remaining, retry_after = await self.script(
+            keys=[f'{self.prefix}bucket:{key}'],
+            args=[self.burst, self.rate, max(1, int(self._refill_seconds()) + 1)]
+        )
+        return RateLimitResult(allowed=bool(allowed), remaining=float(remaining), retry_after=float(retry_after))
+
+    async def acquire_daily(self, count: int = 1) -> bool:
+        key = self._daily_key()
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.incrby(key, count)
+            pipe.expire(key, 2 * 24 * 60 * 60)
+            total, _ = await pipe.execute()
+
+        # roll back, so the counter only reflects quizzes that were allowed
+        if total > self.daily_limit:
+            await self.client.decrby(key, count)
+            return False
+        return True
+
+    async def daily_count(self) -> int:
+        return int(await self.client.get(self._daily_key()) or 0)
+
+    async def close(self):
+        await self.client.aclose()
+
+
+def create_rate_limiter(settings: Settings) -> RateLimiter:
+    if settings.rate_limit_backend == 'redis':
+        # optional dependency, only needed for the redis backend
+        from redis.asyncio import Redis
+
+        return RedisRateLimiter(
+            Redis.from_url(settings.redis_url),
+            settings.rate_limit_burst,
+            settings.rate_limit_per_minute,
+            settings.quiz_rate_limit
+        )
+
+    return MemoryRateLimiter(
+        settings.rate_limit_burst,
+        settings.rate_limit_per_minute,
+        settings.quiz_rate_limit,
+        settings.rate_limit_maxsize
+    )
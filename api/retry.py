@@ -0,0 +1,98 @@
+import asyncio
+import logging
+import random
+from contextvars import ContextVar
+from typing import Awaitable, Callable, Dict, Optional, TypeVar
+
+import httpx
+
+from api.common import RetryStats
+from api.metrics import RETRIES
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class RetryBudget:
+
+    def __init__(self, max_retries: int):
+        self.remaining = max_retries
+
+    def take(self) -> bool:
+        if self.remaining <= 0:
+            return False
+        self.remaining -= 1
+        return True
+
+
+# budget shared by all stages of one request, requests without a budget are only bounded per stage
+retry_budget: ContextVar[Optional[RetryBudget]] = ContextVar('retry_budget', default=None)
+
+
+def is_retryable_http_error(e: BaseException) -> bool:
+    if isinstance(e, httpx.HTTPStatusError):
+        return e.response.status_code in RETRYABLE_STATUS_CODES
+    return isinstance(e, httpx.TransportError)
+
+
+def is_parse_error(e: BaseException) -> bool:
+    return isinstance(e, ValueError)
+
+
+def _cause(e: BaseException) -> str:
+    if isinstance(e, httpx.HTTPStatusError):
+        return f'http_{e.response.status_code}'
+    return type(e).__name__
+
+
+def _retry_after(e: BaseException) -> float:
+    if isinstance(e, httpx.HTTPStatusError):
+        try:
+            return float(e.response.headers.get('Retry-After', 0))
+        except ValueError:
+            return 0.0
+    return 0.0
+
+
+# retries a single stage (one tmdb request, one llm call) with exponential backoff and full jitter
+class Retrier:
+
+    def __init__(self, max_attempts: int, base_delay: float, max_delay: float):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retries: Dict[str, int] = {}
+        self.exhausted = 0
+
+    def delay(self, attempt: int, e: BaseException) -> float:
+        backoff = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+        # honour Retry-After from rate limited upstreams, but never wait longer than max_delay
+        return min(self.max_delay, max(backoff, _retry_after(e)))
+
+    async def run(self, stage: str, func: Callable[[], Awaitable[T]], retry_if: Callable[[BaseException], bool]) -> T:
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                return await func()
+            except Exception as e:
+                if not retry_if(e):
+                    raise
+
+                budget = retry_budget.get()
+                if attempt >= self.max_attempts or (budget is not None and not budget.take()):
+                    self.exhausted += 1
+                    logger.error('giving up on %s after %d attempts: %s', stage, attempt, e)
+                    raise
+
+                key = f'{stage}:{_cause(e)}'
+                self.retries[key] = self.retries.get(key, 0) + 1
+                RETRIES.labels(stage, _cause(e)).inc()
+                logger.warning('retrying %s after error: %s', stage, e)
+                await asyncio.sleep(self.delay(attempt, e))
+
+    def stats(self) -> RetryStats:
+        return RetryStats(retries=dict(self.retries), exhausted=self.exhausted)
@@ -0,0 +1,197 @@
+import asyncio
+import logging
+import time
+import uuid
+from contextlib import suppress
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from cachetools import TTLCache
+
+from api.common import MAX_ANSWER_LENGTH, BaseAnswer, BaseQuestion, RoomResponse, RoomResult, RoomScore
+from api.config import QuizConfig
+
+logger = logging.getLogger(__name__)
+
+Send = Callable[[dict], Awaitable[None]]
+
+
+class RoomError(Exception):
+    pass
+
+
+class Room:
+
+    def __init__(self, room_id: str, quiz_config: QuizConfig, round_seconds: float):
+        self.room_id = room_id
+        self.quiz_config = quiz_config
+        self.round_seconds = round_seconds
+        self.members: Dict[str, Send] = {}
+        self.scores: Dict[str, int] = {}
+
+        self.round = 0
+        self.question: Optional[BaseQuestion] = None
+        self.movie: Optional[dict] = None
+        self.deadline: Optional[datetime] = None
+        self.answers: Dict[str, str] = {}
+        # set once every member has answered, the round is then graded before the deadline
+        self.all_answered = asyncio.Event()
+        # serializes round starts, generating the question takes a while
+        self.lock = asyncio.Lock()
+
+    @property
+    def accepting_answers(self) -> bool:
+        return self.question is not None
+
+    def scoreboard(self) -> List[RoomScore]:
+        return [
+            RoomScore(player=player, points=points)
+            for player, points in sorted(self.scores.items(), key=lambda item: (-item[1], item[0]))
+        ]
+
+    def response(self) -> RoomResponse:
+        return RoomResponse(
+            room_id=self.room_id,
+            config=self.quiz_config,
+            round_seconds=self.round_seconds,
+            round=self.round,
+            players=list(self.members),
+            question=self.question,
+            deadline=self.deadline,
+            scoreboard=self.scoreboard()
+        )
+
+
+# one question per round is broadcast to every member of a room, the answers are collected until the
+# deadline and graded together. rooms live in the memory of one worker, so websockets of a room must
+# reach the worker that created it (sticky sessions when running several workers).
+class RoomManager:
+
+    def __init__(
+        self,
+        generate: Callable[[QuizConfig], Awaitable[Tuple[BaseQuestion, dict]]],
+        grade: Callable[[dict, List[str]], Awaitable[List[BaseAnswer]]],
+        maxsize: int,
+        ttl: float,
+        max_players: int,
+        send_timeout: float = 5.0
+    ):
+        self.generate = generate
+        # gets the distinct answers of a round, returns one result per answer
+        self.grade = grade
+        self.max_players = max_players
+        # a stalled client must not hold up the round for everyone else
+        self.send_timeout = send_timeout
+        self.rooms: TTLCache = TTLCache(maxsize=maxsize, ttl=ttl, timer=time.monotonic)
+        self._round_tasks: Set[asyncio.Task] = set()
+
+    def create(self, quiz_config: QuizConfig, round_seconds: float) -> Room:
+        room = Room(str(uuid.uuid4()), quiz_config, round_seconds)
+        self.rooms[room.room_id] = room
+        return room
+
+    def get(self, room_id: str) -> Optional[Room]:
+        room = self.rooms.get(room_id)
+        if room:
+            # active rooms are kept, idle ones expire
+            self.rooms[room_id] = room
+        return room
+
+    def join(self, room: Room, player: str, send: Send):
+        if player in room.members:
+            raise RoomError(f'Player {player} already joined')
+        if len(room.members) >= self.max_players:
+            raise RoomError('Room is full')
+
+        room.members[player] = send
+        room.scores.setdefault(player, 0)
+
+    def leave(self, room: Room, player: str):
+        room.members.pop(player, None)
+        if room.accepting_answers and room.members and room.members.keys() <= room.answers.keys():
+            room.all_answered.set()
+
+    async def start_round(self, room: Room) -> Room:
+        async with room.lock:
+            if room.accepting_answers:
+                raise RoomError('Round is still running')
+
+            question, movie = await self.generate(room.quiz_config)
+            room.round += 1
+            room.question, room.movie = question, movie
+            room.answers = {}
+            room.all_answered = asyncio.Event()
+            room.deadline = datetime.fromtimestamp(time.time() + room.round_seconds)
+
+            task = asyncio.create_task(self._finish_round(room))
+            self._round_tasks.add(task)
+            task.add_done_callback(self._round_tasks.discard)
+
+        await self.broadcast(room, {
+            'type': 'question',
+            'round': room.round,
+            'question': question.model_dump(),
+            'deadline': room.deadline.isoformat()
+        })
+        return room
+
+    # the first answer of a player counts, answers are graded together in one prompt and stay short
+    def answer(self, room: Room, player: str, answer: str) -> bool:
+        if not room.accepting_answers or player not in room.members or player in room.answers:
+            return False
+        if len(answer) > MAX_ANSWER_LENGTH:
+            return False
+
+        room.answers[player] = answer.strip()
+        if room.members.keys() <= room.answers.keys():
+            room.all_answered.set()
+        return True
+
+    async def _finish_round(self, room: Room):
+        round_number = room.round
+        with suppress(TimeoutError):
+            async with asyncio.timeout(room.round_seconds):
+                await room.all_answered.wait()
+
+        answers, movie = room.answers, room.movie
+        room.question, room.deadline = None, None
+
+        try:
+            # players giving the same answer share one grading
+            distinct = list(dict.fromkeys(answers.values()))
+            graded = dict(zip(distinct, await self.grade(movie, distinct))) if distinct else {}
+        except Exception as e:
+            logger.warning('could not grade round %d of room %s: %s', round_number, room.room_id, e)
+            await self.broadcast(room, {'type': 'error', 'detail': f'Could not grade round: {e}'})
+            return
+
+        results = []
+        for player, answer in answers.items():
+            result = graded[answer]
+            room.scores[player] = room.scores.get(player, 0) + result.points
+            results.append(RoomResult(player=player, answer=answer, result=result))
+
+        await self.broadcast(room, {
+            'type': 'results',
+            'round': round_number,
+            'movie': movie,
+            'results': [result.model_dump() for result in results],
+            'scoreboard': [score.model_dump() for score in room.scoreboard()]
+        })
+
+    async def broadcast(self, room: Room, event: dict):
+        members = list(room.members.items())
+        sent = await asyncio.gather(
+            *(asyncio.wait_for(send(event), self.send_timeout) for _, send in members),
+            return_exceptions=True
+        )
+        # members that cannot be reached anymore or do not keep up are dropped
+        for (player, _), result in zip(members, sent):
+            if isinstance(result, Exception):
+                logger.debug('dropping player %s of room %s: %s', player, room.room_id, result)
+                self.leave(room, player)
+
+    async def close(self):
+        for task in self._round_tasks:
+            task.cancel()
+        await asyncio.gather(*self._round_tasks, return_exceptions=True)
@@ -0,0 +1,178 @@
+import json
+import time
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import List, Optional
+
+from cachetools import TLRUCache
+
+from api.common import BaseQuestion, SessionData
+from api.config import Settings
+from api.metrics import SESSION_EVICTIONS
+
+
+# compact, pickle-free wire format: a JSON array instead of a keyed object
+def dump_session(session: SessionData) -> str:
+    return json.dumps([
+        session.quiz_id,
+        session.movie_id,
+        session.question.question,
+        session.question.hint1,
+        session.question.hint2,
+        session.started_at.timestamp(),
+        session.popularity,
+        session.personality,
+        session.language
+    ], ensure_ascii=False, separators=(',', ':'))
+
+
+def load_session(data: str | bytes) -> SessionData:
+    # sessions written before the quiz config was stored only have the first six fields
+    quiz_id, movie_id, question, hint1, hint2, started_at, *config = json.loads(data)
+    return SessionData(
+        quiz_id,
+        movie_id,
+        BaseQuestion(question=question, hint1=hint1, hint2=hint2),
+        datetime.fromtimestamp(started_at),
+        *config
+    )
+
+
+class SessionStore(ABC):
+
+    def __init__(self, maxsize: int, ttl: int):
+        self.maxsize = maxsize
+        self.ttl = ttl
+
+    @abstractmethod
+    async def get(self, quiz_id: str) -> Optional[SessionData]:
+        ...
+
+    @abstractmethod
+    async def set(self, session: SessionData, ttl: Optional[int] = None):
+        ...
+
+    # get and delete in one step, so a quiz can only be answered once
+    @abstractmethod
+    async def pop(self, quiz_id: str) -> Optional[SessionData]:
+        ...
+
+    @abstractmethod
+    async def values(self) -> List[SessionData]:
+        ...
+
+    @abstractmethod
+    async def size(self) -> int:
+        ...
+
+    async def close(self):
+        pass
+
+
+class _EvictingCache(TLRUCache):
+
+    # only called when the cache is full, expired entries are dropped without it
+    def popitem(self):
+        item = super().popitem()
+        SESSION_EVICTIONS.inc()
+        return item
+
+
+class MemorySessionStore(SessionStore):
+
+    def __init__(self, maxsize: int, ttl: int):
+        super().__init__(maxsize, ttl)
+        # entries are (session, ttl) tuples, so every entry can expire on its own schedule
+        self.cache: TLRUCache = _EvictingCache(maxsize=maxsize, ttu=lambda _, entry, now: now + entry[1])
+
+    async def get(self, quiz_id: str) -> Optional[SessionData]:
+        entry = self.cache.get(quiz_id)
+        return entry[0] if entry else None
+
+    async def set(self, session: SessionData, ttl: Optional[int] = None):
+        self.cache[session.quiz_id] = (session, ttl or self.ttl)
+
+    async def pop(self, quiz_id: str) -> Optional[SessionData]:
+        entry = self.cache.pop(quiz_id, None)
+        return entry[0] if entry else None
+
+    async def values(self) -> List[SessionData]:
+        return [session for session, _ in self.cache.values()]
+
+    async def size(self) -> int:
+        self.cache.expire()
+        return len(self.cache)
+
+
+class RedisSessionStore(SessionStore):
+
+    # sessions are stored as plain keys with an expiry, a sorted set indexes them by expiry
+    # time so the size bound and the listing do not need a keyspace scan
+    def __init__(self, client, maxsize: int, ttl: int, prefix: str = 'movie-detectives:session:'):
+        super().__init__(maxsize, ttl)
+        self.client = client
+        self.prefix = prefix
+        self.index_key = f'{prefix}index'
+
+    def _key(self, quiz_id: str) -> str:
+        return f'{self.prefix}{quiz_id}'
+
+    async def _prune(self):
+        await self.client.zremrangebyscore(self.index_key, '-inf', time.time())
+
+    async def get(self, quiz_id: str) -> Optional[SessionData]:
+        data = await self.client.get(self._key(quiz_id))
+        return load_session(data) if data else None
+
+    async def set(self, session: SessionData, ttl: Optional[int] = None):
+        ttl = ttl or self.ttl
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.set(self._key(session.quiz_id), dump_session(session), ex=ttl)
+            pipe.zadd(self.index_key, {session.quiz_id: time.time() + ttl})
+            pipe.zremrangebyscore(self.index_key, '-inf', time.time())
+            pipe.zcard(self.index_key)
+            *_, size = await pipe.execute()
+
+        # evict the sessions closest to expiry once the store is full
+        if size > self.maxsize:
+            evicted = await self.client.zpopmin(self.index_key, size - self.maxsize)
+            if evicted:
+                SESSION_EVICTIONS.inc(len(evicted))
+                await self.client.delete(*(self._key(self._decode(quiz_id)) for quiz_id, _ in evicted))
+
+    async def pop(self, quiz_id: str) -> Optional[SessionData]:
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.getdel(self._key(quiz_id))
+            pipe.zrem(self.index_key, quiz_id)
+            data, _ = await pipe.execute()
+        return load_session(data) if data else None
+
+    async def values(self) -> List[SessionData]:
+        await self._prune()
+        quiz_ids = await self.client.zrange(self.index_key, 0, -1)
+        if not quiz_ids:
+            return []
+
+        data = await self.client.mget([self._key(self._decode(quiz_id)) for quiz_id in quiz_ids])
+        return [load_session(entry) for entry in data if entry]
+
+    async def size(self) -> int:
+        await self._prune()
+        return await self.client.zcard(self.index_key)
+
+    async def close(self):
+        await self.client.aclose()
+
+    @staticmethod
+    def _decode(value: str | bytes) -> str:
+        return value.decode() if isinstance(value, bytes) else value
+
+
+def create_session_store(settings: Settings) -> SessionStore:
+    if settings.session_backend == 'redis':
+        # optional dependency, only needed for the redis backend
+        from redis.asyncio import Redis
+
+        return RedisSessionStore(Redis.from_url(settings.redis_url), settings.session_maxsize, settings.session_ttl)
+
+    return MemorySessionStore(settings.session_maxsize, settings.session_ttl)
@@ -0,0 +1,35 @@
+import asyncio
+from typing import Awaitable, Callable, Dict, Hashable, TypeVar
+
+from api.metrics import COALESCED
+
+T = TypeVar('T')
+
+
+# concurrent calls with the same key share one upstream call and its result or error
+class SingleFlight:
+
+    def __init__(self, name: str):
+        self.name = name
+        self.calls: Dict[Hashable, asyncio.Task] = {}
+        self.coalesced = 0
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[T]]) -> T:
+        task = self.calls.get(key)
+        if task is not None:
+            self.coalesced += 1
+            COALESCED.labels(self.name).inc()
+        else:
+            task = asyncio.create_task(func())
+            self.calls[key] = task
+            task.add_done_callback(lambda _: self._done(key, task))
+
+        # a cancelled caller must not cancel the call the others are waiting for
+        return await asyncio.shield(task)
+
+    def _done(self, key: Hashable, task: asyncio.Task):
+        if self.calls.get(key) is task:
+            del self.calls[key]
+        # retrieved here, in case every caller was cancelled before the call failed
+        if not task.cancelled():
+            task.exception()
@@ -0,0 +1,251 @@
+import asyncio
+import fcntl
+import logging
+import os
+import pickle
+import socket
+import threading
+import time
+import uuid
+from contextlib import contextmanager, suppress
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from pydantic import BaseModel
+
+from api.common import Distribution, SessionData, Stats, StatsGroup
+from api.config import QuizConfig
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+BASE_FILE = 'base.json'
+LOCK_FILE = '.lock'
+
+
+# stats of workers that are gone, folded into one file
+class CompactedStats(BaseModel):
+    stats: Stats = Stats()
+    # shards already folded into the stats, skipped on read until they are deleted
+    compacted: List[str] = []
+
+
+def _observe(distribution: Distribution, value: float):
+    bucket = next((str(bound) for bound in LATENCY_BUCKETS if value <= bound), '+Inf')
+    distribution.count += 1
+    distribution.total += value
+    distribution.buckets[bucket] = distribution.buckets.get(bucket, 0) + 1
+
+
+def _merge_counts(a: Dict[str, int], b: Dict[str, int]) -> Dict[str, int]:
+    return {key: a.get(key, 0) + b.get(key, 0) for key in a.keys() | b.keys()}
+
+
+def _merge_distribution(a: Distribution, b: Distribution) -> Distribution:
+    return Distribution(count=a.count + b.count, total=a.total + b.total, buckets=_merge_counts(a.buckets, b.buckets))
+
+
+def _merge_group(a: StatsGroup, b: StatsGroup) -> StatsGroup:
+    return StatsGroup(
+        quiz_count=a.quiz_count + b.quiz_count,
+        answer_count=a.answer_count + b.answer_count,
+        points_total=a.points_total + b.points_total,
+        points=_merge_counts(a.points, b.points),
+        quiz_latency=_merge_distribution(a.quiz_latency, b.quiz_latency),
+        answer_latency=_merge_distribution(a.answer_latency, b.answer_latency)
+    )
+
+
+def _merge_groups(a: Dict[str, StatsGroup], b: Dict[str, StatsGroup]) -> Dict[str, StatsGroup]:
+    return {key: _merge_group(a.get(key, StatsGroup()), b.get(key, StatsGroup())) for key in a.keys() | b.keys()}
+
+
+def merge_stats(a: Stats, b: Stats) -> Stats:
+    return Stats(
+        quiz_count_total=a.quiz_count_total + b.quiz_count_total,
+        points_total=a.points_total + b.points_total,
+        by_personality=_merge_groups(a.by_personality, b.by_personality),
+        by_language=_merge_groups(a.by_language, b.by_language),
+        by_popularity=_merge_groups(a.by_popularity, b.by_popularity),
+        by_provider=_merge_groups(a.by_provider, b.by_provider)
+    )
+
+
+def _write_atomic(path: Path, data: str):
+    # readers and a crash at any point see either the old or the new file, never a partial one
+    tmp_path = path.with_name(f'.{path.name}.tmp')
+    with tmp_path.open('w', encoding='utf-8') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+# every worker writes its own shard, readers merge all shards. shards of workers that stopped or
+# died are compacted into base.json, so the directory does not grow with every restart.
+class StatsStore:
+
+    def __init__(self, directory: str, snapshot_interval: float, stale_after: float, legacy_path: Optional[str] = None):
+        self.directory = Path(directory)
+        self.snapshot_interval = snapshot_interval
+        self.stale_after = stale_after
+        # single stats.pkl of versions before the sharded store
+        self.legacy_path = Path(legacy_path) if legacy_path else None
+        self.worker_id = f'{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}'
+        self.shard_path = self.directory / f'worker-{self.worker_id}.json'
+
+        self.stats = Stats()
+        self.lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    def _groups(self, personality: str, language: str, popularity: int) -> List[StatsGroup]:
+        return [
+            self.stats.by_personality.setdefault(personality, StatsGroup()),
+            self.stats.by_language.setdefault(language, StatsGroup()),
+            self.stats.by_popularity.setdefault(str(popularity), StatsGroup())
+        ]
+
+    def record_quiz(self, quiz_config: QuizConfig, latency: float):
+        with self.lock:
+            self.stats.quiz_count_total += 1
+            for group in self._groups(quiz_config.personality, quiz_config.language, quiz_config.popularity):
+                group.quiz_count += 1
+                _observe(group.quiz_latency, latency)
+
+    def record_answer(self, session: SessionData, points: int, latency: float):
+        with self.lock:
+            self.stats.points_total += points
+            for group in self._groups(session.personality, session.language, session.popularity):
+                group.answer_count += 1
+                group.points_total += points
+                group.points[str(points)] = group.points.get(str(points), 0) + 1
+                _observe(group.answer_latency, latency)
+
+    def record_provider(self, provider: str, kind: str, latency: float):
+        with self.lock:
+            group = self.stats.by_provider.setdefault(provider, StatsGroup())
+            if kind == 'question':
+                group.quiz_count += 1
+                _observe(group.quiz_latency, latency)
+            else:
+                group.answer_count += 1
+                _observe(group.answer_latency, latency)
+
+    @contextmanager
+    def _file_lock(self, exclusive: bool):
+        with (self.directory / LOCK_FILE).open('a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def snapshot(self):
+        with self.lock:
+            data = self.stats.model_dump_json()
+        _write_atomic(self.shard_path, data)
+
+    def _load_compacted(self) -> CompactedStats:
+        path = self.directory / BASE_FILE
+        if not path.exists():
+            return CompactedStats()
+        return CompactedStats.model_validate_json(path.read_text(encoding='utf-8'))
+
+    def _shards(self) -> List[Path]:
+        return sorted(self.directory.glob('worker-*.json'))
+
+    def load(self) -> Stats:
+        with self._file_lock(exclusive=False):
+            compacted = self._load_compacted()
+            stats = compacted.stats
+            for path in self._shards():
+                # the own shard is merged from memory, it is fresher than the last snapshot
+                if path.name in compacted.compacted or path == self.shard_path:
+                    continue
+                try:
+                    stats = merge_stats(stats, Stats.model_validate_json(path.read_text(encoding='utf-8')))
+                except (OSError, ValueError) as e:
+                    logger.warning('could not read stats shard %s: %s', path, e)
+
+        with self.lock:
+            return merge_stats(stats, self.stats)
+
+    def compact(self, include_own: bool = False):
+        with self._file_lock(exclusive=True):
+            compacted = self._load_compacted()
+            shards = self._shards()
+            names = {path.name for path in shards}
+
+            # deleted shards no longer need to be skipped
+            compacted.compacted = [name for name in compacted.compacted if name in names]
+
+            now = time.time()
+            for path in shards:
+                if path.name in compacted.compacted:
+                    continue
+                if path != self.shard_path and now - path.stat().st_mtime < self.stale_after:
+                    continue
+                if path == self.shard_path and not include_own:
+                    continue
+                try:
+                    compacted.stats = merge_stats(compacted.stats, Stats.model_validate_json(path.read_text(encoding='utf-8')))
+                except (OSError, ValueError) as e:
+                    logger.warning('dropping unreadable stats shard %s: %s', path, e)
+                compacted.compacted.append(path.name)
+
+            # the base file is written before any shard is deleted, a crash in between is harmless
+            _write_atomic(self.directory / BASE_FILE, compacted.model_dump_json())
+            for name in compacted.compacted:
+                with suppress(FileNotFoundError):
+                    (self.directory / name).unlink()
+            compacted.compacted = []
+            _write_atomic(self.directory / BASE_FILE, compacted.model_dump_json())
+
+    # folded into base.json once, the file is renamed afterwards so no worker imports it again
+    def import_legacy(self):
+        if not self.legacy_path:
+            return
+
+        with self._file_lock(exclusive=True):
+            if not self.legacy_path.exists():
+                return
+            try:
+                with self.legacy_path.open('rb') as f:
+                    legacy = pickle.load(f)
+                stats = Stats(quiz_count_total=legacy.quiz_count_total, points_total=legacy.points_total)
+            except (OSError, EOFError, AttributeError, pickle.UnpicklingError) as e:
+                logger.warning('could not import legacy stats %s: %s', self.legacy_path, e)
+                return
+
+            compacted = self._load_compacted()
+            compacted.stats = merge_stats(compacted.stats, stats)
+            _write_atomic(self.directory / BASE_FILE, compacted.model_dump_json())
+            os.replace(self.legacy_path, self.legacy_path.with_name(f'{self.legacy_path.name}.imported'))
+        logger.info('imported legacy stats from %s', self.legacy_path)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.snapshot_interval)
+            try:
+                await asyncio.to_thread(self.snapshot)
+                await asyncio.to_thread(self.compact)
+            except OSError as e:
+                logger.warning('could not persist stats: %s', e)
+
+    def start(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self.import_legacy()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+        # final snapshot, then fold it into the base file right away
+        await asyncio.to_thread(self.snapshot)
+        await asyncio.to_thread(self.compact, True)
+        with self.lock:
+            self.stats = Stats()
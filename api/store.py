@@ -0,0 +1,280 @@
+import asyncio
+import json
+import logging
+import os
+import random
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set
+
+import httpx
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# movies per page, same as TMDB discover
+PAGE_SIZE = 20
+# TMDB keeps movie changes of the last 14 days
+MAX_CHANGES_DAYS = 14
+
+
+def read_snapshot(path: str) -> List[dict]:
+    # a directory is read file by file, in name order
+    files = sorted(Path(path).glob('*.json*')) if os.path.isdir(path) else [Path(path)]
+
+    movies = []
+    for file in files:
+        with open(file, encoding='utf-8') as f:
+            if file.suffix == '.jsonl':
+                movies.extend(json.loads(line) for line in f if line.strip())
+                continue
+
+            data = json.load(f)
+        # details like movie.json, a list of them or a discover page
+        if isinstance(data, dict):
+            data = data['results'] if 'results' in data else [data]
+        movies.extend(data)
+    return movies
+
+
+def write_snapshot(path: str, movies: Iterable[dict]):
+    # written next to the snapshot and renamed, a crash never leaves half a snapshot behind
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        if path.endswith('.jsonl'):
+            f.writelines(json.dumps(movie, ensure_ascii=False) + '\n' for movie in movies)
+        else:
+            json.dump(list(movies), f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def _release_year(movie: dict) -> int:
+    release_date = movie.get('release_date') or ''
+    return int(release_date[:4]) if release_date[:4].isdigit() else 0
+
+
+def _adult(movie: dict) -> bool:
+    # crawled files may carry the flag as a string, like movie.json
+    return str(movie.get('adult')).lower() == 'true'
+
+
+def _genre_ids(movie: dict) -> List[int]:
+    # discover results carry genre_ids, details carry genres
+    if 'genre_ids' in movie:
+        return movie['genre_ids']
+    return [genre['id'] for genre in movie.get('genres') or []]
+
+
+class _Columns:
+
+    def __init__(self, movies: List[dict], genre_bits: Dict[int, int]):
+        self.genre_bits = genre_bits
+        # rows are ordered like discover results, most popular first
+        self.movies = sorted(movies, key=lambda movie: -(movie.get('popularity') or 0.0))
+        self.ids = np.array([movie['id'] for movie in self.movies], dtype=np.int64)
+        self.vote_average = np.array([movie.get('vote_average') or 0.0 for movie in self.movies], dtype=np.float32)
+        self.vote_count = np.array([movie.get('vote_count') or 0 for movie in self.movies], dtype=np.int64)
+        self.popularity = np.array([movie.get('popularity') or 0.0 for movie in self.movies], dtype=np.float32)
+        self.year = np.array([_release_year(movie) for movie in self.movies], dtype=np.int16)
+        self.original_language = np.array([movie.get('original_language') or '' for movie in self.movies], dtype=str)
+        # one bit per genre id, a genre filter is a single bitwise and
+        self.genres = np.array([
+            sum(1 << genre_bits[genre_id] for genre_id in _genre_ids(movie) if genre_id in genre_bits)
+            for movie in self.movies
+        ], dtype=np.uint64)
+        self.rows: Dict[int, int] = {movie['id']: row for row, movie in enumerate(self.movies)}
+
+
+# movies of a TMDB snapshot, kept as numpy columns so discover style filters are vectorized.
+# the columns are rebuilt on every change and swapped in at once, readers never see a partial update
+class MovieStore:
+
+    def __init__(self):
+        self.columns = _Columns([], {})
+        self.loaded_at: Optional[datetime] = None
+        # start of the next /movie/changes window
+        self.updated_at: Optional[datetime] = None
+
+    def __len__(self) -> int:
+        return len(self.columns.movies)
+
+    def __contains__(self, movie_id: int) -> bool:
+        return movie_id in self.columns.rows
+
+    # new columns for the movies, the genre bits of the current columns keep their positions
+    def _build(self, movies: List[dict]) -> _Columns:
+        genre_bits = dict(self.columns.genre_bits)
+        for genre_id in sorted({genre_id for movie in movies for genre_id in _genre_ids(movie)} - genre_bits.keys()):
+            if len(genre_bits) == 64:
+                logger.warning('movie store supports 64 genres, ignoring genre %s', genre_id)
+                continue
+            genre_bits[genre_id] = len(genre_bits)
+        return _Columns(movies, genre_bits)
+
+    def load(self, path: str):
+        movies = read_snapshot(path)
+        self.replace(movies)
+        # changes since the snapshot was written are picked up by the next update
+        self.updated_at = datetime.fromtimestamp(os.path.getmtime(path))
+        logger.info('movie store loaded %d movies from %s', len(self), path)
+
+    def save(self, path: str):
+        write_snapshot(path, self.columns.movies)
+
+    def replace(self, movies: Iterable[dict]):
+        # the last record of a movie wins, adult movies are never served
+        by_id = {movie['id']: movie for movie in movies if not _adult(movie)}
+        self.columns = self._build(list(by_id.values()))
+        self.loaded_at = datetime.now()
+
+    # the columns with the changes applied, the store itself is left as it is until they are swapped in
+    def changed_columns(self, movies: Iterable[dict], removed: Iterable[int] = ()) -> _Columns:
+        by_id = {movie['id']: movie for movie in self.columns.movies}
+        for movie in movies:
+            if _adult(movie):
+                by_id.pop(movie['id'], None)
+            else:
+                by_id[movie['id']] = movie
+        for movie_id in removed:
+            by_id.pop(movie_id, None)
+        return self._build(list(by_id.values()))
+
+    def upsert(self, movies: Iterable[dict]):
+        self.columns = self.changed_columns(movies)
+
+    def remove(self, movie_ids: Iterable[int]):
+        self.columns = self.changed_columns([], movie_ids)
+
+    def get(self, movie_id: int) -> Optional[dict]:
+        columns = self.columns
+        row = columns.rows.get(movie_id)
+        return columns.movies[row] if row is not None else None
+
+    # the matching movies, most popular first
+    def filter(
+        self,
+        vote_avg_min: float = 0.0,
+        vote_count_min: float = 0.0,
+        year_min: Optional[int] = None,
+        year_max: Optional[int] = None,
+        genre_ids: Optional[List[int]] = None,
+        original_language: Optional[str] = None
+    ) -> List[dict]:
+        columns = self.columns
+        rows = self._rows(columns, vote_avg_min, vote_count_min, year_min, year_max, genre_ids, original_language)
+        return [columns.movies[row] for row in rows]
+
+    def _rows(
+        self,
+        columns: _Columns,
+        vote_avg_min: float,
+        vote_count_min: float,
+        year_min: Optional[int] = None,
+        year_max: Optional[int] = None,
+        genre_ids: Optional[List[int]] = None,
+        original_language: Optional[str] = None
+    ) -> np.ndarray:
+        mask = (columns.vote_average >= vote_avg_min) & (columns.vote_count >= vote_count_min)
+        if original_language is not None:
+            mask &= columns.original_language == original_language
+        if year_min is not None:
+            mask &= columns.year >= year_min
+        if year_max is not None:
+            # movies without a release date have year 0
+            mask &= (columns.year <= year_max) & (columns.year > 0)
+        if genre_ids:
+            # all given genres, like with_genres=a,b
+            if any(genre_id not in columns.genre_bits for genre_id in genre_ids):
+                return np.empty(0, dtype=np.int64)
+            bits = np.uint64(sum(1 << columns.genre_bits[genre_id] for genre_id in genre_ids))
+            mask &= (columns.genres & bits) == bits
+        return np.flatnonzero(mask)
+
+    def get_movies(self, page: int, vote_avg_min: float, vote_count_min: float, original_language: Optional[str] = None) -> List[dict]:
+        columns = self.columns
+        rows = self._rows(columns, vote_avg_min, vote_count_min, original_language=original_language)
+        rows = rows[(page - 1) * PAGE_SIZE:page * PAGE_SIZE]
+        return [columns.movies[row] for row in rows]
+
+    # any movie of the pages, None if the pages are empty
+    def get_random_movie(
+        self,
+        page_min: int,
+        page_max: int,
+        vote_avg_min: float,
+        vote_count_min: float,
+        original_language: Optional[str] = None
+    ) -> Optional[dict]:
+        columns = self.columns
+        rows = self._rows(columns, vote_avg_min, vote_count_min, original_language=original_language)
+        rows = rows[(page_min - 1) * PAGE_SIZE:page_max * PAGE_SIZE]
+        if not len(rows):
+            return None
+        return columns.movies[rows[random.randrange(len(rows))]]
+
+
+# applies TMDB's /movie/changes to the movies of the store, the snapshot file is rewritten afterwards
+class MovieStoreUpdater:
+
+    def __init__(self, store: MovieStore, tmdb_client, interval: float, concurrency: int, path: Optional[str] = None):
+        self.store = store
+        self.tmdb_client = tmdb_client
+        self.interval = interval
+        self.concurrency = concurrency
+        self.path = path
+        self.updated = 0
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            # noinspection PyBroadException
+            try:
+                await self.update()
+            except Exception as e:
+                logger.warning('error while updating movie store: %s', e)
+            await asyncio.sleep(self.interval)
+
+    async def update(self):
+        started = datetime.now()
+        # an older snapshot gets the changes TMDB still has
+        start_date = max(self.store.updated_at or started, started - timedelta(days=MAX_CHANGES_DAYS)).date()
+        changed = [
+            movie_id for movie_id in await self.tmdb_client.get_movie_changes(start_date, date.today())
+            if movie_id in self.store
+        ]
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+        movies: List[dict] = []
+        gone: Set[int] = set()
+
+        async def fetch(movie_id: int):
+            async with semaphore:
+                try:
+                    movies.append(await self.tmdb_client.refresh_movie_details(movie_id))
+                except httpx.HTTPStatusError as e:
+                    if e.response.status_code != 404:
+                        raise
+                    gone.add(movie_id)
+
+        await asyncio.gather(*(fetch(movie_id) for movie_id in changed))
+
+        # rebuilding the columns takes a while for a large snapshot, readers keep the old ones until the swap
+        self.store.columns = await asyncio.to_thread(self.store.changed_columns, movies, gone)
+        self.store.updated_at = started
+        self.updated += len(movies) + len(gone)
+        # a snapshot directory is left as it is, only single file snapshots are rewritten
+        if self.path and os.path.isfile(self.path) and (movies or gone):
+            await asyncio.to_thread(self.store.save, self.path)
+        logger.info('movie store updated: %d changed, %d removed', len(movies), len(gone))
@@ -0,0 +1,65 @@
+import json
+from typing import Dict, List, Tuple
+
+from api.parsing import field_for_label, fill_positional, parse_line
+
+QUESTION_FIELDS = ('question', 'hint1', 'hint2')
+ANSWER_FIELDS = ('points', 'answer')
+
+
+# assigns the template lines of a streamed chat reply to the expected fields with the rules of
+# parse_fields: known labels as soon as their line is complete, unknown labels only on close()
+class StreamingFieldParser:
+
+    def __init__(self, fields: Tuple[str, ...]):
+        self.fields = fields
+        self.values: Dict[str, str] = {}
+        self._buffer = ''
+        self._line_count = 0
+        self._unlabelled: List[str] = []
+
+    @property
+    def complete(self) -> bool:
+        return len(self.values) == len(self.fields)
+
+    def feed(self, chunk: str) -> List[Tuple[str, str]]:
+        self._buffer += chunk
+        *lines, self._buffer = self._buffer.split('\n')
+        return self._parse_lines(lines)
+
+    def close(self) -> List[Tuple[str, str]]:
+        lines, self._buffer = [self._buffer], ''
+        parsed = self._parse_lines(lines)
+
+        values = fill_positional(self.values, self._unlabelled, self._line_count, self.fields)
+        for field in self.fields:
+            if field in values and field not in self.values:
+                self.values[field] = values[field]
+                parsed.append((field, values[field]))
+        return parsed
+
+    def _parse_lines(self, lines: List[str]) -> List[Tuple[str, str]]:
+        parsed = []
+        for line in lines:
+            if self.complete:
+                break
+
+            line = parse_line(line)
+            if not line:
+                continue
+
+            self._line_count += 1
+            label, value = line
+            field = field_for_label(label, self.fields)
+            if field is None:
+                self._unlabelled.append(value)
+                continue
+            if field in self.values:
+                continue
+            self.values[field] = value
+            parsed.append((field, self.values[field]))
+        return parsed
+
+
+def sse_event(event: str, data) -> str:
+    return f'event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n'
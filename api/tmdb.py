@@ -1,16 +1,108 @@
+import asyncio
+import logging
 import random
-from functools import lru_cache
-from typing import List
+from datetime import date
+from typing import List, Set
 
 import httpx
 
-from api.config import TmdbImagesConfig
+from api.cache import SqliteCacheStore, TmdbCache
+from api.config import Settings, TmdbImagesConfig
+from api.metrics import observe
+from api.retry import Retrier, is_retryable_http_error, retry_budget
+from api.singleflight import SingleFlight
+from api.store import MovieStore
+
+logger = logging.getLogger(__name__)
+
+# quizzes are about english-language movies, online and from the snapshot alike
+ORIGINAL_LANGUAGE = 'en'
+
+# TMDB's movie genres in zh-CN, discover results only carry the ids
+GENRE_NAMES = {
+    28: '动作', 12: '冒险', 16: '动画', 35: '喜剧', 80: '犯罪', 99: '纪录', 18: '剧情', 10751: '家庭', 14: '奇幻', 36: '历史',
+    27: '恐怖', 10402: '音乐', 9648: '悬疑', 10749: '爱情', 878: '科幻', 10770: '电视电影', 53: '惊悚', 10752: '战争', 37: '西部'
+}
+
+
+def genre_names(movie: dict) -> list[str]:
+    if 'genres' in movie:
+        return [genre['name'] for genre in movie['genres']]
+    return [GENRE_NAMES[genre_id] for genre_id in movie.get('genre_ids', []) if genre_id in GENRE_NAMES]
+
+
+def create_http_client(settings: Settings) -> httpx.AsyncClient:
+    # 共享连接池: keep-alive + HTTP/2, 避免每次请求都重新握手
+    return httpx.AsyncClient(
+        base_url=settings.tmdb_base_url,
+        headers={
+            'Authorization': f'Bearer {settings.tmdb_api_key}'
+        },
+        http2=settings.tmdb_http2,
+        timeout=httpx.Timeout(settings.tmdb_timeout, connect=settings.tmdb_connect_timeout),
+        limits=httpx.Limits(
+            max_connections=settings.tmdb_max_connections,
+            max_keepalive_connections=settings.tmdb_max_keepalive_connections,
+            keepalive_expiry=settings.tmdb_keepalive_expiry
+        )
+    )
+
+
+def create_caches(settings: Settings) -> tuple[TmdbCache, TmdbCache]:
+    disk = SqliteCacheStore(settings.tmdb_cache_path) if settings.tmdb_cache_path else None
+    return (
+        TmdbCache('details', settings.tmdb_details_cache_maxsize, settings.tmdb_details_cache_ttl, disk),
+        TmdbCache('discover', settings.tmdb_discover_cache_maxsize, settings.tmdb_discover_cache_ttl, disk)
+    )
+
 
 class TmdbClient:
 
-    def __init__(self, tmdb_api_key: str, tmdb_images_config: TmdbImagesConfig):
+    def __init__(
+        self,
+        tmdb_api_key: str,
+        tmdb_images_config: TmdbImagesConfig,
+        http_client: httpx.AsyncClient,
+        details_cache: TmdbCache | None = None,
+        discover_cache: TmdbCache | None = None,
+        retrier: Retrier | None = None,
+        prefetch_details: bool = False,
+        prefetch_concurrency: int = 4,
+        store: MovieStore | None = None,
+        offline: bool = False
+    ):
         self.tmdb_images_config = tmdb_images_config
         self.tmdb_api_key = tmdb_api_key
+        self.http_client = http_client
+        self.details_cache = details_cache or TmdbCache('details', maxsize=1024, ttl=24 * 60 * 60)
+        self.discover_cache = discover_cache or TmdbCache('discover', maxsize=1024, ttl=60 * 60)
+        self.retrier = retrier or Retrier(max_attempts=1, base_delay=0, max_delay=0)
+        # identical cache misses in flight at the same time share one request
+        self.details_flight = SingleFlight('details')
+        self.discover_flight = SingleFlight('discover')
+
+        self.prefetch_details = prefetch_details
+        self.prefetched = 0
+        self._prefetch_semaphore = asyncio.Semaphore(prefetch_concurrency)
+        self._prefetch_tasks: Set[asyncio.Task] = set()
+
+        # discover queries are answered from the snapshot when it has matches, offline it answers everything
+        self.store = store if store is not None else MovieStore()
+        self.offline = offline
+
+    def _from_store(self, movie: dict) -> dict:
+        if 'poster_url' in movie:
+            return movie
+        return {**movie, 'poster_url': self.get_poster_url(movie['poster_path'])}
+
+    async def aclose(self):
+        for task in self._prefetch_tasks:
+            task.cancel()
+        await asyncio.gather(*self._prefetch_tasks, return_exceptions=True)
+
+        await self.http_client.aclose()
+        for disk in {self.details_cache.disk, self.discover_cache.disk} - {None}:
+            disk.close()
 
     def get_poster_url(self, poster_path: str, size='original') -> str:
         base_url = self.tmdb_images_config.secure_base_url
@@ -20,44 +112,132 @@ class TmdbClient:
 
         return f'{base_url}{size}{poster_path}'
 
+    async def refresh_images_config(self) -> TmdbImagesConfig:
+        response = await self._get('tmdb_configuration', '/configuration', {})
+        self.tmdb_images_config = TmdbImagesConfig(**response['images'])
+        return self.tmdb_images_config
+
+    async def _get(self, stage: str, url: str, params: dict) -> dict:
+        # only the failing request is repeated, not the whole quiz pipeline
+        async def fetch():
+            response = await self.http_client.get(url, params=params)
+            response.raise_for_status()
+            return response.json()
+
+        with observe(stage):
+            return await self.retrier.run('tmdb', fetch, is_retryable_http_error)
+
     #  通过 配置 language ,可以指定返回语言类型
-    def get_movies(self, page: int, vote_avg_min: float, vote_count_min: float) -> List[dict]:
-        response = httpx.get('https://api.themoviedb.org/3/discover/movie', headers={
-            'Authorization': f'Bearer {self.tmdb_api_key}'
-        }, params={
+    async def get_movies(self, page: int, vote_avg_min: float, vote_count_min: float) -> List[dict]:
+        movies = self.store.get_movies(page, vote_avg_min, vote_count_min, ORIGINAL_LANGUAGE)
+        if movies or self.offline:
+            return [self._from_store(movie) for movie in movies]
+
+        cache_key = f'{page}:{vote_avg_min}:{vote_count_min}'
+        movies = await self.discover_cache.get(cache_key)
+        if movies is not None:
+            return movies
+
+        return await self.discover_flight.do(cache_key, lambda: self._fetch_movies(cache_key, page, vote_avg_min, vote_count_min))
+
+    async def _fetch_movies(self, cache_key: str, page: int, vote_avg_min: float, vote_count_min: float) -> List[dict]:
+        response = await self._get('tmdb_discover', '/discover/movie', {
             'sort_by': 'popularity.desc',
             'include_adult': 'false',
             'include_video': 'false',
             'language': 'zh-CN',
-            'with_original_language': 'en',
+            'with_original_language': ORIGINAL_LANGUAGE,
             'vote_average.gte': vote_avg_min,
             'vote_count.gte': vote_count_min,
             'page': page
         })
 
-        movies = response.json()['results']
+        movies = response['results']
 
         for movie in movies:
             movie['poster_url'] = self.get_poster_url(movie['poster_path'])
 
+        await self.discover_cache.set(cache_key, movies)
         return movies
 
-    def get_random_movie(self, page_min: int, page_max: int, vote_avg_min: float, vote_count_min: float):
-        movies = self.get_movies(random.randint(page_min, page_max), vote_avg_min, vote_count_min)
+    async def get_random_movie(self, page_min: int, page_max: int, vote_avg_min: float, vote_count_min: float):
+        movie = self.store.get_random_movie(page_min, page_max, vote_avg_min, vote_count_min, ORIGINAL_LANGUAGE)
+        if movie or self.offline:
+            return await self.get_movie_details(movie['id']) if movie else None
+
+        movies = await self.get_movies(random.randint(page_min, page_max), vote_avg_min, vote_count_min)
         if not movies:
             return None
 
-        return self.get_movie_details(random.choice(movies)['id'])
-
-    @lru_cache(maxsize=1024)
-    def get_movie_details(self, movie_id: int):
-        response = httpx.get(f'https://api.themoviedb.org/3/movie/{movie_id}', headers={
-            'Authorization': f'Bearer {self.tmdb_api_key}'
-        }, params={
-            'language': 'zh-CN'
+        movie_id = random.choice(movies)['id']
+        if self.prefetch_details:
+            self._prefetch([movie['id'] for movie in movies if movie['id'] != movie_id])
+
+        return await self.get_movie_details(movie_id)
+
+    def _prefetch(self, movie_ids: List[int]):
+        # later quizzes landing on the same page find the details in the cache
+        for movie_id in movie_ids:
+            if movie_id in self.details_cache or movie_id in self.details_flight.calls:
+                continue
+            task = asyncio.create_task(self._prefetch_one(movie_id))
+            self._prefetch_tasks.add(task)
+            task.add_done_callback(self._prefetch_tasks.discard)
+
+    async def _prefetch_one(self, movie_id: int):
+        # the task inherits the request context, its retries must not drain the request's budget
+        retry_budget.set(None)
+        try:
+            async with self._prefetch_semaphore:
+                await self.get_movie_details(movie_id)
+            self.prefetched += 1
+        except httpx.HTTPError as e:
+            logger.debug('could not prefetch details of movie %s: %s', movie_id, e)
+
+    async def get_movie_details(self, movie_id: int):
+        if self.offline:
+            movie = self.store.get(movie_id)
+            if movie is None:
+                raise KeyError(f'movie {movie_id} is not in the snapshot')
+            return self._from_store(movie)
+
+        movie = await self.details_cache.get(movie_id)
+        if movie is not None:
+            return movie
+
+        try:
+            return await self.details_flight.do(movie_id, lambda: self._fetch_movie_details(movie_id))
+        except httpx.HTTPError:
+            # TMDB is slow or unreachable, the snapshot's copy is better than no quiz
+            movie = self.store.get(movie_id)
+            if movie is None:
+                raise
+            logger.warning('serving details of movie %s from the snapshot', movie_id)
+            return self._from_store(movie)
+
+    # bypasses the caches, used to apply /movie/changes
+    async def refresh_movie_details(self, movie_id: int) -> dict:
+        return await self._fetch_movie_details(movie_id)
+
+    async def get_movie_changes(self, start_date: date, end_date: date) -> List[int]:
+        movie_ids, page, total_pages = [], 1, 1
+        while page <= total_pages:
+            response = await self._get('tmdb_changes', '/movie/changes', {
+                'start_date': start_date.isoformat(),
+                'end_date': end_date.isoformat(),
+                'page': page
+            })
+            movie_ids.extend(change['id'] for change in response['results'])
+            total_pages = response.get('total_pages', 1)
+            page += 1
+        return movie_ids
+
+    async def _fetch_movie_details(self, movie_id: int) -> dict:
+        movie = await self._get('tmdb_details', f'/movie/{movie_id}', {
+            'language': 'zh-CN',
+            'append_to_response': 'alternative_titles'
         })
-
-        movie = response.json()
         movie['poster_url'] = self.get_poster_url(movie['poster_path'])
 
+        await self.details_cache.set(movie_id, movie)
         return movie
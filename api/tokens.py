@@ -0,0 +1,33 @@
+import re
+
+# rough local estimate that needs no tokenizer download: the tokenizers of the supported models
+# encode about one cjk character or four other characters per token
+CJK_PATTERN = re.compile(r'[\u3000-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uff00-\uffef]')
+
+CHARS_PER_TOKEN = 4
+
+ELLIPSIS = '…'
+
+
+def estimate_tokens(text: str) -> int:
+    if not text:
+        return 0
+    cjk = len(CJK_PATTERN.findall(text))
+    return cjk + -(-(len(text) - cjk) // CHARS_PER_TOKEN)
+
+
+def trim_to_tokens(text: str, budget: int) -> str:
+    if estimate_tokens(text) <= budget:
+        return text
+    if budget <= 0:
+        return ''
+
+    # binary search for the longest prefix that fits, including the ellipsis
+    low, high = 0, len(text)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if estimate_tokens(text[:middle] + ELLIPSIS) <= budget:
+            low = middle
+        else:
+            high = middle - 1
+    return text[:low].rstrip() + ELLIPSIS
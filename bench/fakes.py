@@ -0,0 +1,109 @@
+import asyncio
+import json
+import random
+import re
+from pathlib import Path
+from typing import AsyncIterator
+
+from fastapi import FastAPI, HTTPException
+
+from api.models.base import ChatProvider
+
+MOVIE = json.loads((Path(__file__).parent.parent / 'movie.json').read_text())
+
+IMAGES = {
+    'base_url': 'http://image.tmdb.org/t/p/',
+    'secure_base_url': 'https://image.tmdb.org/t/p/',
+    'backdrop_sizes': ['w300', 'original'],
+    'logo_sizes': ['original'],
+    'poster_sizes': ['w500', 'original'],
+    'profile_sizes': ['original'],
+    'still_sizes': ['original']
+}
+
+
+# serves movie.json under many ids, 20 movies per discover page like the real api
+def create_fake_tmdb(latency: float = 0.0, pages: int = 500) -> FastAPI:
+    app = FastAPI()
+
+    async def delay():
+        if latency:
+            await asyncio.sleep(random.uniform(0.5 * latency, 1.5 * latency))
+
+    @app.get('/3/configuration')
+    async def configuration():
+        return {'images': IMAGES}
+
+    @app.get('/3/discover/movie')
+    async def discover(page: int = 1):
+        await delay()
+        if page > pages:
+            return {'page': page, 'results': []}
+        return {'page': page, 'results': [
+            {'id': page * 100 + i, 'poster_path': MOVIE['poster_path'], 'vote_average': MOVIE['vote_average'], 'vote_count': MOVIE['vote_count']}
+            for i in range(20)
+        ]}
+
+    @app.get('/3/movie/{movie_id}')
+    async def details(movie_id: int):
+        await delay()
+        if movie_id < 100:
+            raise HTTPException(status_code=404)
+        return dict(MOVIE, id=movie_id)
+
+    return app
+
+
+class FakeChatProvider(ChatProvider):
+
+    name = 'fake'
+
+    def __init__(
+        self,
+        max_concurrency: int,
+        ttft: float,
+        latency: float,
+        failure_rate: float = 0.0,
+        malformed_rate: float = 0.0,
+        chunks: int = 8,
+        commentary: int = 0
+    ):
+        super().__init__(max_concurrency)
+        self.ttft = ttft
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.malformed_rate = malformed_rate
+        self.chunks = chunks
+        # characters of chatter after the template lines, generated like the rest of the reply
+        self.commentary = commentary
+
+    @staticmethod
+    def _reply(prompt: str, question: str) -> str:
+        if '分数' in question:
+            reply = '分数: 2\n答案: 很接近了, 但还差一点点!'
+        else:
+            reply = '问题: 一群超级英雄联手拯救世界的电影叫什么?\n提示1: 蝙蝠侠召集了队友\n提示2: 超人也回来了'
+
+        # batch prompts number their movies or answers, the reply has one block per number
+        numbers = re.findall(r'^### (\d+)$', prompt, re.MULTILINE)
+        if numbers:
+            return '\n\n'.join(f'### {number}\n{reply}' for number in numbers)
+        return reply
+
+    async def _astream(self, prompt: str, question: str) -> AsyncIterator[str]:
+        await asyncio.sleep(self.ttft)
+        if random.random() < self.failure_rate:
+            raise ConnectionError('fake provider failure')
+
+        reply = self._reply(prompt, question)
+        if random.random() < self.malformed_rate:
+            # full-width colons, the most common format slip of real models
+            reply = reply.replace(': ', '：')
+        if self.commentary:
+            reply += '\n\n' + ('希望你喜欢这个问题, 祝你好运! ' * self.commentary)[:self.commentary]
+
+        size = max(1, len(reply) // self.chunks)
+        parts = [reply[i:i + size] for i in range(0, len(reply), size)]
+        for part in parts:
+            yield part
+            await asyncio.sleep(max(0.0, self.latency - self.ttft) / len(parts))
@@ -0,0 +1,70 @@
+import argparse
+import sys
+import time
+
+from jinja2 import Environment, PackageLoader, select_autoescape
+from pydantic.v1 import validate_arguments
+
+from api.prompt import Language, Personality, PromptGenerator
+
+METADATA = {
+    'tagline': 'tagline',
+    'overview': 'overview ' * 50,
+    'genres': 'action, comedy',
+    'budget': 300000000,
+    'revenue': 657926987,
+    'average_rating': 6.088,
+    'rating_count': 12615,
+    'release_date': '2017-11-15',
+    'runtime': 120
+}
+
+
+class LegacyPromptGenerator:
+    # the per-call implementation PromptGenerator replaced, kept as benchmark baseline
+
+    def __init__(self):
+        self.env = Environment(
+            loader=PackageLoader('api'),
+            autoescape=select_autoescape()
+        )
+
+    @validate_arguments
+    def generate_question_prompt(self, movie_title: str, language: Language, personality: Personality, **kwargs):
+        template = self.env.get_template('prompt_question_cn.jinja')
+        language = self.env.get_template(f'language/{language.value}').render()
+        personality = self.env.get_template(f'personality/{personality.value}').render()
+        return template.render(language=language, personality=personality, title=movie_title, **kwargs)
+
+
+def prompts_per_second(prompt_generator, iterations: int) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        prompt_generator.generate_question_prompt('正义联盟', Language.DEFAULT, Personality.DAD, **METADATA)
+    return iterations / (time.perf_counter() - start)
+
+
+def cli() -> int:
+    parser = argparse.ArgumentParser(description='Question prompts per second, precompiled templates against the legacy per-call rendering')
+    parser.add_argument('--iterations', type=int, default=2000)
+    parser.add_argument('--min-speedup', type=float, help='exit 1 if precompiled is not this many times faster')
+    args = parser.parse_args()
+
+    legacy, precompiled = LegacyPromptGenerator(), PromptGenerator()
+    # warm up the template caches of both
+    prompts_per_second(legacy, 50)
+    prompts_per_second(precompiled, 50)
+
+    legacy_rate = prompts_per_second(legacy, args.iterations)
+    precompiled_rate = prompts_per_second(precompiled, args.iterations)
+    speedup = precompiled_rate / legacy_rate
+    print(f'question prompts/s: legacy {legacy_rate:.0f}, precompiled {precompiled_rate:.0f} ({speedup:.1f}x)')
+
+    if args.min_speedup and speedup < args.min_speedup:
+        print(f'REGRESSION speedup {speedup:.1f}x < {args.min_speedup:.1f}x', file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(cli())
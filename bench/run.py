@@ -0,0 +1,221 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import socket
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import httpx
+
+Sample = Tuple[str, float, bool]
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_fake_tmdb(latency: float) -> str:
+    # a real http server in its own thread, so the app's tmdb connection pool is part of the measurement
+    import uvicorn
+
+    from bench.fakes import create_fake_tmdb
+
+    port = _free_port()
+    server = uvicorn.Server(uvicorn.Config(
+        create_fake_tmdb(latency), host='127.0.0.1', port=port, log_level='warning', lifespan='off'
+    ))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.01)
+    return f'http://127.0.0.1:{port}/3'
+
+
+def configure_env(tmdb_url: str, stats_dir: str):
+    os.environ['TMDB_BASE_URL'] = tmdb_url
+    os.environ['STATS_DIR'] = stats_dir
+    # everything else can be overridden from the environment, e.g. CATALOG_ENABLED=true
+    defaults = {
+        'TMDB_API_KEY': 'bench',
+        'GROQ_API_KEY': 'bench',
+        'QWEN_API_KEY': 'bench',
+        'GCP_PROJECT_ID': 'bench',
+        'GCP_LOCATION': 'bench',
+        'GCP_SERVICE_ACCOUNT_FILE': 'bench',
+        'SESSION_BACKEND': 'memory',
+        'RATE_LIMIT_BACKEND': 'memory',
+        'QUIZ_RATE_LIMIT': str(10 ** 9),
+        'RATE_LIMIT_BURST': str(10 ** 9),
+        'RATE_LIMIT_PER_MINUTE': str(10 ** 9),
+        'CATALOG_ENABLED': 'false',
+        'QUESTION_POOL_ENABLED': 'false'
+    }
+    for key, value in defaults.items():
+        os.environ.setdefault(key, value)
+
+
+def percentile(values: List[float], p: int) -> float:
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method='inclusive')[p - 1]
+
+
+def summarize(samples: List[Sample], elapsed: float) -> Dict[str, dict]:
+    report = {}
+    for endpoint in sorted({endpoint for endpoint, _, _ in samples}):
+        latencies = [latency for name, latency, _ in samples if name == endpoint]
+        errors = sum(1 for name, _, ok in samples if name == endpoint and not ok)
+        report[endpoint] = {
+            'requests': len(latencies),
+            'errors': errors,
+            'error_rate': errors / len(latencies),
+            'throughput': len(latencies) / elapsed,
+            'p50': percentile(latencies, 50) * 1000,
+            'p95': percentile(latencies, 95) * 1000,
+            'p99': percentile(latencies, 99) * 1000
+        }
+    return report
+
+
+def compare(report: Dict[str, dict], baseline: Dict[str, dict], tolerance: float) -> List[str]:
+    regressions = []
+    for endpoint, base in baseline.items():
+        current = report.get(endpoint)
+        if current is None:
+            regressions.append(f'{endpoint}: missing from this run')
+            continue
+
+        for key in ('p50', 'p95', 'p99'):
+            if current[key] > base[key] * (1 + tolerance):
+                regressions.append(f'{endpoint}: {key} {current[key]:.1f}ms > baseline {base[key]:.1f}ms')
+        if current['throughput'] < base['throughput'] * (1 - tolerance):
+            regressions.append(f'{endpoint}: throughput {current["throughput"]:.1f}/s < baseline {base["throughput"]:.1f}/s')
+        if current['error_rate'] > base['error_rate'] + 0.01:
+            regressions.append(f'{endpoint}: error rate {current["error_rate"]:.2%} > baseline {base["error_rate"]:.2%}')
+    return regressions
+
+
+async def drive(client: httpx.AsyncClient, quizzes: int, concurrency: int) -> List[Sample]:
+    samples: List[Sample] = []
+    remaining = iter(range(quizzes))
+
+    async def post(endpoint: str, url: str, body: dict) -> httpx.Response | None:
+        started = time.perf_counter()
+        try:
+            response = await client.post(url, json=body)
+        except httpx.HTTPError:
+            samples.append((endpoint, time.perf_counter() - started, False))
+            return None
+        samples.append((endpoint, time.perf_counter() - started, response.status_code == 200))
+        return response
+
+    async def player():
+        for _ in remaining:
+            response = await post('quiz', '/api/quiz', {'popularity': random.randint(1, 3)})
+            if response is None or response.status_code != 200:
+                continue
+
+            quiz = response.json()
+            title = quiz['movie']['title']
+            # exact answers and clear misses are graded locally, near misses go to the llm
+            answer = random.choice([title, title[:len(title) // 2 + 1], '不知道'])
+            await post('answer', f'/api/quiz/{quiz["quiz_id"]}/answer', {'answer': answer})
+
+    await asyncio.gather(*(player() for _ in range(concurrency)))
+    return samples
+
+
+async def run(args) -> Dict[str, dict]:
+    from bench.fakes import FakeChatProvider
+
+    from api import main
+    from api.models.router import ProviderRouter
+
+    main.chat_client = ProviderRouter(
+        [FakeChatProvider(
+            args.llm_concurrency,
+            ttft=args.llm_ttft,
+            latency=args.llm_latency,
+            failure_rate=args.llm_failure_rate,
+            malformed_rate=args.llm_malformed_rate,
+            commentary=args.llm_commentary
+        )],
+        failure_threshold=main.settings.llm_failure_threshold,
+        open_seconds=main.settings.llm_circuit_open_seconds,
+        ewma_alpha=main.settings.llm_ewma_alpha
+    )
+
+    transport = httpx.ASGITransport(app=main.app)
+    async with main.app.router.lifespan_context(main.app):
+        async with httpx.AsyncClient(transport=transport, base_url='http://bench', timeout=120) as client:
+            if args.warmup:
+                await drive(client, args.warmup, min(args.warmup, args.concurrency))
+
+            started = time.perf_counter()
+            samples = await drive(client, args.quizzes, args.concurrency)
+            elapsed = time.perf_counter() - started
+
+    return summarize(samples, elapsed)
+
+
+def cli() -> int:
+    parser = argparse.ArgumentParser(description='End-to-end benchmark against local TMDB and LLM stand-ins')
+    parser.add_argument('--quizzes', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--warmup', type=int, default=10)
+    parser.add_argument('--tmdb-latency', type=float, default=0.05)
+    parser.add_argument('--llm-ttft', type=float, default=0.3)
+    parser.add_argument('--llm-latency', type=float, default=1.0)
+    parser.add_argument('--llm-failure-rate', type=float, default=0.0)
+    parser.add_argument('--llm-malformed-rate', type=float, default=0.0)
+    parser.add_argument('--llm-concurrency', type=int, default=8)
+    parser.add_argument('--llm-commentary', type=int, default=0, help='characters of chatter after the template lines')
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--output', help='write the report as json')
+    parser.add_argument('--baseline', help='compare against a saved report, exit 1 on regressions')
+    parser.add_argument('--save-baseline', help='save this run as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    parser.add_argument('--log-level', default='ERROR')
+    args = parser.parse_args()
+    # a missing baseline must not pass the regression gate, checked before the run takes minutes
+    if args.baseline and not Path(args.baseline).is_file():
+        parser.error(f'baseline {args.baseline} does not exist, save one with --save-baseline (make bench-baseline)')
+
+    logging.basicConfig(level=args.log_level)
+    random.seed(args.seed)
+
+    with tempfile.TemporaryDirectory() as stats_dir:
+        configure_env(start_fake_tmdb(args.tmdb_latency), stats_dir)
+        report = asyncio.run(run(args))
+
+    print(f'{"endpoint":<10}{"requests":>10}{"errors":>8}{"req/s":>10}{"p50 ms":>10}{"p95 ms":>10}{"p99 ms":>10}')
+    for endpoint, result in report.items():
+        print(
+            f'{endpoint:<10}{result["requests"]:>10}{result["errors"]:>8}{result["throughput"]:>10.1f}'
+            f'{result["p50"]:>10.1f}{result["p95"]:>10.1f}{result["p99"]:>10.1f}'
+        )
+
+    for path in (args.output, args.save_baseline):
+        if path:
+            Path(path).write_text(json.dumps(report, indent=2))
+
+    if args.baseline:
+        regressions = compare(report, json.loads(Path(args.baseline).read_text()), args.tolerance)
+        for regression in regressions:
+            print(f'REGRESSION {regression}', file=sys.stderr)
+        return 1 if regressions else 0
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(cli())
@@ -0,0 +1,68 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+from bench.run import configure_env
+
+# runs in a fresh interpreter, so module caches of the parent do not hide import costs
+CHILD = """
+import asyncio, json, time
+started = time.perf_counter()
+from api import main
+imported = time.perf_counter()
+
+async def startup():
+    async with main.app.router.lifespan_context(main.app):
+        return time.perf_counter()
+
+ready = asyncio.run(startup())
+print(json.dumps({'import': imported - started, 'startup': ready - started}))
+"""
+
+
+def measure(runs: int) -> dict:
+    samples = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, '-c', CHILD],
+            cwd=Path(__file__).parent.parent,
+            capture_output=True,
+            text=True,
+            check=True
+        ).stdout
+        samples.append(json.loads(output.strip().splitlines()[-1]))
+
+    return {
+        key: {'min': min(sample[key] for sample in samples), 'median': statistics.median(sample[key] for sample in samples)}
+        for key in ('import', 'startup')
+    }
+
+
+def cli() -> int:
+    parser = argparse.ArgumentParser(description='Import and startup time of the app, without network access')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--max-seconds', type=float, help='exit 1 if the median startup takes longer')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # nothing listens on the discard port, any startup request to tmdb would fail
+        configure_env('http://127.0.0.1:9/3', str(Path(tmp_dir) / 'stats'))
+        os.environ['TMDB_IMAGES_CONFIG_PATH'] = str(Path(tmp_dir) / 'tmdb-images-config.json')
+        result = measure(args.runs)
+
+    for key, value in result.items():
+        print(f'{key:<10}min {value["min"] * 1000:8.1f} ms   median {value["median"] * 1000:8.1f} ms')
+
+    if args.max_seconds and result['startup']['median'] > args.max_seconds:
+        print(f'REGRESSION startup {result["startup"]["median"]:.2f}s > {args.max_seconds:.2f}s', file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(cli())
@@ -0,0 +1,32 @@
+import unittest
+
+from bench.run import compare, summarize
+
+
+class TestBench(unittest.TestCase):
+
+    def test_summarize(self):
+        samples = [('quiz', latency / 1000, True) for latency in range(1, 101)] + [('quiz', 0.5, False)]
+
+        report = summarize(samples, elapsed=10.0)['quiz']
+
+        self.assertEqual(report['requests'], 101)
+        self.assertEqual(report['errors'], 1)
+        self.assertAlmostEqual(report['throughput'], 10.1)
+        self.assertAlmostEqual(report['p50'], 51.0)
+        self.assertGreater(report['p99'], report['p95'])
+
+    def test_compare(self):
+        baseline = {'quiz': {'p50': 100.0, 'p95': 200.0, 'p99': 300.0, 'throughput': 50.0, 'error_rate': 0.0}}
+        current = {'quiz': {'p50': 110.0, 'p95': 260.0, 'p99': 300.0, 'throughput': 45.0, 'error_rate': 0.05}}
+
+        regressions = compare(current, baseline, tolerance=0.2)
+
+        self.assertEqual(len(regressions), 2)
+        self.assertTrue(regressions[0].startswith('quiz: p95'))
+        self.assertTrue(regressions[1].startswith('quiz: error rate'))
+        self.assertEqual(compare(baseline, baseline, tolerance=0.2), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
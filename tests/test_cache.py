@@ -0,0 +1,64 @@
+import tempfile
+import time
+import unittest
+from pathlib import Path
+
+from api.cache import SqliteCacheStore, TmdbCache
+
+
+class TestTmdbCache(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = str(Path(self.tmp_dir.name) / 'cache' / 'tmdb.sqlite3')
+
+    async def asyncTearDown(self):
+        self.tmp_dir.cleanup()
+
+    async def test_hits_misses_evictions(self):
+        cache = TmdbCache('details', maxsize=2, ttl=60)
+
+        self.assertIsNone(await cache.get(1))
+        for movie_id in (1, 2, 3):
+            await cache.set(movie_id, {'id': movie_id})
+
+        self.assertEqual(await cache.get(3), {'id': 3})
+
+        stats = cache.stats()
+        self.assertEqual(stats.size, 2)
+        self.assertEqual(stats.hits, 1)
+        self.assertEqual(stats.misses, 1)
+        self.assertEqual(stats.evictions, 1)
+        self.assertFalse(stats.persistent)
+
+    async def test_ttl(self):
+        cache = TmdbCache('details', maxsize=2, ttl=0)
+
+        await cache.set(1, {'id': 1})
+
+        self.assertIsNone(await cache.get(1))
+
+    async def test_persistent_tier_survives_restart(self):
+        disk = SqliteCacheStore(self.path)
+        await TmdbCache('details', maxsize=2, ttl=60, disk=disk).set(1, {'id': 1, 'title': '正义联盟'})
+        disk.close()
+
+        disk = SqliteCacheStore(self.path)
+        cache = TmdbCache('details', maxsize=2, ttl=60, disk=disk)
+
+        self.assertEqual(await cache.get(1), {'id': 1, 'title': '正义联盟'})
+        self.assertEqual(cache.stats().disk_hits, 1)
+        # namespaces do not collide in the shared file
+        self.assertIsNone(await TmdbCache('discover', maxsize=2, ttl=60, disk=disk).get(1))
+        disk.close()
+
+    def test_expired_disk_entries_are_ignored(self):
+        disk = SqliteCacheStore(self.path)
+        disk.set('details:1', {'id': 1}, time.time() - 1)
+
+        self.assertIsNone(disk.get('details:1'))
+        disk.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
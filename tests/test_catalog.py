@@ -0,0 +1,53 @@
+import unittest
+
+import httpx
+
+from api.catalog import MovieCatalog
+
+
+class FakeTmdbClient:
+
+    def __init__(self):
+        self.pages = []
+
+    async def get_movies(self, page: int, vote_avg_min: float, vote_count_min: float):
+        self.pages.append(page)
+        if page == 4:
+            raise httpx.ConnectError('boom')
+        return [{'id': page, 'vote_average': 5.0 + page, 'vote_count': 1000.0 * page}]
+
+
+class TestCatalog(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.tmdb_client = FakeTmdbClient()
+        self.catalog = MovieCatalog(
+            self.tmdb_client,
+            page_ranges={1: (3, 5), 2: (1, 2)},
+            vote_avg_min=5.0,
+            vote_count_min=1000.0,
+            refresh_interval=60,
+            concurrency=2
+        )
+
+    async def test_refresh(self):
+        await self.catalog.refresh()
+
+        self.assertEqual(sorted(self.tmdb_client.pages), [1, 2, 3, 4, 5])
+        self.assertEqual([movie['id'] for movie in self.catalog.movies[1]], [3, 5])
+        self.assertEqual([movie['id'] for movie in self.catalog.movies[2]], [1, 2])
+        self.assertIsNotNone(self.catalog.refreshed_at)
+
+    async def test_sample(self):
+        self.assertIsNone(self.catalog.sample(1, 5.0, 1000.0))
+
+        await self.catalog.refresh()
+
+        self.assertEqual(self.catalog.sample(1, 9.0, 1000.0)['id'], 5)
+        self.assertIsNone(self.catalog.sample(1, 11.0, 1000.0))
+        # looser than the crawl, the catalog cannot answer
+        self.assertIsNone(self.catalog.sample(2, 1.0, 1000.0))
+
+
+if __name__ == '__main__':
+    unittest.main()
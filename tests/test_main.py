@@ -0,0 +1,198 @@
+import asyncio
+import json
+import os
+import tempfile
+import unittest
+from pathlib import Path
+
+import httpx
+
+TMP_DIR = tempfile.mkdtemp()
+# the app reads its settings on import
+for key in ('TMDB_API_KEY', 'GROQ_API_KEY', 'QWEN_API_KEY', 'GCP_PROJECT_ID', 'GCP_LOCATION', 'GCP_SERVICE_ACCOUNT_FILE'):
+    os.environ.setdefault(key, 'test')
+os.environ.update(
+    CATALOG_ENABLED='false',
+    QUESTION_POOL_ENABLED='false',
+    SESSION_BACKEND='memory',
+    RATE_LIMIT_BACKEND='memory',
+    STATS_DIR=os.path.join(TMP_DIR, 'stats'),
+    STATS_PATH=os.path.join(TMP_DIR, 'stats.pkl'),
+    TMDB_IMAGES_CONFIG_PATH=os.path.join(TMP_DIR, 'images.json')
+)
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+from api import main  # noqa: E402
+from api.common import MAX_ANSWER_LENGTH, BaseQuestion  # noqa: E402
+from api.config import DEFAULT_TMDB_IMAGES_CONFIG  # noqa: E402
+from api.models.base import ChatProvider  # noqa: E402
+from api.models.router import ProviderRouter  # noqa: E402
+
+MOVIE = json.loads((Path(__file__).parent.parent / 'movie.json').read_text())
+
+PREAMBLE_QUESTION = ['好的，以下是我的回复: 祝你好运\n', '问题: 这是问题\n', '提示1: 第一个提示\n', '提示2: 第二个提示\n', '希望你喜欢', '这个问题!']
+PREAMBLE_ANSWER = ['好的，以下是评分: 请看\n', '分数: 2\n', '答案: 很接近了!\n', '祝你好运', '下次再来!']
+
+
+class ChattyProvider(ChatProvider):
+
+    name = 'chatty'
+
+    def __init__(self):
+        super().__init__(max_concurrency=4)
+        self.sent = 0
+
+    async def _astream(self, prompt: str, question: str):
+        for chunk in PREAMBLE_ANSWER if '分数' in question else PREAMBLE_QUESTION:
+            self.sent += 1
+            await asyncio.sleep(0)
+            yield chunk
+
+
+class LeakyProvider(ChattyProvider):
+
+    name = 'leaky'
+
+    def __init__(self, leaks: int):
+        super().__init__()
+        self.leaks = leaks
+
+    async def _astream(self, prompt: str, question: str):
+        if self.leaks and '分数' not in question:
+            self.leaks -= 1
+            yield '问题: 这是问题\n提示1: 超级英雄\n提示2: Justice League\n'
+            return
+        async for chunk in super()._astream(prompt, question):
+            yield chunk
+
+
+def _events(text: str) -> list[tuple[str, object]]:
+    events = []
+    for block in text.strip().split('\n\n'):
+        event, data = block.split('\n', 1)
+        events.append((event.removeprefix('event: '), json.loads(data.removeprefix('data: '))))
+    return events
+
+
+class TestMain(unittest.TestCase):
+
+    def setUp(self):
+        def handler(request: httpx.Request) -> httpx.Response:
+            if request.url.path.endswith('/configuration'):
+                return httpx.Response(200, json={'images': DEFAULT_TMDB_IMAGES_CONFIG.model_dump()})
+            if request.url.path.endswith('/discover/movie'):
+                return httpx.Response(200, json={'results': [MOVIE]})
+            return httpx.Response(200, json=MOVIE)
+
+        self.http_client = main.tmdb_client.http_client
+        main.tmdb_client.http_client = httpx.AsyncClient(base_url='https://tmdb.test/3', transport=httpx.MockTransport(handler))
+        self.chat_client = main.chat_client
+        self.provider = ChattyProvider()
+        main.chat_client = ProviderRouter([self.provider], failure_threshold=3, open_seconds=30, ewma_alpha=0.5)
+
+    def tearDown(self):
+        main.tmdb_client.http_client = self.http_client
+        main.chat_client = self.chat_client
+
+    def test_preamble_with_colon_stops_after_the_fields(self):
+        chat_reply = asyncio.run(self.provider.ainvoke('prompt', 'question', BaseQuestion))
+
+        question = self.provider.parse_reply(chat_reply, BaseQuestion)
+        self.assertEqual((question.question, question.hint1, question.hint2), ('这是问题', '第一个提示', '第二个提示'))
+        self.assertEqual(self.provider.sent, 4)
+
+    def test_quiz_with_preamble(self):
+        with TestClient(main.app) as client:
+            response = client.post('/api/quiz')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['question'], {'question': '这是问题', 'hint1': '第一个提示', 'hint2': '第二个提示'})
+
+    def test_streams_with_preamble(self):
+        with TestClient(main.app) as client:
+            events = _events(client.post('/api/quiz/stream').text)
+            fields = {event: data for event, data in events if event in ('question', 'hint1', 'hint2')}
+            self.assertEqual(fields, {'question': '这是问题', 'hint1': '第一个提示', 'hint2': '第二个提示'})
+            self.assertEqual(self.provider.sent, 4)
+
+            quiz_id = events[-1][1]['quiz_id']
+            events = _events(client.post(f'/api/quiz/{quiz_id}/answer/stream', json={'answer': 'Justice'}).text)
+
+        fields = {event: data for event, data in events if event in ('points', 'answer')}
+        self.assertEqual(fields, {'points': '2', 'answer': '很接近了!'})
+        self.assertEqual(events[-1][0], 'done')
+
+    def test_question_that_leaks_the_title_is_asked_again(self):
+        main.chat_client = ProviderRouter([LeakyProvider(leaks=1)], failure_threshold=3, open_seconds=30, ewma_alpha=0.5)
+
+        with TestClient(main.app) as client:
+            response = client.post('/api/quiz')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['question']['hint2'], '第二个提示')
+
+    def test_streamed_question_that_leaks_the_title_gets_no_session(self):
+        main.chat_client = ProviderRouter([LeakyProvider(leaks=1)], failure_threshold=3, open_seconds=30, ewma_alpha=0.5)
+
+        with TestClient(main.app) as client:
+            events = _events(client.post('/api/quiz/stream').text)
+
+        self.assertEqual(events[-1], ('error', 'Chat reply gives the title away'))
+
+    def test_answer_length_is_capped(self):
+        with TestClient(main.app) as client:
+            response = client.post('/api/quiz/unknown/answer', json={'answer': 'x' * (MAX_ANSWER_LENGTH + 1)})
+            self.assertEqual(response.status_code, 422)
+
+            room_id = client.post('/api/rooms').json()['room_id']
+            with client.websocket_connect(f'/api/rooms/{room_id}/ws?player=alice') as websocket:
+                self.assertEqual(websocket.receive_json()['type'], 'joined')
+                websocket.send_json({'type': 'answer', 'answer': 'x' * (MAX_ANSWER_LENGTH + 1)})
+                self.assertIn('longer than', websocket.receive_json()['detail'])
+
+    def test_room_socket_survives_non_object_messages(self):
+        with TestClient(main.app) as client:
+            room_id = client.post('/api/rooms').json()['room_id']
+            with client.websocket_connect(f'/api/rooms/{room_id}/ws?player=alice') as websocket:
+                self.assertEqual(websocket.receive_json()['type'], 'joined')
+                for message in ([], 'x', 1):
+                    websocket.send_json(message)
+                    self.assertEqual(websocket.receive_json(), {'type': 'error', 'detail': 'Unknown message type'})
+
+                websocket.send_json({'type': 'answer', 'answer': 'Justice League'})
+                self.assertEqual(websocket.receive_json()['detail'], 'No open round or already answered')
+
+
+    def test_offline_quiz_from_discover_snapshot(self):
+        def offline(request: httpx.Request) -> httpx.Response:
+            raise AssertionError(f'TMDB was called offline: {request.url}')
+
+        main.tmdb_client.http_client = httpx.AsyncClient(base_url='https://tmdb.test/3', transport=httpx.MockTransport(offline))
+        path = os.path.join(TMP_DIR, 'discover.json')
+        discover_movie = {key: MOVIE[key] for key in (
+            'adult', 'backdrop_path', 'id', 'original_language', 'original_title', 'overview', 'popularity',
+            'poster_path', 'release_date', 'title', 'video', 'vote_average', 'vote_count'
+        )}
+        Path(path).write_text(json.dumps({'page': 1, 'results': [dict(discover_movie, genre_ids=[28, 878])]}))
+        main.movie_store.load(path)
+        main.settings.tmdb_offline = main.tmdb_client.offline = True
+        try:
+            with TestClient(main.app) as client:
+                response = client.post('/api/quiz', json={'popularity': 3})
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.json()['movie']['id'], MOVIE['id'])
+
+                response = client.post(f'/api/quiz/{response.json()["quiz_id"]}/answer', json={'answer': 'Justice'})
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.json()['result']['points'], 2)
+
+            metadata = main._question_metadata(main.movie_store.get(MOVIE['id']))
+            self.assertEqual((metadata['genres'], metadata['tagline'], metadata['runtime']), ('动作, 科幻', '', 0))
+        finally:
+            main.settings.tmdb_offline = main.tmdb_client.offline = False
+            main.movie_store.replace([])
+
+
+if __name__ == '__main__':
+    unittest.main()
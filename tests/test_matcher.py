@@ -0,0 +1,70 @@
+import unittest
+from unittest.mock import patch
+
+from pydantic import ValidationError
+
+from api.common import MAX_ANSWER_LENGTH, UserAnswer
+from api.matcher import TitleMatcher, candidate_titles, edit_distance, normalize_title
+
+MOVIE = {
+    'title': '正义联盟',
+    'original_title': 'Justice League',
+    'alternative_titles': {'titles': [
+        {'iso_3166_1': 'TW', 'title': '正義聯盟', 'type': ''},
+        {'iso_3166_1': 'US', 'title': 'Justice League', 'type': ''}
+    ]}
+}
+
+
+class TestMatcher(unittest.TestCase):
+
+    def test_normalize_title(self):
+        self.assertEqual(normalize_title('  Ｊｕｓｔｉｃｅ　League！ '), 'justiceleague')
+        self.assertEqual(normalize_title('正义联盟：扎克·施奈德版'), '正义联盟扎克施奈德版')
+
+    def test_edit_distance(self):
+        self.assertEqual(edit_distance('kitten', 'sitting'), 3)
+        self.assertEqual(edit_distance('', 'abc'), 3)
+        self.assertEqual(edit_distance('正义联盟', '正义联盟'), 0)
+
+    def test_candidate_titles(self):
+        self.assertEqual(candidate_titles(MOVIE), ['正义联盟', 'Justice League', '正義聯盟'])
+
+    def test_grade(self):
+        matcher = TitleMatcher(hit_threshold=0.85, miss_threshold=0.25)
+
+        self.assertEqual(matcher.grade('正义联盟', MOVIE).points, 3)
+        self.assertEqual(matcher.grade('justice  leage', MOVIE).points, 3)
+        self.assertEqual(matcher.grade('正義聯盟!', MOVIE).points, 3)
+        self.assertEqual(matcher.grade('Greenland', MOVIE).points, 0)
+        self.assertEqual(matcher.grade('', MOVIE).points, 0)
+        # close, but not close enough to decide without the model
+        self.assertIsNone(matcher.grade('复仇者联盟', MOVIE).points)
+
+        self.assertEqual((matcher.hits, matcher.misses, matcher.ambiguous), (3, 2, 1))
+
+    def test_long_answer_skips_edit_distance(self):
+        matcher = TitleMatcher(hit_threshold=0.85, miss_threshold=0.25)
+
+        with patch('api.matcher.edit_distance', wraps=edit_distance) as distance:
+            result = matcher.grade('justice league ' * 1000, MOVIE)
+
+        self.assertEqual(result.points, 0)
+        distance.assert_not_called()
+
+    def test_answer_length_is_capped(self):
+        UserAnswer(answer='x' * MAX_ANSWER_LENGTH)
+        with self.assertRaises(ValidationError):
+            UserAnswer(answer='x' * (MAX_ANSWER_LENGTH + 1))
+
+    def test_feedback(self):
+        matcher = TitleMatcher(hit_threshold=0.85, miss_threshold=0.25)
+
+        answer = matcher.feedback(matcher.grade('正义联盟', MOVIE), MOVIE)
+
+        self.assertEqual(answer.points, 3)
+        self.assertIn('正义联盟', answer.answer)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+import unittest
+from datetime import datetime
+
+from api.common import BaseQuestion, SessionData
+from api.metrics import REGISTRY
+from api.models.base import ChatProvider
+from api.sessions import MemorySessionStore
+from tests.test_provider import FakeProvider
+
+
+def _session(quiz_id: str) -> SessionData:
+    question = BaseQuestion(question='问题', hint1='提示1', hint2='提示2')
+    return SessionData(quiz_id=quiz_id, movie_id=141052, question=question, started_at=datetime.now())
+
+
+def sample(name: str, **labels) -> float:
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+class TestMetrics(unittest.IsolatedAsyncioTestCase):
+
+    async def test_llm_latency(self):
+        provider = FakeProvider(max_concurrency=1)
+        before = sample('quiz_llm_seconds_count', provider='fake', phase='ttft')
+
+        await provider.ainvoke('电影', 'question')
+
+        self.assertEqual(sample('quiz_llm_seconds_count', provider='fake', phase='ttft'), before + 1)
+        self.assertGreater(sample('quiz_stage_seconds_sum', stage='llm_total'), 0.0)
+
+    def test_parse_failures(self):
+        before = sample('quiz_parse_failures_total', kind='answer')
+
+        with self.assertRaises(ValueError):
+            ChatProvider.parse_chat_answer('分数：2')
+
+        self.assertEqual(sample('quiz_parse_failures_total', kind='answer'), before + 1)
+        self.assertGreater(sample('quiz_stage_seconds_count', stage='parse'), 0.0)
+
+    async def test_session_evictions(self):
+        store = MemorySessionStore(maxsize=1, ttl=60)
+        before = sample('quiz_session_evictions_total')
+
+        await store.set(_session('a'))
+        await store.set(_session('b'))
+
+        self.assertEqual(sample('quiz_session_evictions_total'), before + 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
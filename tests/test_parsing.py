@@ -0,0 +1,63 @@
+import json
+import unittest
+
+from api.common import BaseQuestion
+from api.parsing import json_instruction, parse_fields, parse_line
+from api.streaming import ANSWER_FIELDS, QUESTION_FIELDS
+
+
+class TestParsing(unittest.TestCase):
+
+    def test_parse_line(self):
+        self.assertEqual(parse_line('问题：猜猜看'), ('问题', '猜猜看'))
+        self.assertEqual(parse_line('**提示 1:** 科幻'), ('提示1', '科幻'))
+        self.assertEqual(parse_line('- `Hint2`: 正_联_'), ('hint2', '正_联_'))
+        self.assertEqual(parse_line('### 分数: 2'), ('分数', '2'))
+        self.assertIsNone(parse_line('好的, 这是你的问题'))
+        self.assertIsNone(parse_line('问题:'))
+
+    def test_value_keeps_colons(self):
+        self.assertEqual(parse_line('问题: 这是一部电影: 猜猜看'), ('问题', '这是一部电影: 猜猜看'))
+
+    def test_labels_in_any_order(self):
+        chat_reply = '好的!\n\n提示2: 正_联_\n**问题**: 猜猜看\n提示1：科幻\n\n祝你好运!'
+
+        values = parse_fields(chat_reply, QUESTION_FIELDS)
+
+        self.assertEqual(values, {'question': '猜猜看', 'hint1': '科幻', 'hint2': '正_联_'})
+
+    def test_unknown_labels_in_order(self):
+        values = parse_fields('Frage: a\nTipp 1: b\nTipp 2: c', QUESTION_FIELDS)
+
+        self.assertEqual(values, {'question': 'a', 'hint1': 'b', 'hint2': 'c'})
+
+    def test_unknown_labels_keep_known_ones(self):
+        values = parse_fields('Tipp 1: b\n问题: a\nTipp 2: c', QUESTION_FIELDS)
+
+        self.assertEqual(values, {'question': 'a', 'hint1': 'b', 'hint2': 'c'})
+
+    def test_unknown_labels_with_chatter(self):
+        values = parse_fields('Hinweis: x\nFrage: a\nTipp 1: b\nTipp 2: c', QUESTION_FIELDS)
+
+        self.assertEqual(values, {})
+
+    def test_json(self):
+        chat_reply = '```json\n{"points": 2, "answer": "很接近了!"}\n```'
+
+        self.assertEqual(parse_fields(chat_reply, ANSWER_FIELDS), {'points': '2', 'answer': '很接近了!'})
+
+    def test_incomplete_json_falls_back_to_lines(self):
+        chat_reply = '{"points": 2}\n分数: 2\n答案: 很接近了!'
+
+        self.assertEqual(parse_fields(chat_reply, ANSWER_FIELDS), {'points': '2', 'answer': '很接近了!'})
+
+    def test_json_instruction(self):
+        instruction = json_instruction(BaseQuestion)
+
+        self.assertIn('JSON', instruction)
+        properties = json.loads(instruction[instruction.index('{'):].strip())
+        self.assertEqual(set(properties), set(QUESTION_FIELDS))
+
+
+if __name__ == '__main__':
+    unittest.main()
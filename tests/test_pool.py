@@ -0,0 +1,89 @@
+import asyncio
+import unittest
+
+from api.common import BaseQuestion
+from api.config import QuizConfig
+from api.pool import QuestionPool
+
+
+class TestQuestionPool(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.generated_configs = []
+
+        async def generate(quiz_config: QuizConfig):
+            self.generated_configs.append(quiz_config)
+            question = BaseQuestion(question='question', hint1='hint1', hint2='hint2')
+            return question, {'id': len(self.generated_configs), 'vote_average': 7.0, 'vote_count': 2000}
+
+        self.pool = QuestionPool(
+            generate,
+            target_depth=2,
+            concurrency=1,
+            max_age=60,
+            bucket_idle=60,
+            refill_interval=0.01
+        )
+
+    async def asyncTearDown(self):
+        await self.pool.stop()
+
+    async def test_pop_refills_bucket(self):
+        quiz_config = QuizConfig(personality='dad')
+
+        self.assertIsNone(self.pool.pop(quiz_config))
+
+        self.pool.start()
+        await asyncio.sleep(0.1)
+
+        self.assertEqual(self.pool.depth()[(1, 'DAD', 'DEFAULT')], 2)
+        self.assertEqual(self.generated_configs[0].personality, 'DAD')
+
+        _, movie = self.pool.pop(quiz_config)
+        self.assertEqual(movie['id'], 1)
+        self.assertEqual(self.pool.hits, 1)
+        self.assertEqual(self.pool.misses, 1)
+        self.assertEqual(self.pool.hit_rate(), 0.5)
+
+    async def test_pop_respects_stricter_filters(self):
+        self.pool.warm(QuizConfig())
+        self.pool.start()
+        await asyncio.sleep(0.1)
+
+        self.assertIsNone(self.pool.pop(QuizConfig(vote_avg_min=8.0)))
+        self.assertIsNotNone(self.pool.pop(QuizConfig(vote_avg_min=6.0)))
+
+    async def test_stale_questions_are_dropped(self):
+        self.pool.max_age = 0
+        self.pool.warm(QuizConfig())
+        self.pool.start()
+        await asyncio.sleep(0.05)
+
+        self.assertIsNone(self.pool.pop(QuizConfig()))
+        self.assertGreater(self.pool.expired, 0)
+
+    async def test_batch_refill(self):
+        batches = []
+
+        async def generate_batch(quiz_config: QuizConfig, count: int):
+            batches.append(count)
+            question = BaseQuestion(question='question', hint1='hint1', hint2='hint2')
+            # one of the questions came back invalid
+            return [(question, {'id': i, 'vote_average': 7.0, 'vote_count': 2000}) for i in range(count - 1)]
+
+        self.pool.generate_batch = generate_batch
+        self.pool.batch_size = 3
+        self.pool.target_depth = 3
+        self.pool.warm(QuizConfig())
+        self.pool.start()
+        await asyncio.sleep(0.1)
+
+        # the invalid question is made up for by a single generation
+        self.assertEqual(batches[0], 3)
+        self.assertEqual(len(self.generated_configs), 1)
+        self.assertEqual(self.pool.depth()[(1, 'DEFAULT', 'DEFAULT')], 3)
+        self.assertGreater(self.pool.failures, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,154 @@
+import asyncio
+import json
+import unittest
+
+from api.common import BaseAnswer, BaseQuestion
+from api.models.base import ChatProvider
+
+
+class FakeProvider(ChatProvider):
+
+    name = 'fake'
+
+    async def _astream(self, prompt: str, question: str):
+        for chunk in ['问题: ', prompt, '\n', '提示1: a\n', '提示2: b']:
+            await asyncio.sleep(0.01)
+            yield chunk
+
+
+class ChattyProvider(ChatProvider):
+
+    name = 'chatty'
+
+    def __init__(self, max_concurrency: int):
+        super().__init__(max_concurrency)
+        self.sent = []
+        self.closed = False
+
+    async def _astream(self, prompt: str, question: str):
+        try:
+            for chunk in ['分数: 2\n', '答案: 很接近', '了!\n', '另外, ', '这部电影', '非常好看']:
+                self.sent.append(chunk)
+                yield chunk
+        finally:
+            self.closed = True
+
+
+class JsonProvider(FakeProvider):
+
+    async def _astream_json(self, prompt: str, question: str):
+        self.question = question
+        yield json.dumps({'points': 2, 'answer': prompt}, ensure_ascii=False)
+
+
+class TestProvider(unittest.IsolatedAsyncioTestCase):
+
+    async def test_ainvoke(self):
+        provider = FakeProvider(max_concurrency=1)
+
+        chat_reply = await provider.ainvoke('电影', 'question')
+        question = provider.parse_chat_question(chat_reply)
+
+        self.assertEqual(question.question, '电影')
+        self.assertEqual(question.hint2, 'b')
+
+        stats = provider.stats()
+        self.assertEqual(stats.prompt_tokens, 2 + 2)
+        self.assertGreater(stats.completion_tokens, 0)
+
+    async def test_concurrency_limit(self):
+        provider = FakeProvider(max_concurrency=2)
+        max_in_flight = 0
+
+        async def invoke():
+            nonlocal max_in_flight
+            async for _ in provider.astream('prompt', 'question'):
+                max_in_flight = max(max_in_flight, provider.in_flight)
+
+        await asyncio.gather(*(invoke() for _ in range(5)))
+
+        stats = provider.stats()
+        self.assertEqual(max_in_flight, 2)
+        self.assertEqual(stats.requests, 5)
+        self.assertEqual(stats.in_flight, 0)
+        self.assertEqual(stats.waiting, 0)
+        self.assertGreater(stats.queue_wait_max, 0.0)
+
+    def test_parse_chat_answer(self):
+        answer = ChatProvider.parse_chat_answer('分数: 2分\n答案: 很接近了!')
+
+        self.assertEqual(answer.points, 2)
+        self.assertEqual(answer.answer, '很接近了!')
+
+    async def test_stops_once_fields_are_complete(self):
+        provider = ChattyProvider(max_concurrency=1)
+
+        chat_reply = await provider.ainvoke('prompt', 'question', BaseAnswer)
+
+        self.assertEqual(provider.parse_reply(chat_reply, BaseAnswer).answer, '很接近了!')
+        self.assertEqual(len(provider.sent), 3)
+        self.assertTrue(provider.closed)
+        self.assertEqual(provider.stats().early_stops, 1)
+        self.assertEqual(provider.in_flight, 0)
+
+    async def test_streams_everything_without_fields(self):
+        provider = ChattyProvider(max_concurrency=1)
+
+        chat_reply = await provider.ainvoke('prompt', 'question')
+
+        self.assertTrue(chat_reply.endswith('非常好看'))
+        self.assertEqual(provider.stats().early_stops, 0)
+
+    def test_parse_chat_answer_tolerates_formatting(self):
+        answer = ChatProvider.parse_chat_answer('好的!\n**答案**：很接近了!\n**分数**：2/3')
+
+        self.assertEqual(answer.points, 2)
+        self.assertEqual(answer.answer, '很接近了!')
+
+    async def test_structured_output(self):
+        provider = JsonProvider(max_concurrency=1, structured_output=True)
+
+        chat_reply = await provider.ainvoke('很接近了!', 'question', BaseAnswer)
+        answer = provider.parse_reply(chat_reply, BaseAnswer)
+
+        self.assertEqual(answer.points, 2)
+        self.assertEqual(answer.answer, '很接近了!')
+        self.assertIn('JSON', provider.question)
+
+    async def test_structured_output_disabled(self):
+        provider = JsonProvider(max_concurrency=1)
+
+        chat_reply = await provider.ainvoke('电影', 'question', BaseQuestion)
+
+        self.assertEqual(provider.parse_reply(chat_reply, BaseQuestion).question, '电影')
+
+    def test_parse_success_rate(self):
+        provider = FakeProvider(max_concurrency=1)
+        self.assertEqual(provider.stats().parse_success_rate, 1.0)
+
+        for success in (True, True, True, False):
+            provider.record_parse(success)
+
+        stats = provider.stats()
+        self.assertEqual((stats.parse_successes, stats.parse_failures), (3, 1))
+        self.assertEqual(stats.parse_success_rate, 0.75)
+
+    def test_parse_chat_answers(self):
+        answers = ChatProvider.parse_chat_answers('### 2\n分数: 0\n答案: 差远了\n### 1\n分数: 3分\n答案: 答对了!', 2)
+
+        self.assertEqual([answer.points for answer in answers], [3, 0])
+
+    def test_parse_chat_questions(self):
+        chat_reply = (
+            '好的!\n### 1\n问题: q1\n提示1: a1\n提示2: b1\n\n'
+            '### 3\n问题: q3\n提示1: a3\n提示2: b3\n'
+            '### 2\n问题 q2\n'
+        )
+
+        questions = ChatProvider.parse_chat_questions(chat_reply, 4)
+
+        self.assertEqual([question.question if question else None for question in questions], ['q1', None, 'q3', None])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+import asyncio
+import unittest
+
+from api.ratelimit import MemoryRateLimiter, RedisRateLimiter
+
+try:
+    import lupa  # noqa: F401, fakeredis needs it to run lua scripts
+    from fakeredis import FakeAsyncRedis, FakeServer
+except ImportError:
+    FakeAsyncRedis = None
+
+
+class RateLimiterTests:
+
+    def create_limiter(self, burst: int, per_minute: float, daily_limit: int):
+        raise NotImplementedError
+
+    async def test_burst_then_sustained(self):
+        limiter = self.create_limiter(burst=3, per_minute=60, daily_limit=100)
+
+        results = [await limiter.acquire('ip:1') for _ in range(4)]
+
+        self.assertEqual([result.allowed for result in results], [True, True, True, False])
+        self.assertGreater(results[-1].retry_after, 0.0)
+        self.assertLessEqual(results[-1].retry_after, 1.0)
+
+    async def test_clients_are_isolated(self):
+        limiter = self.create_limiter(burst=1, per_minute=60, daily_limit=100)
+
+        self.assertTrue((await limiter.acquire('ip:1')).allowed)
+        self.assertFalse((await limiter.acquire('ip:1')).allowed)
+        self.assertTrue((await limiter.acquire('ip:2')).allowed)
+
+    async def test_refill(self):
+        limiter = self.create_limiter(burst=1, per_minute=6000, daily_limit=100)
+
+        self.assertTrue((await limiter.acquire('ip:1')).allowed)
+        await asyncio.sleep(0.05)
+        self.assertTrue((await limiter.acquire('ip:1')).allowed)
+
+    async def test_concurrent_acquire(self):
+        limiter = self.create_limiter(burst=5, per_minute=1, daily_limit=100)
+
+        results = await asyncio.gather(*(limiter.acquire('ip:1') for _ in range(20)))
+
+        self.assertEqual(sum(result.allowed for result in results), 5)
+
+    async def test_daily_limit(self):
+        limiter = self.create_limiter(burst=10, per_minute=60, daily_limit=2)
+
+        allowed = [await limiter.acquire_daily() for _ in range(3)]
+
+        self.assertEqual(allowed, [True, True, False])
+        self.assertEqual(await limiter.daily_count(), 2)
+
+    async def test_daily_limit_batch(self):
+        limiter = self.create_limiter(burst=10, per_minute=60, daily_limit=5)
+
+        # a batch that does not fit is rejected as a whole
+        allowed = [await limiter.acquire_daily(3), await limiter.acquire_daily(3), await limiter.acquire_daily(2)]
+
+        self.assertEqual(allowed, [True, False, True])
+        self.assertEqual(await limiter.daily_count(), 5)
+
+
+class TestMemoryRateLimiter(RateLimiterTests, unittest.IsolatedAsyncioTestCase):
+
+    def create_limiter(self, burst: int, per_minute: float, daily_limit: int):
+        return MemoryRateLimiter(burst, per_minute, daily_limit)
+
+    async def test_concurrent_acquire_from_threads(self):
+        limiter = MemoryRateLimiter(burst=50, per_minute=1, daily_limit=1000)
+
+        def acquire():
+            return asyncio.run(limiter.acquire('ip:1')).allowed
+
+        results = await asyncio.gather(*(asyncio.to_thread(acquire) for _ in range(200)))
+
+        self.assertEqual(sum(results), 50)
+
+
+@unittest.skipIf(FakeAsyncRedis is None, 'fakeredis[lua] is not installed')
+class TestRedisRateLimiter(RateLimiterTests, unittest.IsolatedAsyncioTestCase):
+
+    def create_limiter(self, burst: int, per_minute: float, daily_limit: int):
+        # a server per test, the daily key would be shared otherwise
+        return RedisRateLimiter(FakeAsyncRedis(server=FakeServer()), burst, per_minute, daily_limit)
+
+
+if __name__ == '__main__':
+    unittest.main()
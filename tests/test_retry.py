@@ -0,0 +1,116 @@
+import unittest
+
+import httpx
+
+from api.config import TMDB_BASE_URL
+from api.retry import Retrier, RetryBudget, is_parse_error, is_retryable_http_error, retry_budget
+from api.tmdb import TmdbClient
+from tests.test_tmdb import IMAGES_CONFIG, MOVIE
+
+
+class TestRetrier(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.retrier = Retrier(max_attempts=3, base_delay=0.001, max_delay=0.01)
+
+    async def test_retries_same_stage(self):
+        replies = iter(['问题： 全角冒号', '问题: q\n提示1: a\n提示2: b'])
+        calls = 0
+
+        async def ask():
+            nonlocal calls
+            calls += 1
+            reply = next(replies)
+            if '：' in reply:
+                raise ValueError('unexpected format')
+            return reply
+
+        reply = await self.retrier.run('llm_question', ask, is_parse_error)
+
+        self.assertTrue(reply.startswith('问题: q'))
+        self.assertEqual(calls, 2)
+        self.assertEqual(self.retrier.stats().retries, {'llm_question:ValueError': 1})
+
+    async def test_non_retryable_error(self):
+        async def fail():
+            raise KeyError('title')
+
+        with self.assertRaises(KeyError):
+            await self.retrier.run('llm_question', fail, is_parse_error)
+        self.assertEqual(self.retrier.retries, {})
+
+    async def test_max_attempts(self):
+        calls = 0
+
+        async def fail():
+            nonlocal calls
+            calls += 1
+            raise ValueError('unexpected format')
+
+        with self.assertRaises(ValueError):
+            await self.retrier.run('llm_answer', fail, is_parse_error)
+        self.assertEqual(calls, 3)
+        self.assertEqual(self.retrier.exhausted, 1)
+
+    async def test_budget_shared_across_stages(self):
+        retry_budget.set(RetryBudget(1))
+        calls = 0
+
+        async def fail():
+            nonlocal calls
+            calls += 1
+            raise ValueError('unexpected format')
+
+        with self.assertRaises(ValueError):
+            await self.retrier.run('llm_question', fail, is_parse_error)
+        with self.assertRaises(ValueError):
+            await self.retrier.run('llm_answer', fail, is_parse_error)
+
+        # one retry for the first stage, none left for the second
+        self.assertEqual(calls, 3)
+
+    def test_delay_is_bounded(self):
+        response = httpx.Response(429, headers={'Retry-After': '30'}, request=httpx.Request('GET', TMDB_BASE_URL))
+        error = httpx.HTTPStatusError('rate limited', request=response.request, response=response)
+
+        self.assertEqual(self.retrier.delay(1, error), 0.01)
+        self.assertLessEqual(self.retrier.delay(10, ValueError()), 0.01)
+
+
+class TestTmdbRetry(unittest.IsolatedAsyncioTestCase):
+
+    async def test_refetches_only_failing_request(self):
+        requests = []
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            requests.append(request.url.path)
+            if len(requests) == 1:
+                return httpx.Response(429)
+            if request.url.path.endswith('/404'):
+                return httpx.Response(404)
+            return httpx.Response(200, json=dict(MOVIE))
+
+        retrier = Retrier(max_attempts=3, base_delay=0.001, max_delay=0.01)
+        http_client = httpx.AsyncClient(base_url=TMDB_BASE_URL, transport=httpx.MockTransport(handler))
+        tmdb_client = TmdbClient('key', IMAGES_CONFIG, http_client, retrier=retrier)
+
+        movie = await tmdb_client.get_movie_details(MOVIE['id'])
+        self.assertEqual(movie['title'], MOVIE['title'])
+        self.assertEqual(retrier.retries, {'tmdb:http_429': 1})
+
+        # client errors are not retried
+        with self.assertRaises(httpx.HTTPStatusError):
+            await tmdb_client.get_movie_details(404)
+        self.assertEqual(len(requests), 3)
+
+        await tmdb_client.aclose()
+
+    def test_retryable_http_errors(self):
+        request = httpx.Request('GET', TMDB_BASE_URL)
+
+        self.assertTrue(is_retryable_http_error(httpx.ConnectTimeout('timeout', request=request)))
+        self.assertFalse(is_retryable_http_error(ValueError()))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,121 @@
+import asyncio
+import unittest
+
+from api.common import MAX_ANSWER_LENGTH, BaseAnswer, BaseQuestion
+from api.config import QuizConfig
+from api.rooms import RoomError, RoomManager
+
+
+class TestRoomManager(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.generated = 0
+        self.graded = []
+        self.events = {}
+
+        async def generate(quiz_config: QuizConfig):
+            self.generated += 1
+            return BaseQuestion(question='question', hint1='hint1', hint2='hint2'), {'id': 1, 'title': 'Justice League'}
+
+        async def grade(movie: dict, answers: list[str]):
+            self.graded.append(answers)
+            return [BaseAnswer(points=3 if answer == movie['title'] else 0, answer='feedback') for answer in answers]
+
+        self.manager = RoomManager(generate, grade, maxsize=10, ttl=60, max_players=3)
+        self.room = self.manager.create(QuizConfig(), round_seconds=0.2)
+
+    async def asyncTearDown(self):
+        await self.manager.close()
+
+    def join(self, player: str):
+        self.events[player] = []
+
+        async def send(event: dict):
+            self.events[player].append(event)
+
+        self.manager.join(self.room, player, send)
+
+    async def wait_for_results(self, player: str):
+        while not any(event['type'] == 'results' for event in self.events[player]):
+            await asyncio.sleep(0.01)
+        return self.events[player][-1]
+
+    async def test_round_is_broadcast_and_graded_once(self):
+        for player in ('alice', 'bob', 'carol'):
+            self.join(player)
+
+        await self.manager.start_round(self.room)
+        self.assertEqual([events[0]['type'] for events in self.events.values()], ['question'] * 3)
+
+        self.assertTrue(self.manager.answer(self.room, 'alice', 'Justice League'))
+        self.assertFalse(self.manager.answer(self.room, 'alice', 'Frozen'))
+        self.assertTrue(self.manager.answer(self.room, 'bob', 'Frozen'))
+        self.assertTrue(self.manager.answer(self.room, 'carol', 'Frozen'))
+
+        # every member answered, the round ends before the deadline
+        results = await asyncio.wait_for(self.wait_for_results('bob'), 0.1)
+
+        self.assertEqual(self.generated, 1)
+        self.assertEqual(self.graded, [['Justice League', 'Frozen']])
+        self.assertEqual(results['round'], 1)
+        self.assertEqual(results['scoreboard'][0], {'player': 'alice', 'points': 3})
+        self.assertFalse(self.room.accepting_answers)
+
+    async def test_long_answers_are_rejected(self):
+        self.join('alice')
+        await self.manager.start_round(self.room)
+
+        self.assertFalse(self.manager.answer(self.room, 'alice', 'x' * (MAX_ANSWER_LENGTH + 1)))
+        self.assertTrue(self.manager.answer(self.room, 'alice', 'Justice League'))
+
+    async def test_round_ends_at_deadline(self):
+        self.join('alice')
+        self.join('bob')
+
+        await self.manager.start_round(self.room)
+        self.manager.answer(self.room, 'alice', 'Justice League')
+        with self.assertRaises(RoomError):
+            await self.manager.start_round(self.room)
+
+        results = await self.wait_for_results('bob')
+
+        self.assertEqual([result['player'] for result in results['results']], ['alice'])
+        self.assertEqual(self.room.scores, {'alice': 3, 'bob': 0})
+
+    async def test_join_limits(self):
+        self.join('alice')
+        with self.assertRaises(RoomError):
+            self.join('alice')
+
+        self.join('bob')
+        self.join('carol')
+        with self.assertRaises(RoomError):
+            self.join('dave')
+
+    async def test_unreachable_members_are_dropped(self):
+        self.join('alice')
+
+        async def broken(event: dict):
+            raise ConnectionError('gone')
+
+        self.manager.join(self.room, 'bob', broken)
+        await self.manager.start_round(self.room)
+
+        self.assertEqual(list(self.room.members), ['alice'])
+
+    async def test_stalled_members_are_dropped(self):
+        self.manager.send_timeout = 0.05
+        self.join('alice')
+
+        async def stalled(event: dict):
+            await asyncio.Event().wait()
+
+        self.manager.join(self.room, 'bob', stalled)
+        await self.manager.start_round(self.room)
+
+        self.assertEqual(list(self.room.members), ['alice'])
+        self.assertEqual(self.events['alice'][-1]['type'], 'question')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,145 @@
+import asyncio
+import unittest
+
+from api.common import BaseAnswer
+from api.models.base import ChatProvider
+from api.models.router import CLOSED, OPEN, LazyProvider, ProviderRouter
+
+
+class FakeProvider(ChatProvider):
+
+    def __init__(self, name: str, delay: float = 0.0, fail: bool = False):
+        super().__init__(max_concurrency=4)
+        self.name = name
+        self.delay = delay
+        self.fail = fail
+        self.calls = 0
+
+    async def _astream(self, prompt: str, question: str):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        if self.fail:
+            raise ConnectionError(f'{self.name} is down')
+        for chunk in [self.name, '\n', prompt]:
+            yield chunk
+
+
+class TestProviderRouter(unittest.IsolatedAsyncioTestCase):
+
+    async def test_prefers_faster_provider(self):
+        slow, fast = FakeProvider('slow', delay=0.05), FakeProvider('fast', delay=0.0)
+        router = ProviderRouter([slow, fast], failure_threshold=3, open_seconds=30, ewma_alpha=0.5)
+
+        # both get sampled once, then the faster one wins
+        await router.ainvoke('p', 'q')
+        await router.ainvoke('p', 'q')
+        reply = await router.ainvoke('p', 'q')
+
+        self.assertTrue(reply.startswith('fast'))
+        self.assertEqual([provider.name for provider in router.candidates()], ['fast', 'slow'])
+
+    async def test_failover_before_first_token(self):
+        down, up = FakeProvider('down', fail=True), FakeProvider('up', delay=0.01)
+        router = ProviderRouter([down, up], failure_threshold=3, open_seconds=30, ewma_alpha=0.5)
+
+        reply = await router.ainvoke('p', 'q')
+
+        self.assertTrue(reply.startswith('up'))
+        stats = {stat.name: stat for stat in router.stats()}
+        self.assertEqual(stats['down'].failures, 1)
+        self.assertEqual(stats['up'].successes, 1)
+
+    async def test_all_providers_fail(self):
+        router = ProviderRouter([FakeProvider('down', fail=True)], failure_threshold=3, open_seconds=30, ewma_alpha=0.5)
+
+        with self.assertRaises(ConnectionError):
+            await router.ainvoke('p', 'q')
+
+    async def test_circuit_opens_and_probes(self):
+        down, up = FakeProvider('down', fail=True), FakeProvider('up', delay=0.01)
+        router = ProviderRouter([down, up], failure_threshold=2, open_seconds=0.05, ewma_alpha=0.5)
+
+        # an untried provider sorts first, so 'down' keeps getting the first attempt until it opens
+        for _ in range(3):
+            await router.ainvoke('p', 'q')
+
+        self.assertEqual(router.health['down'].state, OPEN)
+        self.assertEqual(down.calls, 2)
+
+        # after the open period one request probes it again
+        await asyncio.sleep(0.06)
+        down.fail = False
+        reply = await router.ainvoke('p', 'q')
+
+        self.assertTrue(reply.startswith('down'))
+        self.assertEqual(down.calls, 3)
+        self.assertEqual(router.health['down'].state, CLOSED)
+
+    async def test_failed_probe_reopens(self):
+        down = FakeProvider('down', fail=True)
+        router = ProviderRouter([down, FakeProvider('up')], failure_threshold=1, open_seconds=0.05, ewma_alpha=0.5)
+
+        await router.ainvoke('p', 'q')
+        await asyncio.sleep(0.06)
+        await router.ainvoke('p', 'q')
+
+        self.assertEqual(down.calls, 2)
+        self.assertEqual(router.health['down'].state, OPEN)
+
+    async def test_lazy_provider(self):
+        created = []
+
+        def factory():
+            created.append(True)
+            return FakeProvider('inner')
+
+        lazy = LazyProvider('lazy', max_concurrency=2, factory=factory)
+        router = ProviderRouter([lazy], failure_threshold=3, open_seconds=30, ewma_alpha=0.5)
+        self.assertEqual(created, [])
+
+        await router.preload()
+        reply = await router.ainvoke('p', 'q')
+
+        self.assertTrue(reply.startswith('inner'))
+        self.assertEqual(len(created), 1)
+        self.assertEqual(router.stats()[0].name, 'lazy')
+
+    async def test_lazy_provider_load_failure_fails_over(self):
+        def factory():
+            raise ImportError('sdk not installed')
+
+        router = ProviderRouter(
+            [LazyProvider('broken', 1, factory), FakeProvider('up')], failure_threshold=3, open_seconds=30, ewma_alpha=0.5
+        )
+
+        await router.preload()
+        reply = await router.ainvoke('p', 'q')
+
+        self.assertTrue(reply.startswith('up'))
+
+    async def test_early_stop_is_a_success(self):
+        chatty = FakeProvider('chatty')
+        router = ProviderRouter([chatty], failure_threshold=1, open_seconds=30, ewma_alpha=0.5)
+
+        reply = await router.ainvoke('分数: 2\n答案: 接近了\n', 'q', BaseAnswer)
+
+        self.assertEqual(router.parse_reply(reply, BaseAnswer).points, 2)
+        self.assertEqual(router.stats()[0].early_stops, 1)
+        self.assertEqual(router.health['chatty'].successes, 1)
+
+    async def test_parse_reply_counts_for_serving_provider(self):
+        down, up = FakeProvider('down', fail=True), FakeProvider('up')
+        router = ProviderRouter([down, up], failure_threshold=3, open_seconds=30, ewma_alpha=0.5)
+
+        reply = await router.ainvoke('分数: 3\n答案: 答对了!', 'q', BaseAnswer)
+        self.assertEqual(router.parse_reply(reply, BaseAnswer).points, 3)
+        with self.assertRaises(ValueError):
+            router.parse_reply(await router.ainvoke('p', 'q', BaseAnswer), BaseAnswer)
+
+        stats = {provider.name: provider for provider in router.stats()}
+        self.assertEqual((stats['up'].parse_successes, stats['up'].parse_failures), (1, 1))
+        self.assertEqual((stats['down'].parse_successes, stats['down'].parse_failures), (0, 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+import asyncio
+import unittest
+from datetime import datetime
+
+from api.common import BaseQuestion, SessionData
+from api.sessions import MemorySessionStore, RedisSessionStore, dump_session, load_session
+
+try:
+    from fakeredis import FakeAsyncRedis
+except ImportError:
+    FakeAsyncRedis = None
+
+
+def _session(quiz_id: str) -> SessionData:
+    return SessionData(
+        quiz_id=quiz_id,
+        movie_id=141052,
+        question=BaseQuestion(question='问题', hint1='提示1', hint2='提示2'),
+        started_at=datetime(2024, 4, 6, 12, 39, 29)
+    )
+
+
+class SessionStoreTests:
+
+    def create_store(self, maxsize: int, ttl: int):
+        raise NotImplementedError
+
+    async def test_set_get_pop(self):
+        store = self.create_store(maxsize=10, ttl=60)
+
+        await store.set(_session('a'))
+
+        self.assertEqual(await store.get('a'), _session('a'))
+        self.assertEqual(await store.pop('a'), _session('a'))
+        self.assertIsNone(await store.pop('a'))
+        self.assertEqual(await store.size(), 0)
+
+    async def test_maxsize(self):
+        store = self.create_store(maxsize=2, ttl=60)
+
+        for quiz_id in ('a', 'b', 'c'):
+            await store.set(_session(quiz_id))
+
+        self.assertEqual(await store.size(), 2)
+        self.assertIsNone(await store.get('a'))
+        self.assertEqual(sorted(session.quiz_id for session in await store.values()), ['b', 'c'])
+
+    async def test_ttl(self):
+        store = self.create_store(maxsize=10, ttl=60)
+
+        await store.set(_session('a'), ttl=1)
+        await store.set(_session('b'))
+        await asyncio.sleep(1.1)
+
+        self.assertIsNone(await store.get('a'))
+        self.assertEqual([session.quiz_id for session in await store.values()], ['b'])
+
+
+class TestMemorySessionStore(SessionStoreTests, unittest.IsolatedAsyncioTestCase):
+
+    def create_store(self, maxsize: int, ttl: int):
+        return MemorySessionStore(maxsize, ttl)
+
+
+@unittest.skipUnless(FakeAsyncRedis, 'fakeredis is not installed')
+class TestRedisSessionStore(SessionStoreTests, unittest.IsolatedAsyncioTestCase):
+
+    def create_store(self, maxsize: int, ttl: int):
+        return RedisSessionStore(FakeAsyncRedis(), maxsize, ttl)
+
+
+class TestSerialization(unittest.TestCase):
+
+    def test_roundtrip(self):
+        session = _session('a')
+
+        self.assertEqual(load_session(dump_session(session)), session)
+        self.assertEqual(load_session(dump_session(session).encode()), session)
+
+    def test_load_without_quiz_config(self):
+        session = load_session('["a",141052,"问题","提示1","提示2",1712407169.0]')
+
+        self.assertEqual(session.movie_id, 141052)
+        self.assertEqual(session.personality, 'DEFAULT')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+import asyncio
+import unittest
+
+from api.singleflight import SingleFlight
+
+
+class TestSingleFlight(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.flight = SingleFlight('test')
+        self.calls = 0
+
+    async def call(self, result='result', error: Exception | None = None):
+        self.calls += 1
+        await asyncio.sleep(0.01)
+        if error:
+            raise error
+        return result
+
+    async def test_concurrent_calls_are_coalesced(self):
+        results = await asyncio.gather(*(self.flight.do('key', self.call) for _ in range(5)))
+
+        self.assertEqual(results, ['result'] * 5)
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(self.flight.coalesced, 4)
+        self.assertEqual(self.flight.calls, {})
+
+    async def test_different_keys_and_later_calls_are_not_coalesced(self):
+        await asyncio.gather(self.flight.do('a', self.call), self.flight.do('b', self.call))
+        await self.flight.do('a', self.call)
+
+        self.assertEqual(self.calls, 3)
+        self.assertEqual(self.flight.coalesced, 0)
+
+    async def test_error_is_shared(self):
+        results = await asyncio.gather(
+            *(self.flight.do('key', lambda: self.call(error=ConnectionError('down'))) for _ in range(3)),
+            return_exceptions=True
+        )
+
+        self.assertTrue(all(isinstance(result, ConnectionError) for result in results))
+        self.assertEqual(self.calls, 1)
+
+    async def test_cancelled_caller_does_not_cancel_others(self):
+        first = asyncio.create_task(self.flight.do('key', self.call))
+        second = asyncio.create_task(self.flight.do('key', self.call))
+        await asyncio.sleep(0)
+
+        first.cancel()
+
+        self.assertEqual(await second, 'result')
+        self.assertEqual(self.calls, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
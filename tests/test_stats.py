@@ -0,0 +1,120 @@
+import json
+import os
+import pickle
+import tempfile
+import time
+import unittest
+from datetime import datetime
+from pathlib import Path
+
+from api.common import BaseQuestion, SessionData, Stats
+from api.config import QuizConfig
+from api.stats import StatsStore
+
+
+def _session(popularity: int, personality: str) -> SessionData:
+    question = BaseQuestion(question='问题', hint1='提示1', hint2='提示2')
+    return SessionData('a', 141052, question, datetime.now(), popularity, personality, 'DEFAULT')
+
+
+class TestStatsStore(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.directory = self.tmp_dir.name
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def create_store(self) -> StatsStore:
+        return StatsStore(self.directory, snapshot_interval=60, stale_after=600)
+
+    def test_aggregates(self):
+        store = self.create_store()
+
+        store.record_quiz(QuizConfig(popularity=3, personality='CHRISTMAS'), 0.3)
+        store.record_answer(_session(3, 'CHRISTMAS'), 3, 0.05)
+        store.record_provider('qwen', 'question', 2.0)
+
+        stats = store.load()
+        self.assertEqual(stats.quiz_count_total, 1)
+        self.assertEqual(stats.points_total, 3)
+        self.assertEqual(stats.by_personality['CHRISTMAS'].points, {'3': 1})
+        self.assertEqual(stats.by_popularity['3'].quiz_latency.buckets, {'0.5': 1})
+        self.assertEqual(stats.by_language['DEFAULT'].answer_latency.count, 1)
+        self.assertEqual(stats.by_provider['qwen'].quiz_latency.buckets, {'2.5': 1})
+
+    def test_shards_are_merged(self):
+        workers = [self.create_store() for _ in range(3)]
+        for worker in workers:
+            worker.record_quiz(QuizConfig(), 1.0)
+            worker.snapshot()
+
+        stats = workers[0].load()
+
+        self.assertEqual(stats.quiz_count_total, 3)
+        self.assertEqual(stats.by_personality['DEFAULT'].quiz_count, 3)
+        # snapshots are plain json
+        shard = json.loads(workers[1].shard_path.read_text())
+        self.assertEqual(shard['quiz_count_total'], 1)
+
+    def test_snapshot_survives_crash(self):
+        worker = self.create_store()
+        worker.record_quiz(QuizConfig(), 1.0)
+        worker.snapshot()
+        del worker
+
+        self.assertEqual(self.create_store().load().quiz_count_total, 1)
+
+    def test_stale_shards_are_compacted(self):
+        dead, alive = self.create_store(), self.create_store()
+        dead.record_quiz(QuizConfig(), 1.0)
+        dead.snapshot()
+        alive.record_quiz(QuizConfig(), 1.0)
+        alive.snapshot()
+        old = time.time() - 3600
+        os.utime(dead.shard_path, (old, old))
+
+        alive.compact()
+
+        self.assertFalse(dead.shard_path.exists())
+        self.assertTrue(alive.shard_path.exists())
+        self.assertEqual(self.create_store().load().quiz_count_total, 2)
+
+    async def test_stop_folds_own_shard(self):
+        store = self.create_store()
+        store.start()
+        store.record_answer(_session(1, 'DEFAULT'), 2, 0.1)
+
+        await store.stop()
+
+        self.assertEqual([path.name for path in Path(self.directory).glob('worker-*.json')], [])
+        self.assertEqual(self.create_store().load().points_total, 2)
+        self.assertEqual(store.load().points_total, 2)
+
+    async def test_start_imports_legacy_stats_once(self):
+        legacy_path = Path(self.directory) / 'stats.pkl'
+        with legacy_path.open('wb') as f:
+            pickle.dump(Stats(quiz_count_total=5, points_total=12), f)
+        directory = Path(self.directory) / 'stats'
+
+        for _ in range(2):
+            store = StatsStore(str(directory), snapshot_interval=60, stale_after=600, legacy_path=str(legacy_path))
+            store.start()
+            await store.stop()
+
+        stats = StatsStore(str(directory), snapshot_interval=60, stale_after=600).load()
+        self.assertEqual((stats.quiz_count_total, stats.points_total), (5, 12))
+        self.assertFalse(legacy_path.exists())
+        self.assertTrue(legacy_path.with_name('stats.pkl.imported').exists())
+
+    def test_no_files_before_start(self):
+        directory = Path(self.directory) / 'stats'
+
+        StatsStore(str(directory), snapshot_interval=60, stale_after=600)
+
+        self.assertFalse(directory.exists())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,149 @@
+import json
+import os
+import tempfile
+import time
+import unittest
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import httpx
+
+from api.store import PAGE_SIZE, MovieStore, MovieStoreUpdater, read_snapshot
+
+MOVIE = json.loads((Path(__file__).parent.parent / 'movie.json').read_text())
+
+
+def _movie(movie_id: int, **kwargs) -> dict:
+    movie = {
+        'id': movie_id,
+        'title': f'movie {movie_id}',
+        'vote_average': 7.0,
+        'vote_count': 2000,
+        'popularity': float(movie_id),
+        'release_date': '2010-01-01',
+        'genre_ids': [28],
+        'original_language': 'en'
+    }
+    movie.update(kwargs)
+    return movie
+
+
+class FakeTmdbClient:
+
+    def __init__(self, changes, gone=()):
+        self.changes = changes
+        self.gone = set(gone)
+        self.fetched = []
+
+    async def get_movie_changes(self, start_date, end_date):
+        self.window = (start_date, end_date)
+        return self.changes
+
+    async def refresh_movie_details(self, movie_id: int):
+        self.fetched.append(movie_id)
+        if movie_id in self.gone:
+            request = httpx.Request('GET', f'/movie/{movie_id}')
+            raise httpx.HTTPStatusError('not found', request=request, response=httpx.Response(404, request=request))
+        return _movie(movie_id, title='updated')
+
+
+class TestMovieStore(unittest.TestCase):
+
+    def setUp(self):
+        self.store = MovieStore()
+        self.store.replace([
+            _movie(1, vote_average=5.5, release_date='1999-05-01'),
+            _movie(2, vote_count=500, genre_ids=[28, 12]),
+            _movie(3, genre_ids=[12], release_date=''),
+            _movie(4, genre_ids=[28, 12]),
+            _movie(5, adult=True)
+        ])
+
+    def test_filter(self):
+        self.assertEqual([movie['id'] for movie in self.store.filter(6.0, 1000)], [4, 3])
+        self.assertEqual([movie['id'] for movie in self.store.filter(year_max=2000)], [1])
+        self.assertEqual([movie['id'] for movie in self.store.filter(year_min=2000)], [4, 2])
+        self.assertEqual([movie['id'] for movie in self.store.filter(genre_ids=[28, 12])], [4, 2])
+        self.assertEqual(self.store.filter(genre_ids=[99]), [])
+
+    def test_pages(self):
+        self.store.replace(_movie(i) for i in range(1, 46))
+
+        self.assertEqual([movie['id'] for movie in self.store.get_movies(3, 5.0, 1000)], [5, 4, 3, 2, 1])
+        self.assertEqual(len(self.store.get_movies(1, 5.0, 1000)), PAGE_SIZE)
+        self.assertGreaterEqual(self.store.get_random_movie(2, 3, 5.0, 1000)['id'], 1)
+        self.assertLessEqual(self.store.get_random_movie(2, 3, 5.0, 1000)['id'], 25)
+        self.assertIsNone(self.store.get_random_movie(4, 5, 5.0, 1000))
+
+    def test_original_language(self):
+        self.store.upsert([_movie(6, original_language='fr'), _movie(7, original_language=None)])
+
+        self.assertEqual([movie['id'] for movie in self.store.filter(6.0, 1000, original_language='en')], [4, 3])
+        self.assertEqual([movie['id'] for movie in self.store.get_movies(1, 6.0, 1000, 'fr')], [6])
+        self.assertEqual(self.store.get_random_movie(1, 1, 6.0, 1000, 'fr')['id'], 6)
+        self.assertEqual(len(self.store.get_movies(1, 6.0, 1000)), 4)
+
+    def test_upsert_and_remove(self):
+        self.store.upsert([_movie(1, vote_average=9.0, popularity=10.0), _movie(6), _movie(3, adult=True)])
+        self.store.remove([2])
+
+        self.assertEqual([movie['id'] for movie in self.store.filter(6.0, 1000)], [1, 6, 4])
+        self.assertNotIn(3, self.store)
+        self.assertNotIn(5, self.store)
+
+    def test_changed_columns_leave_the_store_as_it_is(self):
+        columns = self.store.changed_columns([_movie(6, genre_ids=[99])], [2])
+
+        # readers keep the old columns, a genre new to the changes does not match them
+        self.assertEqual(self.store.filter(genre_ids=[99]), [])
+        self.assertIn(2, self.store)
+
+        self.store.columns = columns
+        self.assertEqual([movie['id'] for movie in self.store.filter(genre_ids=[99])], [6])
+        self.assertEqual([movie['id'] for movie in self.store.filter(genre_ids=[28, 12])], [4])
+
+    def test_snapshot_files(self):
+        with tempfile.TemporaryDirectory() as snapshot_dir:
+            Path(snapshot_dir, 'a.json').write_text(json.dumps(MOVIE))
+            Path(snapshot_dir, 'b.json').write_text(json.dumps({'page': 1, 'results': [_movie(1), _movie(2)]}))
+            Path(snapshot_dir, 'c.jsonl').write_text(json.dumps(_movie(3)) + '\n\n' + json.dumps(_movie(2, title='last')) + '\n')
+
+            self.store.load(snapshot_dir)
+
+            self.assertEqual(len(self.store), 4)
+            self.assertEqual(self.store.get(2)['title'], 'last')
+            # details carry genres instead of genre_ids
+            self.assertEqual(self.store.filter(genre_ids=[MOVIE['genres'][0]['id']])[0]['id'], MOVIE['id'])
+
+            path = os.path.join(snapshot_dir, 'snapshot.jsonl')
+            self.store.save(path)
+            self.assertEqual({movie['id'] for movie in read_snapshot(path)}, {1, 2, 3, MOVIE['id']})
+
+
+class TestMovieStoreUpdater(unittest.IsolatedAsyncioTestCase):
+
+    async def test_update(self):
+        with tempfile.TemporaryDirectory() as snapshot_dir:
+            path = os.path.join(snapshot_dir, 'snapshot.json')
+            Path(path).write_text(json.dumps([_movie(1), _movie(2), _movie(3)]))
+            # a month old snapshot only gets the changes TMDB still has
+            month_ago = time.time() - 30 * 24 * 60 * 60
+            os.utime(path, (month_ago, month_ago))
+
+            store = MovieStore()
+            store.load(path)
+            tmdb_client = FakeTmdbClient(changes=[1, 3, 99], gone=[3])
+            updater = MovieStoreUpdater(store, tmdb_client, interval=60, concurrency=2, path=path)
+
+            await updater.update()
+
+            self.assertEqual(sorted(tmdb_client.fetched), [1, 3])
+            self.assertGreaterEqual(tmdb_client.window[0], (datetime.now() - timedelta(days=14)).date())
+            self.assertEqual(store.get(1)['title'], 'updated')
+            self.assertNotIn(3, store)
+            self.assertEqual(updater.updated, 2)
+            self.assertEqual({movie['id'] for movie in read_snapshot(path)}, {1, 2})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+import unittest
+
+from api.streaming import ANSWER_FIELDS, QUESTION_FIELDS, StreamingFieldParser, sse_event
+
+
+class TestStreaming(unittest.TestCase):
+
+    def test_fields_are_emitted_when_line_completes(self):
+        parser = StreamingFieldParser(QUESTION_FIELDS)
+
+        self.assertEqual(parser.feed('问题: 这是一部'), [])
+        self.assertEqual(parser.feed('电影: 猜猜看\n提示1: 科幻'), [('question', '这是一部电影: 猜猜看')])
+        self.assertEqual(parser.feed('\n提示2: 正_联_'), [('hint1', '科幻')])
+        self.assertFalse(parser.complete)
+
+        self.assertEqual(parser.close(), [('hint2', '正_联_')])
+        self.assertTrue(parser.complete)
+
+    def test_chatter_is_ignored(self):
+        parser = StreamingFieldParser(ANSWER_FIELDS)
+
+        parsed = parser.feed('好的!\n分数: 3\n答案: 完全正确!\n补充: 不需要\n')
+
+        self.assertEqual(parsed, [('points', '3'), ('answer', '完全正确!')])
+        self.assertEqual(parser.values, {'points': '3', 'answer': '完全正确!'})
+
+    def test_labels_in_any_order(self):
+        parser = StreamingFieldParser(ANSWER_FIELDS)
+
+        parsed = parser.feed('**答案**：完全正确!\n**分数**：3\n')
+
+        self.assertEqual(parsed, [('answer', '完全正确!'), ('points', '3')])
+        self.assertTrue(parser.complete)
+
+    def test_preamble_with_colon_is_not_a_field(self):
+        parser = StreamingFieldParser(QUESTION_FIELDS)
+
+        parsed = parser.feed('好的，以下是我的回复: 祝你好运\n问题: 这是问题\n提示1: 第一个提示\n提示2: 第二个提示\n')
+
+        self.assertEqual(parsed, [('question', '这是问题'), ('hint1', '第一个提示'), ('hint2', '第二个提示')])
+        self.assertTrue(parser.complete)
+
+    def test_unknown_labels_on_close(self):
+        parser = StreamingFieldParser(QUESTION_FIELDS)
+
+        self.assertEqual(parser.feed('Frage: a\nTipp 1: b\n'), [])
+        # two lines for three fields, no telling which is which
+        self.assertEqual(parser.close(), [])
+        self.assertFalse(parser.complete)
+
+        parser = StreamingFieldParser(QUESTION_FIELDS)
+        parser.feed('Frage: a\n提示1: b\nTipp 2: c')
+        self.assertEqual(parser.close(), [('question', 'a'), ('hint2', 'c')])
+        self.assertEqual(parser.values, {'question': 'a', 'hint1': 'b', 'hint2': 'c'})
+
+    def test_unknown_labels_with_chatter(self):
+        parser = StreamingFieldParser(QUESTION_FIELDS)
+
+        parser.feed('Hinweis: x\nFrage: a\nTipp 1: b\nTipp 2: c\n')
+
+        self.assertEqual(parser.close(), [])
+        self.assertEqual(parser.values, {})
+
+    def test_sse_event(self):
+        self.assertEqual(sse_event('hint1', '科幻'), 'event: hint1\ndata: "科幻"\n\n')
+
+
+if __name__ == '__main__':
+    unittest.main()
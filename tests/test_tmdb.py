@@ -0,0 +1,174 @@
+import asyncio
+import json
+import tempfile
+import unittest
+from datetime import date
+from pathlib import Path
+
+import httpx
+
+from api.config import DEFAULT_TMDB_IMAGES_CONFIG, TMDB_BASE_URL, Settings, TmdbImagesConfig, load_tmdb_images_config, save_tmdb_images_config
+from api.store import MovieStore
+from api.tmdb import TmdbClient
+
+MOVIE = json.loads((Path(__file__).parent.parent / 'movie.json').read_text())
+
+IMAGES_CONFIG = TmdbImagesConfig(
+    base_url='http://image.tmdb.org/t/p/',
+    secure_base_url='https://image.tmdb.org/t/p/',
+    backdrop_sizes=['original'],
+    logo_sizes=['original'],
+    poster_sizes=['w500', 'original'],
+    profile_sizes=['original'],
+    still_sizes=['original']
+)
+
+
+class TestTmdb(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.requests = []
+        self.page_size = 1
+        self.down = False
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            self.requests.append(request)
+            if self.down:
+                raise httpx.ConnectError('tmdb is down', request=request)
+            if request.url.path.endswith('/configuration'):
+                return httpx.Response(200, json={'images': IMAGES_CONFIG.model_dump()})
+            if request.url.path.endswith('/discover/movie'):
+                return httpx.Response(200, json={'results': [
+                    {'id': MOVIE['id'] + i, 'poster_path': MOVIE['poster_path']} for i in range(self.page_size)
+                ]})
+            if request.url.path.endswith('/movie/changes'):
+                page = int(request.url.params['page'])
+                return httpx.Response(200, json={'results': [{'id': page}], 'page': page, 'total_pages': 2})
+            return httpx.Response(200, json=dict(MOVIE, id=int(request.url.path.rsplit('/', 1)[1])))
+
+        http_client = httpx.AsyncClient(base_url=TMDB_BASE_URL, transport=httpx.MockTransport(handler))
+        self.tmdb_client = TmdbClient('key', IMAGES_CONFIG, http_client)
+
+    async def asyncTearDown(self):
+        await self.tmdb_client.aclose()
+
+    async def test_get_movies(self):
+        movies = await self.tmdb_client.get_movies(2, 5.0, 1000.0)
+
+        self.assertEqual(movies[0]['id'], MOVIE['id'])
+        self.assertEqual(movies[0]['poster_url'], f'https://image.tmdb.org/t/p/original{MOVIE["poster_path"]}')
+        self.assertEqual(self.requests[0].url.path, '/3/discover/movie')
+        self.assertEqual(self.requests[0].url.params['page'], '2')
+
+    async def test_get_random_movie(self):
+        movie = await self.tmdb_client.get_random_movie(1, 3, 5.0, 1000.0)
+
+        self.assertEqual(movie['title'], MOVIE['title'])
+        self.assertEqual(self.requests[1].url.path, f'/3/movie/{MOVIE["id"]}')
+
+    async def test_get_movie_details_cached(self):
+        await self.tmdb_client.get_movie_details(MOVIE['id'])
+        await self.tmdb_client.get_movie_details(MOVIE['id'])
+
+        self.assertEqual(len(self.requests), 1)
+
+    async def test_concurrent_cache_misses_are_coalesced(self):
+        movies = await asyncio.gather(*(self.tmdb_client.get_movie_details(MOVIE['id']) for _ in range(10)))
+
+        self.assertTrue(all(movie['title'] == MOVIE['title'] for movie in movies))
+        self.assertEqual(len(self.requests), 1)
+        self.assertEqual(self.tmdb_client.details_flight.coalesced, 9)
+
+    async def test_prefetch_details(self):
+        self.page_size = 5
+        self.tmdb_client.prefetch_details = True
+
+        movie = await self.tmdb_client.get_random_movie(1, 1, 5.0, 1000.0)
+        await asyncio.gather(*self.tmdb_client._prefetch_tasks)
+
+        # the whole page is cached, each movie was fetched once
+        self.assertEqual(self.tmdb_client.prefetched, 4)
+        self.assertEqual(len(self.requests), 1 + 5)
+        for i in range(5):
+            self.assertIn(MOVIE['id'] + i, self.tmdb_client.details_cache)
+
+        await self.tmdb_client.get_random_movie(1, 1, 5.0, 1000.0)
+        self.assertEqual(len(self.requests), 1 + 5)
+        self.assertEqual(movie['title'], MOVIE['title'])
+
+    async def test_snapshot_answers_discover_queries(self):
+        self.tmdb_client.store.replace([dict(MOVIE, poster_url=None), dict(MOVIE, id=1, vote_count=10)])
+
+        movies = await self.tmdb_client.get_movies(1, 5.0, 1000.0)
+        self.assertEqual([movie['id'] for movie in movies], [MOVIE['id']])
+        self.assertEqual(self.requests, [])
+
+        # no match in the snapshot, TMDB is asked
+        await self.tmdb_client.get_movies(2, 5.0, 1000.0)
+        self.assertEqual(self.requests[0].url.path, '/3/discover/movie')
+
+    async def test_snapshot_details_when_tmdb_is_down(self):
+        self.tmdb_client.store.replace([MOVIE])
+        self.down = True
+
+        movie = await self.tmdb_client.get_random_movie(1, 1, 5.0, 1000.0)
+
+        self.assertEqual(movie['title'], MOVIE['title'])
+        with self.assertRaises(httpx.ConnectError):
+            await self.tmdb_client.get_movie_details(1)
+
+    async def test_offline(self):
+        store = MovieStore()
+        self.tmdb_client = TmdbClient('key', IMAGES_CONFIG, self.tmdb_client.http_client, store=store, offline=True)
+        # the snapshot is loaded on startup, after the client was created
+        store.replace([{key: value for key, value in MOVIE.items() if key != 'poster_url'}])
+
+        movie = await self.tmdb_client.get_random_movie(1, 3, 5.0, 1000.0)
+
+        self.assertEqual(movie['poster_url'], f'https://image.tmdb.org/t/p/original{MOVIE["poster_path"]}')
+        self.assertEqual(await self.tmdb_client.get_movies(2, 5.0, 1000.0), [])
+        self.assertIsNone(await self.tmdb_client.get_random_movie(1, 3, 9.0, 1000.0))
+        with self.assertRaises(KeyError):
+            await self.tmdb_client.get_movie_details(1)
+        self.assertEqual(self.requests, [])
+
+    async def test_get_movie_changes(self):
+        movie_ids = await self.tmdb_client.get_movie_changes(date(2024, 5, 1), date(2024, 5, 3))
+
+        self.assertEqual(movie_ids, [1, 2])
+        self.assertEqual(self.requests[0].url.params['start_date'], '2024-05-01')
+
+    async def test_refresh_images_config(self):
+        self.tmdb_client.tmdb_images_config = DEFAULT_TMDB_IMAGES_CONFIG
+
+        await self.tmdb_client.refresh_images_config()
+
+        self.assertEqual(self.tmdb_client.tmdb_images_config, IMAGES_CONFIG)
+        self.assertEqual(self.requests[0].url.path, '/3/configuration')
+
+
+class TestImagesConfigCache(unittest.TestCase):
+
+    def test_fallback_and_disk_cache(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            settings = Settings(
+                tmdb_api_key='key',
+                groq_api_key='key',
+                qwen_api_key='key',
+                gcp_project_id='project',
+                gcp_location='location',
+                gcp_service_account_file='file',
+                tmdb_images_config_path=str(Path(tmp_dir) / 'config' / 'images.json')
+            )
+
+            self.assertEqual(load_tmdb_images_config(settings), DEFAULT_TMDB_IMAGES_CONFIG)
+
+            save_tmdb_images_config(settings, IMAGES_CONFIG)
+            self.assertEqual(load_tmdb_images_config(settings), IMAGES_CONFIG)
+
+            Path(settings.tmdb_images_config_path).write_text('{')
+            self.assertEqual(load_tmdb_images_config(settings), DEFAULT_TMDB_IMAGES_CONFIG)
+
+
+if __name__ == '__main__':
+    unittest.main()
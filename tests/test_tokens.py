@@ -0,0 +1,28 @@
+import unittest
+
+from api.tokens import ELLIPSIS, estimate_tokens, trim_to_tokens
+
+
+class TestTokens(unittest.TestCase):
+
+    def test_estimate_tokens(self):
+        self.assertEqual(estimate_tokens(''), 0)
+        self.assertEqual(estimate_tokens('正义联盟'), 4)
+        self.assertEqual(estimate_tokens('Justice League'), 4)
+        self.assertEqual(estimate_tokens('正义联盟: Justice League'), 8)
+
+    def test_trim_to_tokens(self):
+        text = '超级英雄联手拯救世界' * 20
+
+        self.assertEqual(trim_to_tokens(text, 1000), text)
+        self.assertEqual(trim_to_tokens(text, 0), '')
+
+        trimmed = trim_to_tokens(text, 50)
+        self.assertTrue(trimmed.endswith(ELLIPSIS))
+        self.assertTrue(text.startswith(trimmed[:-1]))
+        self.assertLessEqual(estimate_tokens(trimmed), 50)
+        self.assertGreater(estimate_tokens(trimmed), 45)
+
+
+if __name__ == '__main__':
+    unittest.main()